@@ -1,33 +1,150 @@
-import os, hashlib, hmac, urllib.parse
-from typing import Optional
+# auth.py
+# Проверка initData Telegram WebApp.
+#
+# Ключ подписи выводится из токена бота один раз (configure() при
+# импорте), а не на каждый запрос. Проверенные initData кладутся в
+# ограниченный LRU-кэш по их hash: повторные запросы лобби и
+# переподключения одного клиента не пересчитывают HMAC. Запись живёт не
+# дольше AUTH_CACHE_TTL и не дольше срока самого initData (auth_date +
+# AUTH_MAX_AGE); неуспешные проверки не кэшируются.
+#
+# Проверка возвращает личность из поля user (TelegramUser), и
+# обработчики берут user_id из неё, а не из параметров запроса.
+
+import hashlib
+import hmac
+import json
+import os
+import time
+import urllib.parse
+from collections import OrderedDict
+from typing import Optional, Tuple
+
 from fastapi import Header, HTTPException
 
+from metrics import Counter, Histogram, timed
+
+# Сколько секунд initData действителен после auth_date (0 — бессрочно)
+AUTH_MAX_AGE = int(os.getenv("AUTH_MAX_AGE", 86400))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 3600))
+
+AUTH_SECONDS = Histogram("poker_auth_seconds", "Telegram initData signature check")
+AUTH_CACHE = Counter("poker_auth_cache", "initData validations by cache result", label="result")
+
+class TelegramUser:
+    """Пользователь из проверенного initData."""
+    __slots__ = ("user_id", "username", "auth_date")
+
+    def __init__(self, user_id: str, username: Optional[str], auth_date: int):
+        self.user_id = user_id
+        self.username = username
+        self.auth_date = auth_date
+
+
+_secret_key: Optional[bytes] = None
+# hash -> (initData целиком, пользователь, когда запись истекает)
+_cache: OrderedDict[str, Tuple[str, TelegramUser, float]] = OrderedDict()
+
+
+def configure(token: Optional[str] = None):
+    """Выводит ключ подписи из токена бота (по умолчанию — из окружения) и чистит кэш."""
+    global _secret_key
+    token = token or os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("BOT_TOKEN")
+    _secret_key = hashlib.sha256(token.encode()).digest() if token else None
+    _cache.clear()
 
-def validate_telegram_init_data(init_data: str) -> bool:
-    """Validate Telegram WebApp initData signature."""
-    token = os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("BOT_TOKEN")
-    if not token or not init_data:
-        return False
+
+def _hash_param(init_data: str) -> Optional[str]:
+    """Значение hash из initData без разбора всей строки (ключ кэша)."""
+    s = "&" + init_data
+    i = s.rfind("&hash=")
+    if i < 0:
+        return None
+    end = s.find("&", i + 6)
+    return s[i + 6:end] if end >= 0 else s[i + 6:]
+
+
+def _verify(init_data: str, now: float) -> Optional[TelegramUser]:
+    """Полная проверка подписи и срока; личность или None."""
     pairs = urllib.parse.parse_qsl(init_data, keep_blank_values=True)
     hash_received = ""
     data = []
+    fields = {}
     for k, v in pairs:
         if k == "hash":
             hash_received = v
         else:
             data.append(f"{k}={v}")
+            fields[k] = v
     if not hash_received:
-        return False
+        return None
     data.sort()
     data_check_string = "\n".join(data)
-    secret_key = hashlib.sha256(token.encode()).digest()
     calculated = hmac.new(
-        secret_key, data_check_string.encode(), hashlib.sha256
+        _secret_key, data_check_string.encode(), hashlib.sha256
     ).hexdigest()
-    return hmac.compare_digest(calculated, hash_received)
+    if not hmac.compare_digest(calculated.encode(), hash_received.encode()):
+        return None
+    try:
+        auth_date = int(fields.get("auth_date", 0))
+        user = json.loads(fields["user"])
+        user_id = str(user["id"])
+    except (KeyError, ValueError, TypeError):
+        return None
+    if AUTH_MAX_AGE and now - auth_date > AUTH_MAX_AGE:
+        return None
+    return TelegramUser(user_id, user.get("username"), auth_date)
+
+
+@timed(AUTH_SECONDS)
+def validate_telegram_init_data(init_data: str) -> Optional[TelegramUser]:
+    """Validate Telegram WebApp initData signature; returns the user or None."""
+    if _secret_key is None or not init_data:
+        return None
+    key = _hash_param(init_data)
+    if not key:
+        return None
+    now = time.time()
+    hit = _cache.get(key)
+    if hit is not None:
+        # Совпасть должен весь initData, а не только hash
+        if hit[0] == init_data and now < hit[2]:
+            _cache.move_to_end(key)
+            AUTH_CACHE.labels("hit").inc()
+            return hit[1]
+        del _cache[key]
+    AUTH_CACHE.labels("miss").inc()
+    user = _verify(init_data, now)
+    if user is not None:
+        expires = now + AUTH_CACHE_TTL
+        if AUTH_MAX_AGE:
+            expires = min(expires, user.auth_date + AUTH_MAX_AGE)
+        _cache[key] = (init_data, user, expires)
+        if len(_cache) > AUTH_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return user
 
 
-def require_auth(authorization: Optional[str] = Header(None, alias="Authorization")):
-    # если заголовок пришёл — проверяем подпись, иначе пропускаем
-    if authorization is not None and not validate_telegram_init_data(authorization):
+def require_admin(x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    # Без ADMIN_TOKEN админских эндпоинтов как будто нет
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(404, "Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), token.encode()):
+        raise HTTPException(403, "Forbidden")
+
+
+async def require_auth(
+    authorization: Optional[str] = Header(None, alias="Authorization"),
+) -> TelegramUser:
+    # async: проверка идёт в event loop, без пула потоков, и кэш не
+    # делится между потоками.
+    # Без подписи — 401: от чьего имени запрос, знает только initData
+    user = validate_telegram_init_data(authorization) if authorization else None
+    if user is None:
         raise HTTPException(401, "Unauthorized")
+    return user
+
+
+configure()
@@ -0,0 +1,292 @@
+# balance_cache.py
+# Кэш балансов в памяти с отложенной записью в БД.
+#
+# Чтения обслуживаются из памяти (промах — один bulk-запрос в БД).
+# Записи сразу попадают в память и в журнал (append-only файл; всё за
+# итерацию event loop — одной записью в файл), а в БД
+# уходят групповым коммитом раз в BALANCE_FLUSH_INTERVAL секунд — по
+# всем столам сразу.
+#
+# В БД пишутся не абсолютные значения, а приращения относительно того,
+# что этот кэш знал об игроке (balance = balance + d): игрок может
+# сидеть за столами разных шардов, и сбросы их кэшей складываются, а не
+# затирают друг друга. Абсолютное значение пишется только явно
+# (assign — депозит при посадке) или для игрока, которого кэш ещё не
+# загружал. Актуальный баланс для показа (current) при нескольких
+# шардах читается из БД с поправкой на ещё не сброшенное.
+#
+# Каждая запись журнала помечена seq, а сброс в той же транзакции
+# записывает в БД свой последний seq (balance_flushes). На старте
+# recover() применяет только записи с seq больше записанного: повтор
+# после падения посреди сброса ничего не применит дважды.
+
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from db_utils import apply_balance_changes_async, get_balances_async, get_flush_seq_async
+from sharding import SHARD_COUNT, SHARD_INDEX, local_path
+
+BALANCE_FLUSH_INTERVAL = float(os.getenv("BALANCE_FLUSH_INTERVAL", 0.5))
+BALANCE_JOURNAL = local_path(os.getenv("BALANCE_JOURNAL", "balance_journal.log"))
+# Журнал переписывается (компактируется), когда вырастает больше этого
+BALANCE_JOURNAL_MAX_BYTES = int(os.getenv("BALANCE_JOURNAL_MAX_BYTES", 4 * 1024 * 1024))
+
+log = logging.getLogger(__name__)
+
+# (seq, присваивания, приращения)
+Changes = Tuple[int, Dict[str, int], Dict[str, int]]
+
+
+def merge_changes(assign: Dict[str, int], deltas: Dict[str, int],
+                  new_assign: Dict[str, int], new_deltas: Dict[str, int]):
+    """Добавляет более поздние изменения к накопленным (присваивание сбрасывает приращения)."""
+    for u, bal in new_assign.items():
+        assign[u] = bal
+        deltas.pop(u, None)
+    for u, d in new_deltas.items():
+        deltas[u] = deltas.get(u, 0) + d
+
+
+def read_journal(path: str) -> List[Changes]:
+    """Записи журнала по порядку; оборванная последняя строка пропускается."""
+    out: List[Changes] = []
+    if not path or not os.path.exists(path):
+        return out
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                seq, assign, deltas = json.loads(line)
+            except ValueError:
+                break
+            out.append((seq, assign, deltas))
+    return out
+
+
+def _journal_line(seq: int, assign: Dict[str, int], deltas: Dict[str, int]) -> bytes:
+    return json.dumps([seq, assign, deltas]).encode() + b"\n"
+
+
+class BalanceCache:
+    def __init__(
+        self,
+        journal_path: Optional[str] = BALANCE_JOURNAL,
+        interval: float = BALANCE_FLUSH_INTERVAL,
+        writer: str = f"shard-{SHARD_INDEX}",
+        shared: bool = SHARD_COUNT > 1,
+        load: Callable[[Iterable[str]], Awaitable[Dict[str, int]]] = get_balances_async,
+        save: Callable[..., Awaitable[Dict[str, int]]] = apply_balance_changes_async,
+        load_seq: Callable[[str], Awaitable[int]] = get_flush_seq_async,
+    ):
+        self.journal_path = journal_path
+        self.interval = interval
+        # Имя писателя в balance_flushes: у каждого шарда свой журнал и свой seq
+        self.writer = writer
+        # Балансы меняют и другие процессы: current() читает БД
+        self.shared = shared
+        self.load = load
+        self.save = save
+        self.load_seq = load_seq
+        # Баланс, каким его видит этот процесс (от него считаются приращения)
+        self._balances: Dict[str, int] = {}
+        # Ещё не сброшенные изменения и сброс, который сейчас в БД
+        self._assign: Dict[str, int] = {}
+        self._deltas: Dict[str, int] = {}
+        self._inflight: Optional[Changes] = None
+        self._seq = 0
+        self._journal = None
+        # Строки журнала, ещё не записанные в файл: пишутся одним вызовом
+        # на итерацию event loop, а не на каждую раздачу
+        self._journal_buf = bytearray()
+        self._journal_write_scheduled = False
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._assign or self._deltas or self._inflight)
+
+    # ---------- Жизненный цикл ----------
+    async def start(self):
+        """Догоняет журнал после падения и запускает фоновый сброс."""
+        await self.recover()
+        if self.journal_path:
+            self._journal = open(self.journal_path, "ab")
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            while self.dirty:
+                await self.flush()
+        except Exception:
+            # Не сброшенное останется в журнале и догонится на старте
+            log.exception("final balance flush failed")
+        if self._journal:
+            self._write_journal()
+            self._journal.close()
+            self._journal = None
+
+    async def recover(self):
+        """Применяет записи журнала, которых ещё нет в БД, и очищает журнал."""
+        applied = await self.load_seq(self.writer)
+        self._seq = applied
+        assign: Dict[str, int] = {}
+        deltas: Dict[str, int] = {}
+        for seq, a, d in read_journal(self.journal_path):
+            self._seq = max(self._seq, seq)
+            if seq > applied:
+                merge_changes(assign, deltas, a, d)
+        if assign or deltas:
+            log.warning("replaying %d balances from %s (after seq %d)",
+                        len(set(assign) | set(deltas)), self.journal_path, applied)
+            await self.save(self.writer, self._seq, assign, deltas)
+        if self.journal_path and os.path.exists(self.journal_path):
+            os.truncate(self.journal_path, 0)
+
+    # ---------- Чтение ----------
+    async def get_many(self, user_ids: Iterable[str]) -> Dict[str, int]:
+        user_ids = list(user_ids)
+        missing = [u for u in user_ids if u not in self._balances]
+        if missing:
+            loaded = await self.load(missing)
+            for u, bal in loaded.items():
+                # Пока грузили, значение могло быть записано — оно новее
+                self._balances.setdefault(u, bal)
+        return {u: self._balances[u] for u in user_ids}
+
+    async def get(self, user_id: str) -> int:
+        return (await self.get_many([user_id]))[user_id]
+
+    async def current(self, user_id: str) -> int:
+        """
+        Баланс для показа. Один процесс — значение из памяти; при
+        нескольких шардах — из БД плюс то, что этот кэш ещё не сбросил.
+        Собственное представление кэша при этом не меняется: от него
+        считаются приращения идущих здесь раздач.
+        """
+        if not self.shared:
+            return await self.get(user_id)
+        async with self._flush_lock:
+            assign: Dict[str, int] = {}
+            deltas: Dict[str, int] = {}
+            if self._inflight is not None:
+                merge_changes(assign, deltas, self._inflight[1], self._inflight[2])
+            merge_changes(assign, deltas, self._assign, self._deltas)
+            if user_id in assign:
+                return assign[user_id] + deltas.get(user_id, 0)
+            stored = (await self.load([user_id]))[user_id]
+            return stored + deltas.get(user_id, 0)
+
+    # ---------- Запись ----------
+    def set_many(self, stacks: Dict[str, int]):
+        """
+        Новые балансы игроков (итог раздачи, уход со стола): в память и
+        журнал, в БД — приращением при ближайшем сбросе.
+        """
+        assign: Dict[str, int] = {}
+        deltas: Dict[str, int] = {}
+        for u, bal in stacks.items():
+            old = self._balances.get(u)
+            if old is None:
+                # От чего считать приращение, неизвестно — пишем значение
+                assign[u] = bal
+            elif bal != old:
+                deltas[u] = bal - old
+            self._balances[u] = bal
+        self._record(assign, deltas)
+
+    def set(self, user_id: str, balance: int):
+        self.set_many({user_id: balance})
+
+    def assign(self, user_id: str, balance: int):
+        """Баланс становится ровно balance (депозит при посадке), что бы ни было в БД."""
+        self._balances[user_id] = balance
+        self._record({user_id: balance}, {})
+
+    def _record(self, assign: Dict[str, int], deltas: Dict[str, int]):
+        if not assign and not deltas:
+            return
+        self._seq += 1
+        if self._journal:
+            self._journal_buf += _journal_line(self._seq, assign, deltas)
+            if not self._journal_write_scheduled:
+                self._journal_write_scheduled = True
+                asyncio.get_running_loop().call_soon(self._write_journal)
+        merge_changes(self._assign, self._deltas, assign, deltas)
+
+    def _write_journal(self):
+        """Все строки, накопленные за итерацию loop, — одной записью в файл."""
+        self._journal_write_scheduled = False
+        if self._journal and self._journal_buf:
+            self._journal.write(self._journal_buf)
+            self._journal.flush()
+        self._journal_buf.clear()
+
+    # ---------- Сброс в БД ----------
+    async def flush(self):
+        """Один групповой коммит всех накопленных изменений."""
+        async with self._flush_lock:
+            if self._inflight is None:
+                if not (self._assign or self._deltas):
+                    return
+                # Неудавшийся сброс повторяется с тем же seq: БД пропустит
+                # его, если он на самом деле успел закоммититься
+                self._inflight = (self._seq, self._assign, self._deltas)
+                self._assign, self._deltas = {}, {}
+            seq, assign, deltas = self._inflight
+            if self._journal:
+                self._write_journal()
+                await asyncio.to_thread(os.fsync, self._journal.fileno())
+            await self.save(self.writer, seq, assign, deltas)
+            self._inflight = None
+            self.flushes += 1
+            self._compact_journal()
+
+    def _compact_journal(self):
+        # Выполняется без await между проверкой и перезаписью, так что
+        # новые записи не могут потеряться.
+        if not self._journal:
+            return
+        pending = self._assign or self._deltas
+        if pending and self._journal.tell() + len(self._journal_buf) < BALANCE_JOURNAL_MAX_BYTES:
+            return
+        # Всё несброшенное — в самих _assign/_deltas, буфер дублирует их
+        self._journal_buf.clear()
+        if not pending and self._inflight is None:
+            self._journal.truncate(0)
+            self._journal.seek(0)
+            return
+        tmp = self.journal_path + ".tmp"
+        with open(tmp, "wb") as f:
+            if self._inflight is not None:
+                f.write(_journal_line(*self._inflight))
+            if pending:
+                f.write(_journal_line(self._seq, self._assign, self._deltas))
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal.close()
+        os.replace(tmp, self.journal_path)
+        self._journal = open(self.journal_path, "ab")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                # БД недоступна — изменения остаются в памяти и журнале
+                log.exception("balance flush failed")
+
+
+# Общий кэш процесса
+balances = BalanceCache()
@@ -0,0 +1,9 @@
+# bench/__init__.py
+# Бенчмарки движка и рассылки состояния.
+#
+#   python -m bench run [--out results.json] [--filter evaluate]
+#   python -m bench load --tables 50 --duration 30
+#   python -m bench compare old.json new.json [--threshold 10]
+#
+# Все обращения к БД подменяются хранилищем в памяти (bench.stubs),
+# поэтому для запуска не нужен ни Postgres, ни сеть.
@@ -0,0 +1,58 @@
+# bench/__main__.py
+import argparse
+import sys
+
+from bench import cases  # noqa: F401  (регистрирует бенчмарки)
+from bench.harness import compare, run_all, save
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    run = sub.add_parser("run", help="запустить бенчмарки")
+    run.add_argument("--out", default="bench_results.json")
+    run.add_argument("--filter", default="", help="подстрока имени бенчмарка")
+
+    sub.add_parser("memory", help="память на стол и выделения на ход (tracemalloc)")
+
+    load = sub.add_parser("load", help="нагрузочный тест по WebSocket (столы × 6 ботов)")
+    load.add_argument("--tables", type=int, default=10)
+    load.add_argument("--duration", type=float, default=30.0, help="длительность замера, с")
+    load.add_argument("--warmup", type=float, default=3.0, help="прогрев до замера, с")
+    load.add_argument("--delay", type=float, default=0.1,
+                      help="средняя пауза бота перед ходом, с (задаёт темп действий)")
+    load.add_argument("--spectators", type=int, default=0,
+                      help="зрителей на стол (/ws/watch)")
+    load.add_argument("--spectator-rate", type=float, default=None,
+                      help="WS_SPECTATOR_RATE своего сервера, обновлений/с")
+    load.add_argument("--workers", type=int, default=1,
+                      help="процессов-шардов сервера (sharding.py)")
+    load.add_argument("--url", help="уже запущенный сервер вместо своего")
+    load.add_argument("--token", help="токен бота этого сервера (с --url)")
+    load.add_argument("--out", help="сохранить отчёт в JSON")
+
+    cmp_ = sub.add_parser("compare", help="сравнить два прогона")
+    cmp_.add_argument("old")
+    cmp_.add_argument("new")
+    cmp_.add_argument("--threshold", type=float, default=10.0,
+                      help="допустимый рост p50, %%")
+
+    args = parser.parse_args(argv)
+    if args.cmd == "run":
+        data = run_all(args.filter)
+        save(data, args.out)
+        print(f"saved to {args.out}")
+        return 0
+    if args.cmd == "memory":
+        from bench import memory
+        memory.measure()
+        return 0
+    if args.cmd == "load":
+        from bench import load
+        return load.main(args)
+    return compare(args.old, args.new, args.threshold)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+# bench/cases.py
+# Набор бенчмарков: колода, оценка рук, раздача, рассылка.
+
+import asyncio
+import atexit
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import auth
+import game_engine
+import game_ws
+from cards import FULL_DECK
+from bench.harness import benchmark
+from bench.load import init_data
+from balance_cache import balances
+from hand_eval import evaluate_many
+from hand_log import hand_log, read_events, replay, segments
+from metrics import Histogram
+from table_actor import run_in_table
+from timers import TimerScheduler
+from bench.stubs import DEFAULT_BALANCE, FakeWebSocket, install_memory_db, seat_players
+
+TABLE_ID = 9001
+SEED = 12345
+
+install_memory_db()
+rng = random.Random(SEED)
+
+_HANDS = [rng.sample(FULL_DECK, 7) for _ in range(1000)]
+_hand_idx = 0
+
+
+def _next_hand():
+    global _hand_idx
+    _hand_idx = (_hand_idx + 1) % len(_HANDS)
+    return _HANDS[_hand_idx]
+
+
+@benchmark("new_deck", iterations=20000)
+def bench_new_deck(_):
+    game_engine.new_deck()
+
+
+@benchmark("evaluate_hand", setup=_next_hand, iterations=20000)
+def bench_evaluate_hand(cards):
+    game_engine.evaluate_hand(cards)
+
+
+@benchmark("hand_strength", setup=_next_hand, iterations=20000)
+def bench_hand_strength(cards):
+    game_engine.hand_strength(cards)
+
+
+_BATCH = np.array([rng.sample(FULL_DECK, 7) for _ in range(100_000)], dtype=np.int8)
+
+
+@benchmark("evaluate_many_100k", ops_per_call=len(_BATCH), iterations=20, warmup=2)
+def bench_evaluate_many(_):
+    evaluate_many(_BATCH)
+
+
+def _fresh_table():
+    # Каждый замер — с одинаковой колодой и полными стеками
+    random.seed(SEED)
+    uids = seat_players(TABLE_ID, 6)
+    balances.set_many({u: DEFAULT_BALANCE for u in uids})
+    return TABLE_ID
+
+
+@benchmark("start_hand_6max", setup=_fresh_table, iterations=5000)
+async def bench_start_hand(table_id):
+    await game_engine.start_hand(table_id)
+
+
+async def _play_to_showdown(table_id):
+    """Все коллируют/чекают до вскрытия: 4 улицы × 6 игроков."""
+    state = game_engine.game_states[table_id]
+    for _ in range(100):
+        if state.phase == "result":
+            return
+        uid = state.current_player
+        need = state.current_bet - state.contributions[state.current_seat]
+        await game_engine.apply_action(table_id, uid, "call" if need > 0 else "check")
+    raise RuntimeError("hand did not finish")
+
+
+async def _started_table():
+    table_id = _fresh_table()
+    await game_engine.start_hand(table_id)
+    return table_id
+
+
+@benchmark("apply_action_full_hand_6max", setup=_started_table, iterations=2000)
+async def bench_full_hand(table_id):
+    await _play_to_showdown(table_id)
+
+
+@benchmark("apply_action_full_hand_6max_via_actor", setup=_started_table, iterations=2000)
+async def bench_full_hand_actor(table_id):
+    # Те же ходы, но каждый — командой в очередь актора стола
+    state = game_engine.game_states[table_id]
+    for _ in range(100):
+        if state.phase == "result":
+            return
+        uid = state.current_player
+        need = state.current_bet - state.contributions[state.current_seat]
+        await run_in_table(table_id, "action", game_engine.apply_action,
+                           table_id, uid, "call" if need > 0 else "check")
+    raise RuntimeError("hand did not finish")
+
+
+async def _broadcast_table():
+    table_id = await _started_table()
+    game_ws.table_views.pop(table_id, None)
+    for conn in game_engine.connections.get(table_id, []):
+        await conn.stop()
+    conns = []
+    for uid in game_engine.game_states[table_id].players():
+        conn = game_ws.Connection(FakeWebSocket(), uid, table_id)
+        conn.start()
+        conns.append(conn)
+    game_engine.connections[table_id] = conns
+    return table_id
+
+
+async def _broadcast_delivered(table_id):
+    """Рассылка плюс фактическая отправка всеми писателями."""
+    await game_ws.broadcast(table_id)
+    for conn in game_engine.connections[table_id]:
+        await conn.drained()
+
+
+@benchmark("broadcast_6max_snapshot", setup=_broadcast_table, iterations=5000)
+async def bench_broadcast(table_id):
+    await _broadcast_delivered(table_id)
+
+
+async def _after_one_action():
+    """Все уже получили снапшот, затем один игрок сделал ход."""
+    table_id = await _broadcast_table()
+    await _broadcast_delivered(table_id)
+    state = game_engine.game_states[table_id]
+    await game_engine.apply_action(table_id, state.current_player, "call")
+    return table_id
+
+
+@benchmark("broadcast_6max_patch", setup=_after_one_action, iterations=5000)
+async def bench_broadcast_patch(table_id):
+    await _broadcast_delivered(table_id)
+
+
+@benchmark("broadcast_6max_patch_enqueue", setup=_after_one_action, iterations=5000)
+async def bench_broadcast_patch_enqueue(table_id):
+    await game_ws.broadcast(table_id)
+
+
+async def _result_table():
+    table_id = await _broadcast_table()
+    await _play_to_showdown(table_id)
+    return table_id
+
+
+@benchmark("broadcast_6max_showdown", setup=_result_table, iterations=2000)
+async def bench_broadcast_showdown(table_id):
+    await _broadcast_delivered(table_id)
+
+
+async def _coalesced_burst(table_id):
+    """Пять изменений подряд в одном окне -> одна рассылка."""
+    for _ in range(5):
+        game_ws.schedule_broadcast(table_id)
+    while table_id in game_ws._pending_broadcasts:
+        await asyncio.sleep(0)
+    for conn in game_engine.connections[table_id]:
+        await conn.drained()
+
+
+@benchmark("broadcast_6max_burst_coalesced", setup=_after_one_action, iterations=2000)
+async def bench_broadcast_burst(table_id):
+    # Само окно ожидания не меряем — только накладные расходы склейки
+    window, game_ws.BROADCAST_WINDOW = game_ws.BROADCAST_WINDOW, 0.0
+    try:
+        await _coalesced_burst(table_id)
+    finally:
+        game_ws.BROADCAST_WINDOW = window
+
+
+TIMER_TABLES = 10_000
+
+
+async def _armed_scheduler():
+    sched = TimerScheduler()
+    far = time.time() + 3600
+    for t in range(TIMER_TABLES):
+        sched.schedule((t, "decision"), far, _noop)
+    return sched
+
+
+async def _noop():
+    pass
+
+
+@benchmark("timers_reschedule_10k_tables", setup=_armed_scheduler,
+           ops_per_call=TIMER_TABLES, iterations=50, warmup=5)
+async def bench_timers_reschedule(sched):
+    # Каждый стол сделал ход — дедлайн переносится
+    far = time.time() + 3600
+    for t in range(TIMER_TABLES):
+        sched.schedule((t, "decision"), far + t, _noop)
+    await sched.close()
+
+
+REPLAY_HANDS = 100
+_replay_dir = None
+
+
+async def _hand_log_dir():
+    """Один раз пишет журнал из REPLAY_HANDS раздач во временный каталог."""
+    global _replay_dir
+    if _replay_dir is None:
+        _replay_dir = tempfile.mkdtemp(prefix="bench_hand_log_")
+        atexit.register(shutil.rmtree, _replay_dir, True)
+        hand_log.directory = _replay_dir
+        await hand_log.start()
+        for _ in range(REPLAY_HANDS):
+            table_id = await _started_table()
+            await _play_to_showdown(table_id)
+        await hand_log.close()
+    return _replay_dir
+
+
+@benchmark("hand_log_replay_100_hands", setup=_hand_log_dir,
+           ops_per_call=REPLAY_HANDS, iterations=50, warmup=3)
+async def bench_hand_log_replay(directory):
+    await replay(TABLE_ID, read_events(segments(directory), TABLE_ID))
+
+
+_hist = Histogram("bench_observe_seconds", "bench", register=False)
+
+
+@benchmark("metrics_histogram_observe", ops_per_call=1000, iterations=2000)
+def bench_histogram_observe(_):
+    # Цена записи одной метрики на горячем пути
+    observe = _hist.observe
+    for i in range(1000):
+        observe(i * 1e-6)
+
+
+# ---------- Проверка initData: шторм переподключений ----------
+STORM_USERS = 1000
+STORM_ROUNDS = 10
+
+
+def _storm_init_data():
+    """initData STORM_USERS игроков; каждый переподключается STORM_ROUNDS раз."""
+    auth.configure("bench-token")
+    datas = [init_data("bench-token", str(700000 + i)) for i in range(STORM_USERS)]
+    return datas * STORM_ROUNDS
+
+
+@benchmark("auth_reconnect_storm_uncached", setup=_storm_init_data,
+           ops_per_call=STORM_USERS * STORM_ROUNDS, iterations=10, warmup=1)
+def bench_auth_storm_uncached(datas):
+    now = time.time()
+    for d in datas:
+        auth._verify(d, now)
+
+
+@benchmark("auth_reconnect_storm_cached", setup=_storm_init_data,
+           ops_per_call=STORM_USERS * STORM_ROUNDS, iterations=10, warmup=1)
+def bench_auth_storm_cached(datas):
+    validate = auth.validate_telegram_init_data
+    for d in datas:
+        validate(d)
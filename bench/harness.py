@@ -0,0 +1,146 @@
+# bench/harness.py
+# Регистрация бенчмарков, замеры и сохранение/сравнение результатов.
+
+import asyncio
+import json
+import platform
+import subprocess
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+BENCHMARKS: Dict[str, "Benchmark"] = {}
+
+
+@dataclass
+class Benchmark:
+    name: str
+    func: Callable
+    setup: Optional[Callable]
+    ops_per_call: int
+    iterations: int
+    warmup: int
+
+
+def benchmark(name: str, setup: Optional[Callable] = None, ops_per_call: int = 1,
+              iterations: int = 2000, warmup: int = 100):
+    """
+    Регистрирует бенчмарк. setup() вызывается перед каждым замером и
+    возвращает аргумент для func; его время в замер не входит.
+    func может быть корутиной — тогда все итерации идут в одном event loop.
+    ops_per_call — сколько операций делает один вызов (для ops/sec).
+    """
+    def deco(func):
+        BENCHMARKS[name] = Benchmark(name, func, setup, ops_per_call, iterations, warmup)
+        return func
+    return deco
+
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    idx = min(len(sorted_vals) - 1, int(round(q * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
+
+
+def _measure_sync(b: Benchmark, n: int) -> List[float]:
+    out = []
+    clock = time.perf_counter
+    for _ in range(n):
+        arg = b.setup() if b.setup else None
+        t0 = clock()
+        b.func(arg)
+        out.append(clock() - t0)
+    return out
+
+
+async def _measure_async(b: Benchmark, n: int) -> List[float]:
+    out = []
+    clock = time.perf_counter
+    setup_is_async = asyncio.iscoroutinefunction(b.setup)
+    for _ in range(n):
+        if setup_is_async:
+            arg = await b.setup()
+        else:
+            arg = b.setup() if b.setup else None
+        t0 = clock()
+        await b.func(arg)
+        out.append(clock() - t0)
+    return out
+
+
+def run_benchmark(b: Benchmark) -> dict:
+    if asyncio.iscoroutinefunction(b.func):
+        async def both():
+            await _measure_async(b, b.warmup)
+            return await _measure_async(b, b.iterations)
+        samples = asyncio.run(both())
+    else:
+        _measure_sync(b, b.warmup)
+        samples = _measure_sync(b, b.iterations)
+    samples.sort()
+    total = sum(samples)
+    return {
+        "iterations": len(samples),
+        "ops_per_sec": b.ops_per_call * len(samples) / total if total else 0.0,
+        "p50_us": _percentile(samples, 0.50) * 1e6,
+        "p99_us": _percentile(samples, 0.99) * 1e6,
+        "mean_us": total / len(samples) * 1e6,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(name_filter: str = "") -> dict:
+    results = {}
+    for name, b in BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+        r = run_benchmark(b)
+        results[name] = r
+        print(f"{name:32s} {r['ops_per_sec']:>14,.0f} ops/s   "
+              f"p50 {r['p50_us']:>10.1f} us   p99 {r['p99_us']:>10.1f} us")
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+
+
+def save(data: dict, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def compare(old_path: str, new_path: str, threshold: float) -> int:
+    """Печатает разницу двух прогонов; 1, если где-то p50 вырос больше threshold %."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"old: {old['meta'].get('commit')}   new: {new['meta'].get('commit')}")
+    regressions = 0
+    for name, n in new["results"].items():
+        o = old["results"].get(name)
+        if not o:
+            print(f"{name:32s} (new)")
+            continue
+        delta = (n["p50_us"] - o["p50_us"]) / o["p50_us"] * 100 if o["p50_us"] else 0.0
+        mark = ""
+        if delta > threshold:
+            mark = "  REGRESSION"
+            regressions += 1
+        print(f"{name:32s} p50 {o['p50_us']:>10.1f} -> {n['p50_us']:>10.1f} us "
+              f"({delta:+6.1f}%)   ops/s {o['ops_per_sec']:>12,.0f} -> "
+              f"{n['ops_per_sec']:>12,.0f}{mark}")
+    return 1 if regressions else 0
@@ -0,0 +1,427 @@
+# bench/load.py
+# Нагрузочный тест по WebSocket: N столов × 6 ботов против процесса
+# uvicorn (или нескольких шардов, --workers).
+#
+#   python -m bench load --tables 50 --duration 30 [--delay 0.1]
+#
+# Сервер запускается отдельным процессом с SQLite в памяти вместо
+# Postgres и сгенерированным токеном бота вместо настоящего: initData
+# ботов подписываются тем же токеном, как это делает Telegram. Журналы
+# (балансов, раздач) и снимки столов отключены, чтобы не мерить диск.
+# С --url тест идёт против уже запущенного сервера (токен — --token).
+#
+# Каждый бот садится через /api/join, открывает
+# /ws/game/{table_id}/{user_id}/{seat} и, когда его ход, через --delay
+# секунд делает случайное допустимое действие. С --spectators N к
+# каждому столу ещё подключаются N зрителей (/ws/watch/{table_id}),
+# которые только применяют патчи.
+#
+# С --workers N сервер — N процессов-шардов (sharding.py) с общим лобби
+# в SQLite-файле; столы создаются по очереди на каждом шарде, боты
+# ходят прямо на шард-владелец (url стола из ответа). CPU и память —
+# сумма по всем процессам. Задержка — от отправки
+# действия до первой рассылки, в которой ход сдвинулся (сменились
+# текущий игрок, улица, фаза, банк или ставка). CPU и память сервера
+# читаются из /proc (только Linux).
+
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+from typing import List, Optional, Tuple
+
+import httpx
+from websockets.asyncio.client import connect
+
+from bench.harness import _percentile
+
+LEVEL = "vip"
+DEPOSIT = 1000
+SEATS = 6
+# Поля состояния, изменение которых означает, что действие применено
+_TURN_FIELDS = ("current_player", "current_round", "phase", "pot", "current_bet")
+# Отклонённый ход сервер не подтверждает (состояние не меняется и
+# рассылки нет): если за столько секунд ход не сдвинулся, бот считает
+# действие отклонённым и ходит заново
+REJECT_AFTER = 2.0
+
+
+# ---------- Подпись initData ----------
+def init_data(token: str, uid: str) -> str:
+    """initData, подписанный как у Telegram WebApp (см. auth.validate_telegram_init_data)."""
+    fields = {
+        "auth_date": str(int(time.time())),
+        "user": json.dumps({"id": uid, "first_name": f"bot{uid}"}),
+    }
+    data_check = "\n".join(sorted(f"{k}={v}" for k, v in fields.items()))
+    secret = hashlib.sha256(token.encode()).digest()
+    fields["hash"] = hmac.new(secret, data_check.encode(), hashlib.sha256).hexdigest()
+    return urllib.parse.urlencode(fields)
+
+
+# ---------- CPU и память процесса ----------
+def proc_usage(pid: int) -> Tuple[Optional[float], Optional[int]]:
+    """(CPU-секунды user+system, RSS в байтах) из /proc; вне Linux — (None, None)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+    except OSError:
+        return None, None
+    ticks = os.sysconf("SC_CLK_TCK")
+    return (int(fields[11]) + int(fields[12])) / ticks, rss_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+# ---------- Бот ----------
+class Stats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.actions = 0
+        self.messages = 0
+        self.resyncs = 0
+        self.rejected = 0
+        self.errors = 0
+        self.spectator_messages = 0
+        self.spectator_bytes = 0
+        self.spectator_resyncs = 0
+        self.recording = False
+
+
+class Bot:
+    def __init__(self, base_ws: str, token: str, table_id: int, seat: int,
+                 delay: float, stats: Stats, rng: random.Random):
+        self.uid = f"{table_id}{seat:02d}"
+        self.url = (f"{base_ws}/ws/game/{table_id}/{self.uid}/{seat}"
+                    f"?initData={urllib.parse.quote(init_data(token, self.uid))}")
+        self.delay = delay
+        self.stats = stats
+        self.rng = rng
+        self.state: dict = {}
+        self.seq = -1
+        # Отправленное действие: (время отправки, поля хода до него)
+        self.pending: Optional[Tuple[float, tuple]] = None
+
+    def _turn(self) -> tuple:
+        return tuple(self.state.get(k) for k in _TURN_FIELDS)
+
+    def _choose(self) -> dict:
+        s = self.state
+        need = s["current_bet"] - s["contributions"].get(self.uid, 0)
+        stack = s["stacks"].get(self.uid, 0)
+        roll = self.rng.random()
+        if roll < 0.1 and need > 0:
+            return {"action": "fold"}
+        if roll < 0.2:
+            amount = max(s["current_bet"] * 2, 2)
+            if stack >= amount - s["contributions"].get(self.uid, 0):
+                return {"action": "raise" if s["current_bet"] else "bet", "amount": amount}
+        return {"action": "call" if need > 0 else "check"}
+
+    def _apply(self, msg: dict) -> bool:
+        """Применяет снапшот/патч; False — пропущен seq, нужен resync."""
+        if msg["type"] == "snapshot":
+            self.state = msg["state"]
+        elif msg["type"] != "patch":
+            return True
+        elif msg["seq"] == self.seq + 1:
+            self.state.update(msg["set"])
+        else:
+            return False
+        self.seq = msg["seq"]
+        return True
+
+    async def run(self, ready: asyncio.Event, stop: asyncio.Event):
+        async with connect(self.url, max_size=None) as ws:
+            ready.set()
+            acting: Optional[asyncio.Task] = None
+            recv = asyncio.ensure_future(ws.recv())
+            halt = asyncio.ensure_future(stop.wait())
+            try:
+                while True:
+                    # Ждём и отправки своего хода, чтобы отсчитать REJECT_AFTER от неё
+                    waits = {recv, halt}
+                    if acting is not None and not acting.done():
+                        waits.add(acting)
+                    timeout = None
+                    if self.pending:
+                        timeout = max(0.0, self.pending[0] + REJECT_AFTER - time.perf_counter())
+                    done, _ = await asyncio.wait(waits, timeout=timeout,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    if halt in done:
+                        return
+                    if recv in done:
+                        raw = recv.result()
+                        now = time.perf_counter()
+                        recv = asyncio.ensure_future(ws.recv())
+                        self.stats.messages += 1
+                        if not self._apply(json.loads(raw)):
+                            self.stats.resyncs += 1
+                            await ws.send(json.dumps({"type": "resync"}))
+                            continue
+                        if self.pending and self._turn() != self.pending[1]:
+                            if self.stats.recording:
+                                self.stats.latencies.append(now - self.pending[0])
+                            self.pending = None
+                    elif not done and self.pending:
+                        # Ход так и не сдвинулся — действие отклонено
+                        self.stats.rejected += 1
+                        self.pending = None
+                    if (self.pending is None and (acting is None or acting.done())
+                            and self.state.get("phase") == "pre-flop"
+                            and self.state.get("current_player") == self.uid):
+                        acting = asyncio.create_task(self._act(ws))
+            finally:
+                recv.cancel()
+                halt.cancel()
+                if acting:
+                    acting.cancel()
+
+    async def _act(self, ws):
+        await asyncio.sleep(self.delay * self.rng.uniform(0.5, 1.5))
+        msg = {"user_id": self.uid, **self._choose()}
+        self.pending = (time.perf_counter(), self._turn())
+        await ws.send(json.dumps(msg))
+        self.stats.actions += 1
+
+
+class Spectator:
+    """Зритель стола: держит состояние по снапшотам и патчам, ничего не шлёт."""
+
+    def __init__(self, base_ws: str, token: str, table_id: int, n: int, stats: Stats):
+        uid = f"9{table_id}{n:05d}"
+        self.url = (f"{base_ws}/ws/watch/{table_id}"
+                    f"?initData={urllib.parse.quote(init_data(token, uid))}")
+        self.stats = stats
+        self.state: dict = {}
+        self.seq = -1
+
+    async def run(self, ready: asyncio.Event, stop: asyncio.Event):
+        async with connect(self.url, max_size=None) as ws:
+            ready.set()
+            recv = asyncio.ensure_future(ws.recv())
+            halt = asyncio.ensure_future(stop.wait())
+            try:
+                while True:
+                    done, _ = await asyncio.wait({recv, halt}, return_when=asyncio.FIRST_COMPLETED)
+                    if halt in done:
+                        return
+                    raw = recv.result()
+                    recv = asyncio.ensure_future(ws.recv())
+                    if self.stats.recording:
+                        self.stats.spectator_messages += 1
+                        self.stats.spectator_bytes += len(raw)
+                    msg = json.loads(raw)
+                    if msg["type"] == "snapshot":
+                        self.state = msg["state"]
+                    elif msg["seq"] == self.seq + 1:
+                        self.state.update(msg["set"])
+                    else:
+                        self.stats.spectator_resyncs += 1
+                        await ws.send(json.dumps({"type": "resync"}))
+                        continue
+                    self.seq = msg["seq"]
+            finally:
+                recv.cancel()
+                halt.cancel()
+
+
+async def _seat_bots(shards: List[httpx.AsyncClient], token: str,
+                     tables: int) -> List[Tuple[int, str]]:
+    """Создаёт столы по кругу на всех шардах и сажает ботов; [(table_id, URL шарда)]."""
+    ids = []
+    for n in range(tables):
+        http = shards[n % len(shards)]
+        r = await http.post("/api/tables", params={"level": LEVEL})
+        r.raise_for_status()
+        info = r.json()
+        table_id = info["id"]
+        ids.append((table_id, info.get("url") or str(http.base_url).rstrip("/")))
+        for seat in range(SEATS):
+            uid = f"{table_id}{seat:02d}"
+            r = await http.post("/api/join", headers={"Authorization": init_data(token, uid)},
+                                params={"table_id": table_id, "seat": seat,
+                                        "deposit": DEPOSIT})
+            r.raise_for_status()
+    return ids
+
+
+# ---------- Сервер ----------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(token: str, port: int, spectator_rate: Optional[float] = None,
+                 shard: Optional[Tuple[int, List[str], str]] = None) -> subprocess.Popen:
+    """shard — (номер, URL всех шардов, файл общего лобби) для запуска шардом."""
+    env = dict(os.environ,
+               DATABASE_URL="sqlite:///:memory:",
+               BOT_TOKEN=token,
+               TELEGRAM_BOT_TOKEN=token,
+               BALANCE_JOURNAL="",
+               HAND_LOG_DIR="",
+               SNAPSHOT_PATH="",
+               EQUITY_WORKERS=os.getenv("EQUITY_WORKERS", "1"))
+    if spectator_rate is not None:
+        env["WS_SPECTATOR_RATE"] = str(spectator_rate)
+    if shard is not None:
+        index, urls, store = shard
+        env.update(SHARD_INDEX=str(index), SHARD_URLS=",".join(urls), LOBBY_STORE=store,
+                   SHARD_LOCK=store + ".lock")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=root, env=env,
+    )
+
+
+async def _wait_ready(http: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await http.get("/healthz")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("server did not start")
+        await asyncio.sleep(0.1)
+
+
+# ---------- Прогон ----------
+def _usage(pids: List[int]) -> Tuple[Optional[float], int]:
+    """Суммарные CPU-секунды и RSS процессов сервера."""
+    cpu, rss = 0.0, 0
+    for pid in pids:
+        c, r = proc_usage(pid)
+        if c is None:
+            return None, 0
+        cpu += c
+        rss += r
+    return cpu, rss
+
+
+async def run(tables: int, duration: float, delay: float, warmup: float,
+              url: Optional[str] = None, token: Optional[str] = None,
+              seed: int = 12345, spectators: int = 0,
+              spectator_rate: Optional[float] = None, workers: int = 1) -> dict:
+    servers: List[subprocess.Popen] = []
+    urls = [url] if url else []
+    tmp = store = None
+    if url is None:
+        token = secrets.token_hex(16)
+        urls = [f"http://127.0.0.1:{_free_port()}" for _ in range(workers)]
+        if workers > 1:
+            tmp = tempfile.TemporaryDirectory(prefix="poker-load-")
+            store = os.path.join(tmp.name, "lobby.db")
+        for i, u in enumerate(urls):
+            shard = (i, urls, store) if workers > 1 else None
+            servers.append(start_server(token, int(u.rsplit(":", 1)[1]), spectator_rate, shard))
+    try:
+        async with contextlib.AsyncExitStack() as stack:
+            shards = [await stack.enter_async_context(httpx.AsyncClient(base_url=u, timeout=30.0))
+                      for u in urls]
+            for http in shards:
+                await _wait_ready(http)
+            table_ids = await _seat_bots(shards, token, tables)
+            stats = Stats()
+            stop = asyncio.Event()
+            rng = random.Random(seed)
+            bots = [Bot("ws" + u[len("http"):], token, t, s, delay, stats, random.Random(rng.random()))
+                    for t, u in table_ids for s in range(SEATS)]
+            watchers = [Spectator("ws" + u[len("http"):], token, t, n, stats)
+                        for t, u in table_ids for n in range(spectators)]
+            tasks = []
+            for client in bots + watchers:
+                ready = asyncio.Event()
+                tasks.append(asyncio.create_task(client.run(ready, stop)))
+                await ready.wait()
+
+            await asyncio.sleep(warmup)
+            pids = [p.pid for p in servers]
+            cpu0, _ = _usage(pids) if pids else (None, 0)
+            own0 = time.process_time()
+            actions0, messages0 = stats.actions, stats.messages
+            stats.recording = True
+            peak_rss = 0
+            started = time.perf_counter()
+            while time.perf_counter() - started < duration:
+                await asyncio.sleep(min(1.0, duration))
+                if pids:
+                    peak_rss = max(peak_rss, _usage(pids)[1])
+            elapsed = time.perf_counter() - started
+            stats.recording = False
+            cpu1, rss = _usage(pids) if pids else (None, 0)
+            own1 = time.process_time()
+            actions, messages = stats.actions - actions0, stats.messages - messages0
+
+            stop.set()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            stats.errors = sum(isinstance(r, Exception) for r in results)
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.wait()
+        if tmp is not None:
+            tmp.cleanup()
+
+    lat = sorted(stats.latencies)
+    ms = lambda q: _percentile(lat, q) * 1000 if lat else None  # noqa: E731
+    return {
+        "tables": tables,
+        "workers": len(urls),
+        "bots": tables * SEATS,
+        "duration_s": elapsed,
+        "actions_per_s": actions / elapsed,
+        "messages_per_s": messages / elapsed,
+        "latency_samples": len(lat),
+        "latency_p50_ms": ms(0.50),
+        "latency_p95_ms": ms(0.95),
+        "latency_p99_ms": ms(0.99),
+        "latency_max_ms": lat[-1] * 1000 if lat else None,
+        "resyncs": stats.resyncs,
+        "rejected": stats.rejected,
+        "spectators": tables * spectators,
+        "spectator_msgs_per_s": stats.spectator_messages / elapsed,
+        "spectator_kb_per_s": stats.spectator_bytes / elapsed / 1024,
+        "spectator_resyncs": stats.spectator_resyncs,
+        "bot_errors": stats.errors,
+        "server_cpu_pct": (cpu1 - cpu0) / elapsed * 100 if cpu0 is not None else None,
+        "server_rss_mb": max(peak_rss, rss) / 2**20 if servers else None,
+        "client_cpu_pct": (own1 - own0) / elapsed * 100,
+    }
+
+
+def _fmt(v) -> str:
+    if v is None:
+        return "n/a"
+    return f"{v:,.1f}" if isinstance(v, float) else f"{v:,}"
+
+
+def main(args) -> int:
+    report = asyncio.run(run(args.tables, args.duration, args.delay, args.warmup,
+                             args.url, args.token, spectators=args.spectators,
+                             spectator_rate=args.spectator_rate, workers=args.workers))
+    for key, value in report.items():
+        print(f"{key:<20} {_fmt(value):>12}")
+    if report["client_cpu_pct"] > 90:
+        print("warning: load generator is CPU-bound, latencies include client time")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved to {args.out}")
+    return 0
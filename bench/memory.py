@@ -0,0 +1,119 @@
+# bench/memory.py
+# Память на стол и временные выделения на ход (tracemalloc).
+
+import asyncio
+import gc
+import random
+import time
+import tracemalloc
+
+import game_engine
+from balance_cache import balances
+from bench.stubs import DEFAULT_BALANCE, install_memory_db, seat_players
+
+TABLES = 1000
+HANDS = 50
+FIRST_TABLE = 50_000
+
+
+async def _table_bytes() -> float:
+    """Сколько занимает стол на 6 игроков с начатой раздачей."""
+    ids = range(FIRST_TABLE, FIRST_TABLE + TABLES)
+    # Балансы грузим заранее, чтобы рост кэша не попал в замер
+    for tid in ids:
+        balances.set_many({u: DEFAULT_BALANCE for u in seat_players(tid, 6)})
+        game_engine.game_states.pop(tid)
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    for tid in ids:
+        seat_players(tid, 6)
+        await game_engine.start_hand(tid)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    for tid in ids:
+        game_engine.game_states.pop(tid)
+    return (after - before) / TABLES
+
+
+def _dict_state(table_id: int) -> dict:
+    """
+    Тот же стол с начатой раздачей в прежнем виде — словарём со
+    строковыми ключами, как до GameState. Точка отсчёта для замера в том
+    же процессе: абсолютные байты зависят от версии Python.
+    """
+    uids = [f"bench_{table_id}_{i}" for i in range(6)]
+    deck = game_engine.new_deck()
+    stacks = {u: DEFAULT_BALANCE for u in uids}
+    stacks[uids[1]] -= game_engine.BLIND_SMALL
+    stacks[uids[2]] -= game_engine.BLIND_BIG
+    contributions = {u: 0 for u in uids}
+    contributions[uids[1]] = game_engine.BLIND_SMALL
+    contributions[uids[2]] = game_engine.BLIND_BIG
+    return {
+        "seats": list(uids),
+        "player_seats": {u: i for i, u in enumerate(uids)},
+        "players": list(uids),
+        "usernames": {u: u for u in uids},
+        "dealer_index": 0,
+        "hole_cards": {u: [deck.pop(), deck.pop()] for u in uids},
+        "deck": deck,
+        "community": [],
+        "stacks": stacks,
+        "pot": game_engine.BLIND_SMALL + game_engine.BLIND_BIG,
+        "current_bet": game_engine.BLIND_BIG,
+        "contributions": contributions,
+        "current_round": game_engine.ROUNDS[0],
+        "current_player": uids[3],
+        "started": True,
+        "folds": set(),
+        "acted": set(),
+        "timer_deadline": time.time() + game_engine.DECISION_TIME,
+        "split_pots": {},
+        "phase": "pre-flop",
+    }
+
+
+def _dict_table_bytes() -> float:
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    states = [_dict_state(tid) for tid in range(FIRST_TABLE, FIRST_TABLE + TABLES)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    del states
+    return (after - before) / TABLES
+
+
+async def _action_bytes() -> float:
+    """Средний пик временных выделений за один apply_action."""
+    table_id = FIRST_TABLE - 1
+    random.seed(12345)
+    total = actions = 0
+    for _ in range(HANDS):
+        balances.set_many({u: DEFAULT_BALANCE for u in seat_players(table_id, 6)})
+        await game_engine.start_hand(table_id)
+        state = game_engine.game_states[table_id]
+        while state.phase != "result":
+            uid = state.current_player
+            need = state.current_bet - state.contributions[state.current_seat]
+            action = "call" if need > 0 else "check"
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await game_engine.apply_action(table_id, uid, action)
+            total += tracemalloc.get_traced_memory()[1] - before
+            actions += 1
+    return total / actions
+
+
+def measure() -> dict:
+    install_memory_db()
+    tracemalloc.start()
+    try:
+        table = asyncio.run(_table_bytes())
+        dict_table = _dict_table_bytes()
+        action = asyncio.run(_action_bytes())
+    finally:
+        tracemalloc.stop()
+    print(f"memory per 6-max table       {table:>10,.0f} B")
+    print(f"  same table as a dict       {dict_table:>10,.0f} B")
+    print(f"peak allocations per action  {action:>10,.0f} B")
+    return {"table_bytes": table, "dict_table_bytes": dict_table, "action_peak_bytes": action}
@@ -0,0 +1,72 @@
+# bench/stubs.py
+# Подмены внешних зависимостей: балансы в памяти и фейковый WebSocket.
+
+import json
+from typing import Dict, List
+
+import game_engine
+from balance_cache import balances
+from game_state import GameState
+
+DEFAULT_BALANCE = 1000
+
+
+class MemoryBalances:
+    """Хранилище балансов вместо Postgres с тем же интерфейсом, что у db_utils."""
+
+    def __init__(self):
+        self.balances: Dict[str, int] = {}
+        self.flush_seq: Dict[str, int] = {}
+
+    async def get_balances_async(self, user_ids) -> Dict[str, int]:
+        return {u: self.balances.setdefault(u, DEFAULT_BALANCE) for u in user_ids}
+
+    async def get_flush_seq_async(self, writer: str) -> int:
+        return self.flush_seq.get(writer, 0)
+
+    async def apply_balance_changes_async(self, writer, seq, assign, deltas) -> Dict[str, int]:
+        if self.flush_seq.get(writer, 0) < seq:
+            self.balances.update(assign)
+            for u, d in deltas.items():
+                self.balances[u] = self.balances.get(u, DEFAULT_BALANCE) + d
+            self.flush_seq[writer] = seq
+        return {u: self.balances[u] for u in (*assign, *deltas)}
+
+
+def install_memory_db() -> MemoryBalances:
+    db = MemoryBalances()
+    # Кэш балансов ходит в память вместо БД и не ведёт журнал
+    balances.load = db.get_balances_async
+    balances.save = db.apply_balance_changes_async
+    balances.load_seq = db.get_flush_seq_async
+    balances.journal_path = None
+    return db
+
+
+class FakeWebSocket:
+    """Сериализует сообщение так же, как starlette, но никуда не отправляет."""
+
+    def __init__(self):
+        self.sent = 0
+        self.bytes_sent = 0
+
+    async def send_json(self, data) -> None:
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        self.sent += 1
+        self.bytes_sent += len(text.encode())
+
+    async def send_text(self, text: str) -> None:
+        self.sent += 1
+        self.bytes_sent += len(text.encode())
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+def seat_players(table_id: int, n: int = 6) -> List[str]:
+    """Сажает n игроков за стол в обход HTTP-слоя и возвращает их id."""
+    uids = [f"bench_{table_id}_{i}" for i in range(n)]
+    state = game_engine.game_states[table_id] = GameState(table_id)
+    for seat, uid in enumerate(uids):
+        state.sit(uid, seat, 0)
+    return uids
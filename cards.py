@@ -0,0 +1,60 @@
+# cards.py
+# Внутреннее представление карт: целое 0..51 = ранг * 4 + масть,
+# где ранг 0 — двойка, 12 — туз, а масть — индекс в SUITS.
+# Строки вида "10♠" появляются только на границе с клиентом.
+
+from typing import Dict, Iterable, List
+
+RANK_NAMES = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
+SUITS = ['♠', '♥', '♦', '♣']
+
+DECK_SIZE = 52
+FULL_DECK = list(range(DECK_SIZE))
+
+# Готовые строки для каждой карты — конвертация без разбора и аллокаций
+CARD_STR: List[str] = [RANK_NAMES[c >> 2] + SUITS[c & 3] for c in FULL_DECK]
+
+# Допускаем и ASCII-запись (As, Td, 10h), чтобы карты можно было
+# передавать через query-параметры.
+_RANK_ALIASES = {name: r for r, name in enumerate(RANK_NAMES)}
+_RANK_ALIASES['T'] = 8
+_SUIT_ALIASES: Dict[str, int] = {s: i for i, s in enumerate(SUITS)}
+_SUIT_ALIASES.update({'s': 0, 'h': 1, 'd': 2, 'c': 3})
+
+
+def card_rank(card: int) -> int:
+    return card >> 2
+
+
+def card_suit(card: int) -> int:
+    return card & 3
+
+
+def card_to_str(card: int) -> str:
+    return CARD_STR[card]
+
+
+def cards_to_str(cards: Iterable[int]) -> List[str]:
+    return [CARD_STR[c] for c in cards]
+
+
+def parse_card(text: str) -> int:
+    """'10♠' / 'Ts' / 'as' -> int. ValueError для нераспознанной карты."""
+    text = text.strip()
+    rank = _RANK_ALIASES.get(text[:-1].upper())
+    suit = _SUIT_ALIASES.get(text[-1:].lower())
+    if rank is None or suit is None:
+        raise ValueError(f"Unknown card: {text!r}")
+    return rank * 4 + suit
+
+
+def cards_mask(cards: Iterable[int]) -> int:
+    """64-битная маска набора карт (бит c выставлен для карты c)."""
+    m = 0
+    for c in cards:
+        m |= 1 << c
+    return m
+
+
+def mask_to_cards(mask: int) -> List[int]:
+    return [c for c in FULL_DECK if mask >> c & 1]
@@ -1,55 +1,295 @@
 import os
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
 import psycopg2
+import psycopg2.pool
+
+from metrics import Histogram
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+
+DEFAULT_BALANCE = 1000
+
+# Время вызова БД с ожиданием свободного потока, по функциям
+DB_SECONDS = Histogram("poker_db_seconds", "Database call latency", label="function")
+
+# ---------- Пул соединений ----------
+# Пул и поток-исполнитель одного размера: поток никогда не ждёт
+# свободного соединения, а event loop никогда не ждёт БД.
+_pool = None
+_executor: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class SQLitePool:
+    """
+    Замена Postgres для тестов и локального запуска: DATABASE_URL=sqlite:///path
+    (или sqlite:///:memory:). Одно соединение под блокировкой, интерфейс
+    как у psycopg2.pool.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        self._lock.acquire()
+        return self._conn
+
+    def putconn(self, conn):
+        self._lock.release()
+
+    def closeall(self):
+        self._conn.close()
+
+
+def _is_sqlite() -> bool:
+    return bool(DATABASE_URL) and DATABASE_URL.startswith("sqlite:")
+
+
+def _sql(query: str) -> str:
+    # psycopg2 использует %s, sqlite3 — ?
+    return query.replace("%s", "?") if _is_sqlite() else query
+
+
+def init_pool():
+    """Создаёт пул соединений и исполнитель (вызывается на старте сервера)."""
+    global _pool, _executor
+    with _pool_lock:
+        if _pool is not None:
+            return
+        if _is_sqlite():
+            _pool = SQLitePool(DATABASE_URL[len("sqlite:///"):] or ":memory:")
+        else:
+            _pool = psycopg2.pool.ThreadedConnectionPool(
+                DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL
+            )
+        _executor = ThreadPoolExecutor(
+            max_workers=DB_POOL_MAX, thread_name_prefix="db"
+        )
+
+
+def close_pool():
+    """Закрывает пул и исполнитель (вызывается при остановке сервера)."""
+    global _pool, _executor
+    with _pool_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
 
-def get_conn():
-    return psycopg2.connect(DATABASE_URL)
+@contextmanager
+def get_cursor():
+    """Курсор на соединении из пула; коммит при успехе, откат при ошибке."""
+    if _pool is None:
+        init_pool()
+    pool = _pool
+    conn = pool.getconn()
+    try:
+        cur = conn.cursor()
+        try:
+            yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+    finally:
+        pool.putconn(conn)
 
+
+async def run_db(func, *args):
+    """Выполняет синхронную функцию БД в пуле потоков, не блокируя event loop."""
+    if _executor is None:
+        init_pool()
+    loop = asyncio.get_running_loop()
+    t0 = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, func, *args)
+    finally:
+        DB_SECONDS.labels(func.__name__).observe(time.perf_counter() - t0)
+
+
+# ---------- Синхронные операции (выполняются в потоках пула) ----------
 def init_schema():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS balances (
-          user_id TEXT PRIMARY KEY,
-          balance INTEGER NOT NULL
-        );
-    """)
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS balances (
+              user_id TEXT PRIMARY KEY,
+              balance INTEGER NOT NULL
+            );
+        """)
+        # Последний применённый сброс каждого писателя (кэша балансов шарда)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS balance_flushes (
+              writer TEXT PRIMARY KEY,
+              seq INTEGER NOT NULL
+            );
+        """)
 
 def get_balance_db(user_id: str) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT balance FROM balances WHERE user_id = %s", (user_id,))
-    row = cur.fetchone()
-    if row:
-        bal = row[0]
-    else:
-        bal = 1000
+    with get_cursor() as cur:
+        cur.execute(_sql("SELECT balance FROM balances WHERE user_id = %s"), (user_id,))
+        row = cur.fetchone()
+        if row:
+            return row[0]
         cur.execute(
-            "INSERT INTO balances(user_id, balance) VALUES(%s, %s)",
-            (user_id, bal)
+            _sql("INSERT INTO balances(user_id, balance) VALUES(%s, %s)"),
+            (user_id, DEFAULT_BALANCE)
         )
-        conn.commit()
-    cur.close()
-    conn.close()
-    return bal
+        return DEFAULT_BALANCE
 
 def set_balance_db(user_id: str, balance: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    # PostgreSQL UPSERT: INSERT ... ON CONFLICT ... DO UPDATE
-    cur.execute(
-        """
-        INSERT INTO balances (user_id, balance)
-        VALUES (%s, %s)
-        ON CONFLICT (user_id)
-        DO UPDATE SET balance = EXCLUDED.balance
-        """,
-        (user_id, balance)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_cursor() as cur:
+        # UPSERT: INSERT ... ON CONFLICT ... DO UPDATE (Postgres и SQLite)
+        cur.execute(
+            _sql("""
+            INSERT INTO balances (user_id, balance)
+            VALUES (%s, %s)
+            ON CONFLICT (user_id)
+            DO UPDATE SET balance = EXCLUDED.balance
+            """),
+            (user_id, balance)
+        )
+
+def get_balances(user_ids: Iterable[str]) -> Dict[str, int]:
+    """Балансы нескольких игроков одним запросом; новым — DEFAULT_BALANCE."""
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    with get_cursor() as cur:
+        if _is_sqlite():
+            marks = ", ".join("?" * len(user_ids))
+            cur.execute(
+                f"SELECT user_id, balance FROM balances WHERE user_id IN ({marks})",
+                user_ids,
+            )
+        else:
+            cur.execute(
+                "SELECT user_id, balance FROM balances WHERE user_id = ANY(%s)",
+                (user_ids,),
+            )
+        found = dict(cur.fetchall())
+        missing = [u for u in user_ids if u not in found]
+        if missing:
+            values = ", ".join(["(%s, %s)"] * len(missing))
+            cur.execute(
+                _sql(f"INSERT INTO balances (user_id, balance) VALUES {values} "
+                     "ON CONFLICT (user_id) DO NOTHING"),
+                [x for u in missing for x in (u, DEFAULT_BALANCE)],
+            )
+            for u in missing:
+                found[u] = DEFAULT_BALANCE
+    return found
+
+def settle_hand(stacks: Dict[str, int]):
+    """Записывает все стеки раздачи одним многострочным UPSERT в одной транзакции."""
+    if not stacks:
+        return
+    values = ", ".join(["(%s, %s)"] * len(stacks))
+    with get_cursor() as cur:
+        cur.execute(
+            _sql(f"""
+            INSERT INTO balances (user_id, balance)
+            VALUES {values}
+            ON CONFLICT (user_id)
+            DO UPDATE SET balance = EXCLUDED.balance
+            """),
+            [x for item in stacks.items() for x in item],
+        )
+
+
+def get_flush_seq(writer: str) -> int:
+    """seq последнего сброса писателя, применённого к balances (0 — не было)."""
+    with get_cursor() as cur:
+        cur.execute(_sql("SELECT seq FROM balance_flushes WHERE writer = %s"), (writer,))
+        row = cur.fetchone()
+        return row[0] if row else 0
+
+
+def apply_balance_changes(writer: str, seq: int, assign: Dict[str, int],
+                          deltas: Dict[str, int]) -> Dict[str, int]:
+    """
+    Сброс кэша балансов одной транзакцией: сначала присваивания
+    (assign), затем приращения (deltas) — UPDATE balance = balance + d,
+    так что параллельные сбросы разных шардов складываются, а не
+    затирают друг друга. Сброс с seq не больше уже записанного для
+    writer пропускается (повтор после сбоя). Возвращает балансы из БД
+    после сброса по всем затронутым игрокам.
+    """
+    user_ids = list(dict.fromkeys([*assign, *deltas]))
+    with get_cursor() as cur:
+        cur.execute(_sql("SELECT seq FROM balance_flushes WHERE writer = %s"), (writer,))
+        row = cur.fetchone()
+        if row is None or row[0] < seq:
+            if assign:
+                cur.executemany(
+                    _sql("""
+                    INSERT INTO balances (user_id, balance) VALUES (%s, %s)
+                    ON CONFLICT (user_id) DO UPDATE SET balance = EXCLUDED.balance
+                    """),
+                    list(assign.items()),
+                )
+            if deltas:
+                cur.executemany(
+                    _sql("INSERT INTO balances (user_id, balance) VALUES (%s, %s) "
+                         "ON CONFLICT (user_id) DO NOTHING"),
+                    [(u, DEFAULT_BALANCE) for u in deltas],
+                )
+                cur.executemany(
+                    _sql("UPDATE balances SET balance = balance + %s WHERE user_id = %s"),
+                    [(d, u) for u, d in deltas.items()],
+                )
+            cur.execute(
+                _sql("""
+                INSERT INTO balance_flushes (writer, seq) VALUES (%s, %s)
+                ON CONFLICT (writer) DO UPDATE SET seq = EXCLUDED.seq
+                """),
+                (writer, seq),
+            )
+        if not user_ids:
+            return {}
+        if _is_sqlite():
+            marks = ", ".join("?" * len(user_ids))
+            cur.execute(f"SELECT user_id, balance FROM balances WHERE user_id IN ({marks})",
+                        user_ids)
+        else:
+            cur.execute("SELECT user_id, balance FROM balances WHERE user_id = ANY(%s)",
+                        (user_ids,))
+        return dict(cur.fetchall())
+
+
+# ---------- Асинхронный интерфейс для обработчиков и движка ----------
+async def init_schema_async():
+    await run_db(init_schema)
+
+async def get_balance_async(user_id: str) -> int:
+    return await run_db(get_balance_db, user_id)
+
+async def set_balance_async(user_id: str, balance: int):
+    await run_db(set_balance_db, user_id, balance)
+
+async def get_balances_async(user_ids: Iterable[str]) -> Dict[str, int]:
+    return await run_db(get_balances, list(user_ids))
+
+async def settle_hand_async(stacks: Dict[str, int]):
+    await run_db(settle_hand, dict(stacks))
+
+async def get_flush_seq_async(writer: str) -> int:
+    return await run_db(get_flush_seq, writer)
+
+async def apply_balance_changes_async(writer: str, seq: int, assign: Dict[str, int],
+                                      deltas: Dict[str, int]) -> Dict[str, int]:
+    return await run_db(apply_balance_changes, writer, seq, dict(assign), dict(deltas))
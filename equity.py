@@ -0,0 +1,192 @@
+# equity.py
+# Эквити олл-ина: вероятности выигрыша/дележа для нескольких рук
+# при частично открытом борде.
+#
+# Если вариантов докрутки немного — перебираем их все, иначе считаем
+# методом Монте-Карло пачками через evaluate_many. Для сервера расчёт
+# раздаётся по ProcessPoolExecutor (equity_async), чтобы не блокировать
+# event loop; calc_equity — та же логика синхронно в текущем процессе.
+
+import asyncio
+import time
+from concurrent.futures import Executor
+from itertools import combinations
+from math import comb, sqrt
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from cards import FULL_DECK, cards_mask
+from hand_eval import evaluate_many
+
+# Полный перебор, если докруток не больше этого числа
+EXHAUSTIVE_LIMIT = 200_000
+# Размер пачки случайных докруток
+SAMPLE_BATCH = 20_000
+# Ограничения на запрос, чтобы один расчёт не занял пул надолго
+DEFAULT_TIME_BUDGET = 1.0
+MAX_TIME_BUDGET = 5.0
+MAX_SAMPLES = 5_000_000
+# Больше рук — в колоде не остаётся карт на борд и докруток ноль
+MAX_HANDS = (52 - 5) // 2
+
+
+def _validate(hands: Sequence[Sequence[int]], board: Sequence[int]):
+    if len(hands) < 2:
+        raise ValueError("At least two hands are required")
+    if len(hands) > MAX_HANDS:
+        raise ValueError(f"At most {MAX_HANDS} hands are allowed")
+    if any(len(h) != 2 for h in hands):
+        raise ValueError("Each hand must have exactly two cards")
+    if len(board) > 5:
+        raise ValueError("Board can't have more than five cards")
+    used = [c for h in hands for c in h] + list(board)
+    if any(not 0 <= c < 52 for c in used):
+        raise ValueError("Unknown card")
+    if len(set(used)) != len(used):
+        raise ValueError("Duplicate cards")
+
+
+def _remaining_deck(hands, board) -> np.ndarray:
+    dead = cards_mask([c for h in hands for c in h] + list(board))
+    return np.array([c for c in FULL_DECK if not dead >> c & 1], dtype=np.int8)
+
+
+def _tally(hands, board, runouts: np.ndarray):
+    """Счётчики (победы, дележи, доля банка) по каждой руке на докрутках."""
+    n = len(runouts)
+    boards = np.hstack([
+        np.broadcast_to(np.asarray(board, dtype=np.int8), (n, len(board))),
+        runouts,
+    ])
+    strengths = np.stack([
+        evaluate_many(np.hstack([np.broadcast_to(np.asarray(h, dtype=np.int8), (n, 2)), boards]))
+        for h in hands
+    ])
+    is_best = strengths == strengths.max(axis=0)
+    n_best = is_best.sum(axis=0)
+    wins = (is_best & (n_best == 1)).sum(axis=1)
+    ties = (is_best & (n_best > 1)).sum(axis=1)
+    share = (is_best / n_best).sum(axis=1)
+    return n, wins, ties, share
+
+
+def _exhaustive(hands, board):
+    deck = _remaining_deck(hands, board)
+    k = 5 - len(board)
+    if k == 0:
+        return _tally(hands, board, np.empty((1, 0), dtype=np.int8))
+    idx = np.fromiter(
+        (i for combo in combinations(range(len(deck)), k) for i in combo),
+        dtype=np.intp,
+    ).reshape(-1, k)
+    return _tally(hands, board, deck[idx])
+
+
+def _sample(hands, board, max_samples: int, deadline: float, seed: Optional[int]):
+    """Монте-Карло до max_samples докруток или до deadline (time.time())."""
+    rng = np.random.default_rng(seed)
+    deck = _remaining_deck(hands, board)
+    k = 5 - len(board)
+    total = 0
+    wins = np.zeros(len(hands), dtype=np.int64)
+    ties = np.zeros(len(hands), dtype=np.int64)
+    share = np.zeros(len(hands), dtype=np.float64)
+    while total < max_samples:
+        batch = min(SAMPLE_BATCH, max_samples - total)
+        picks = rng.random((batch, len(deck))).argpartition(k, axis=1)[:, :k]
+        n, w, t, s = _tally(hands, board, deck[picks])
+        total += n
+        wins += w
+        ties += t
+        share += s
+        if time.time() >= deadline:
+            break
+    return total, wins, ties, share
+
+
+def _samples_for(target_error: Optional[float]) -> int:
+    # Худший случай p = 0.5: stderr = 0.5 / sqrt(n)
+    if not target_error:
+        return MAX_SAMPLES
+    return min(MAX_SAMPLES, int((0.5 / target_error) ** 2) + 1)
+
+
+def _result(parts, exhaustive: bool) -> dict:
+    n = sum(p[0] for p in parts)
+    wins = sum(p[1] for p in parts)
+    ties = sum(p[2] for p in parts)
+    share = sum(p[3] for p in parts)
+    players = []
+    stderr = 0.0
+    for w, t, s in zip(wins.tolist(), ties.tolist(), share.tolist()):
+        eq = s / n
+        players.append({"win": w / n, "tie": t / n, "equity": eq})
+        if not exhaustive:
+            stderr = max(stderr, sqrt(eq * (1 - eq) / n))
+    return {
+        "players": players,
+        "samples": n,
+        "exhaustive": exhaustive,
+        "stderr": stderr,
+    }
+
+
+def warm_up() -> None:
+    """Строит таблицы оценщика в процессе пула заранее, до первого запроса."""
+    evaluate_many(np.zeros((1, 7), dtype=np.int8) + np.arange(7, dtype=np.int8))
+
+
+def runout_count(hands: Sequence[Sequence[int]], board: Sequence[int]) -> int:
+    return comb(52 - 2 * len(hands) - len(board), 5 - len(board))
+
+
+def calc_equity(
+    hands: Sequence[Sequence[int]],
+    board: Sequence[int] = (),
+    time_budget: float = DEFAULT_TIME_BUDGET,
+    target_error: Optional[float] = None,
+    seed: Optional[int] = None,
+) -> dict:
+    """
+    Эквити в текущем процессе. hands — список пар карт-целых, board — 0..5 карт.
+    Возвращает {"players": [{"win", "tie", "equity"}, ...], "samples",
+    "exhaustive", "stderr"}.
+    """
+    _validate(hands, board)
+    if runout_count(hands, board) <= EXHAUSTIVE_LIMIT:
+        return _result([_exhaustive(hands, board)], exhaustive=True)
+    budget = min(time_budget, MAX_TIME_BUDGET)
+    part = _sample(hands, board, _samples_for(target_error), time.time() + budget, seed)
+    return _result([part], exhaustive=False)
+
+
+async def equity_async(
+    executor: Executor,
+    workers: int,
+    hands: Sequence[Sequence[int]],
+    board: Sequence[int] = (),
+    time_budget: float = DEFAULT_TIME_BUDGET,
+    target_error: Optional[float] = None,
+) -> dict:
+    """То же, что calc_equity, но с раздачей выборки по workers процессам пула."""
+    _validate(hands, board)
+    hands = [list(h) for h in hands]
+    board = list(board)
+    loop = asyncio.get_running_loop()
+    if runout_count(hands, board) <= EXHAUSTIVE_LIMIT:
+        part = await loop.run_in_executor(executor, _exhaustive, hands, board)
+        return _result([part], exhaustive=True)
+
+    workers = max(1, workers)
+    deadline = time.time() + min(time_budget, MAX_TIME_BUDGET)
+    per_worker = -(-_samples_for(target_error) // workers)
+    seeds = np.random.SeedSequence().spawn(workers)
+    parts: List = await asyncio.gather(*(
+        loop.run_in_executor(
+            executor, _sample, hands, board, per_worker, deadline,
+            int(s.generate_state(1)[0]),
+        )
+        for s in seeds
+    ))
+    return _result(parts, exhaustive=False)
@@ -1,11 +1,17 @@
 import random
 import time
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from db_utils import get_balance_db, set_balance_db
+from balance_cache import balances
+from cards import FULL_DECK
+from game_state import GameState
+from hand_log import hand_log
+from hand_eval import hand_strength, strength_to_tuple
+from metrics import Counter, Histogram
+from profiling import span, traced_tables
 
 # ---------- Хранилища состояний и WS‐соединений ----------
-game_states: Dict[int, dict] = {}
+game_states: Dict[int, GameState] = {}
 connections: Dict[int, List] = {}
 
 # ---------- Константы ----------
@@ -18,335 +24,318 @@ DECISION_TIME  = 30
 
 ROUNDS = ["pre-flop", "flop", "turn", "river", "showdown"]
 
-HAND_RANKS = {
-    'high_card': 1,
-    'one_pair': 2,
-    'two_pair': 3,
-    'three_of_a_kind': 4,
-    'straight': 5,
-    'flush': 6,
-    'full_house': 7,
-    'four_of_a_kind': 8,
-    'straight_flush': 9,
-}
-
-RANK_ORDER = {r: i for i, r in enumerate(
-    ['2','3','4','5','6','7','8','9','10','J','Q','K','A'], start=2)}
-SUITS = ['♠','♥','♦','♣']
-
-
-def new_deck() -> List[str]:
-    ranks = [str(x) for x in range(2, 11)] + list("JQKA")
-    deck = [r + s for r in ranks for s in SUITS]
+# ---------- Метрики ----------
+APPLY_ACTION_SECONDS = Histogram("poker_apply_action_seconds", "Duration of apply_action")
+HANDS_COMPLETED = Counter("poker_hands_completed", "Hands finished (showdown or all but one folded)")
+DECISION_TIMEOUTS = Counter("poker_decision_timeouts", "Actions turned into fold after the decision time ran out")
+
+
+def state_for(table_id: int) -> GameState:
+    """Состояние стола; пустое создаётся при первом обращении."""
+    state = game_states.get(table_id)
+    if state is None:
+        state = game_states[table_id] = GameState(table_id)
+    return state
+
+
+def new_deck() -> List[int]:
+    deck = FULL_DECK.copy()
     random.shuffle(deck)
     return deck
 
 
-def evaluate_hand(cards: List[str]) -> Tuple[int, List[int]]:
-    vals = [RANK_ORDER[c[:-1]] for c in cards]
-    suits = [c[-1] for c in cards]
-    vals.sort(reverse=True)
-
-    flush_suit = next((s for s in SUITS if suits.count(s) >= 5), None)
-    flush_cards = (
-        sorted(
-            [v for v, su in zip(vals, suits) if su == flush_suit],
-            reverse=True
-        )[:5]
-    ) if flush_suit else []
-
-    unique_vals = sorted(set(vals), reverse=True)
-    straight_high = 0
-    for i in range(len(unique_vals) - 4):
-        window = unique_vals[i:i+5]
-        if window[0] - window[-1] == 4:
-            straight_high = window[0]
-            break
-    if set([14, 5, 4, 3, 2]).issubset(unique_vals):
-        straight_high = 5
-
-    counts = {v: vals.count(v) for v in set(vals)}
-    groups = sorted(counts.items(), key=lambda kv: (kv[1], kv[0]), reverse=True)
-
-    if flush_suit and straight_high:
-        category, tiebreaker = 'straight_flush', [straight_high]
-    elif groups[0][1] == 4:
-        four = groups[0][0]
-        kicker = max(v for v in vals if v != four)
-        category, tiebreaker = 'four_of_a_kind', [four, kicker]
-    elif groups[0][1] == 3 and groups[1][1] >= 2:
-        category, tiebreaker = 'full_house', [groups[0][0], groups[1][0]]
-    elif flush_suit:
-        category, tiebreaker = 'flush', flush_cards
-    elif straight_high:
-        category, tiebreaker = 'straight', [straight_high]
-    elif groups[0][1] == 3:
-        th = groups[0][0]
-        kickers = sorted([v for v in vals if v != th], reverse=True)[:2]
-        category, tiebreaker = 'three_of_a_kind', [th] + kickers
-    elif groups[0][1] == 2 and groups[1][1] == 2:
-        hp, lp = groups[0][0], groups[1][0]
-        kicker = max(v for v in vals if v not in (hp, lp))
-        category, tiebreaker = 'two_pair', [hp, lp, kicker]
-    elif groups[0][1] == 2:
-        pair = groups[0][0]
-        kickers = sorted([v for v in vals if v != pair], reverse=True)[:3]
-        category, tiebreaker = 'one_pair', [pair] + kickers
-    else:
-        category, tiebreaker = 'high_card', vals[:5]
-
-    return HAND_RANKS[category], tiebreaker
+def evaluate_hand(cards: List[int]) -> Tuple[int, List[int]]:
+    """Совместимая обёртка: (rank, tiebreaker) поверх табличного оценщика."""
+    return strength_to_tuple(hand_strength(cards))
 
 # =========== СТАРТ РАЗДАЧИ: баланс подтягивается из БД ============
-def start_hand(table_id: int):
+async def start_hand(table_id: int, deck: Optional[List[int]] = None,
+                     stacks: Optional[Dict[str, int]] = None):
+    """
+    Новая раздача. deck и stacks — для повтора из журнала (hand_log):
+    готовая колода вместо перемешанной и стеки вместо загрузки балансов.
+    """
     state = game_states.get(table_id)
     if not state:
         return
-    players = state.get("players", [])
-    if len(players) < MIN_PLAYERS:
-        game_states.pop(table_id, None)
+    order = state.occupied()
+    if len(order) < MIN_PLAYERS:
+        # Играть не с кем — раздачу сворачиваем, рассадка остаётся
+        state.clear_hand()
+        state.phase = "waiting"
         return
+    players = [state.seats[s].uid for s in order]
+
+    n = len(order)
+    dealer = (state.dealer_index + 1) % n
+    sb, bb = order[(dealer + 1) % n], order[(dealer + 2) % n]
+
+    deck = list(deck) if deck is not None else new_deck()
+    full_deck = deck.copy()
+    hole = [[deck.pop(), deck.pop()] for _ in order]
+
+    # --- ЗАГРУЖАЕМ БАЛАНС (кэш, при промахе — один запрос в БД) ---
+    t0 = time.perf_counter()
+    loaded = stacks if stacks is not None else await balances.get_many(players)
+    if table_id in traced_tables:
+        span(table_id, "db", time.perf_counter() - t0)
+    hand_log.log_start(table_id, dealer, [(s, u, loaded[u]) for s, u in zip(order, players)],
+                       full_deck)
+
+    state.clear_hand()
+    in_hand = 0
+    for seat, uid, cards in zip(order, players, hole):
+        state.stacks[seat] = loaded[uid]
+        state.hole[seat] = cards
+        state.hand_uids[seat] = uid
+        in_hand |= 1 << seat
 
-    prev = state.get("dealer_index", -1)
-    dealer = (prev + 1) % len(players)
-    sb, bb = (dealer + 1) % len(players), (dealer + 2) % len(players)
-    sb_uid, bb_uid = players[sb], players[bb]
+    # Списываем блайнды
+    state.stacks[sb] -= BLIND_SMALL
+    state.stacks[bb] -= BLIND_BIG
+    state.contributions[sb] = BLIND_SMALL
+    state.contributions[bb] = BLIND_BIG
+
+    state.in_hand = in_hand
+    state.dealer_index = dealer
+    state.dealer_seat = order[dealer]
+    state.deck = deck
+    state.pot = BLIND_SMALL + BLIND_BIG
+    state.current_bet = BLIND_BIG
+    state.current_round = ROUNDS[0]
+    state.current_seat = state.next_seat(bb, in_hand)
+    state.started = True
+    state.timer_deadline = time.time() + DECISION_TIME
+    state.phase = "pre-flop"
+
+
+def _finish_hand(state: GameState, reason: str, winner, split: Dict[str, int],
+                 revealed: Dict[str, List[int]]):
+    # --- Сохраняем ВСЕ стеки (кэш + журнал, в БД — групповым коммитом) ---
+    t0 = time.perf_counter()
+    balances.set_many(state.stacks_by_uid())
+    if state.table_id in traced_tables:
+        span(state.table_id, "db", time.perf_counter() - t0)
+    hand_log.log_end(state.table_id, [
+        (s, v) for s, v in enumerate(state.stacks) if state.in_hand >> s & 1
+    ])
+    HANDS_COMPLETED.inc()
+    state.revealed_hands = revealed
+    state.winner = winner
+    state.game_over_reason = reason
+    state.split_pots = split
+    state.phase = "result"
+    state.result_delay_deadline = time.time() + RESULT_DELAY
+    state.started = False
+
+
+def _win_uncontested(state: GameState, win_seat: int):
+    """Все, кроме win_seat, вышли из раздачи: пот ему без вскрытия."""
+    winner = state.hand_uids[win_seat]
+    pot = state.pot
+    state.stacks[win_seat] += pot
+    revealed = {
+        state.hand_uids[s]: state.hole[s]
+        for s in range(len(state.stacks)) if state.in_hand >> s & 1
+    }
+    _finish_hand(state, "fold", winner, {winner: pot}, revealed)
 
-    deck = new_deck()
-    hole = {u: [deck.pop(), deck.pop()] for u in players}
 
-    # --- ЗАГРУЖАЕМ БАЛАНС ИЗ БД ---
-    stacks = {u: get_balance_db(u) for u in players}
+# =========== УХОД ИЗ-ЗА СТОЛА ПОСРЕДИ РАЗДАЧИ ============
+def leave_hand(table_id: int, uid: str):
+    """
+    Игрок уже снят с места (/api/leave, истекло окно переподключения,
+    пересадка), а его рука ещё в раздаче: она сбрасывается, и раздача
+    не ждёт ушедшего. На его ходу это обычный фолд; не на его ходу —
+    фолд вне очереди (в журнале — "leave"). Остался один — пот ему.
+    """
+    state = game_states.get(table_id)
+    if not state or not state.started:
+        return
+    seat = next((s for s, u in enumerate(state.hand_uids) if u == uid), -1)
+    if seat < 0 or not state.in_hand >> seat & 1 or state.folded >> seat & 1:
+        return
+    if seat == state.current_seat:
+        _apply_action(table_id, uid, "fold")
+        return
+    hand_log.log_leave(table_id, seat)
+    state.folded |= 1 << seat
+    # Не только alive_mask: у оставшегося может не быть фишек (олл-ин)
+    live = [s for s in range(len(state.seats))
+            if (state.in_hand & ~state.folded) >> s & 1 and state.seated_in_hand(s)]
+    if len(live) == 1:
+        _win_uncontested(state, live[0])
+    elif not live:
+        # Ушли все: раздачу некому доигрывать
+        state.clear_hand()
+        state.phase = "waiting"
 
-    # Списываем блайнды
-    stacks[sb_uid] -= BLIND_SMALL
-    stacks[bb_uid] -= BLIND_BIG
-
-    contributions = {u: 0 for u in players}
-    contributions[sb_uid] = BLIND_SMALL
-    contributions[bb_uid] = BLIND_BIG
-
-    state.update({
-        "dealer_index": dealer,
-        "deck": deck,
-        "hole_cards": hole,
-        "community": [],
-        "stacks": stacks,
-        "pot": BLIND_SMALL + BLIND_BIG,
-        "current_bet": BLIND_BIG,
-        "contributions": contributions,
-        "current_round": ROUNDS[0],
-        "current_player": players[(bb + 1) % len(players)],
-        "started": True,
-        "folds": set(),
-        "acted": set(),
-        "timer_deadline": time.time() + DECISION_TIME,
-        "split_pots": {},
-    })
-
-    state["phase"] = "pre-flop"
-    state.pop("result_delay_deadline", None)
-    for k in ("winner", "game_over", "game_over_reason", "revealed_hands", "split_pots"):
-        state.pop(k, None)
-
-    game_states[table_id] = state
 
 # =========== ОБРАБОТКА ДЕЙСТВИЯ: начисление выигрыша в apply_action ============
-def apply_action(table_id: int, uid: str, action: str, amount: int = 0):
+async def apply_action(table_id: int, uid: str, action: str, amount: int = 0):
+    # Сам ход ничего не ждёт, поэтому считается синхронно: замер времени
+    # обходится без лишней обёртки-корутины
+    t0 = time.perf_counter()
+    result = _apply_action(table_id, uid, action, amount)
+    elapsed = time.perf_counter() - t0
+    APPLY_ACTION_SECONDS.observe(elapsed)
+    if table_id in traced_tables:
+        span(table_id, "engine", elapsed)
+    return result
+
+
+def _apply_action(table_id: int, uid: str, action: str, amount: int = 0):
     now = time.time()
     state = game_states.get(table_id)
-    if not state:
+    if not state or not state.started:
         return
     uid = str(uid)
 
-    players = state.get("players", [])
-    stacks = state["stacks"]
-    contrib = state["contributions"]
-    folds = set(state.get("folds", set()))
-    cb = state.get("current_bet", 0)
-    deadline = state.get("timer_deadline", now)
+    seat = state.current_seat
+    if seat < 0 or state.hand_uids[seat] != uid:
+        return
+
+    stacks = state.stacks
+    contrib = state.contributions
+    cb = state.current_bet
+    bit = 1 << seat
 
     # Если время вышло — fold
-    if now > deadline:
+    if now > (state.timer_deadline or now):
         action = "fold"
+        DECISION_TIMEOUTS.inc()
 
-    if uid not in stacks or state.get("current_player") != uid:
-        return
+    # В журнал — только принятое и уже итоговое действие, чтобы повтор не
+    # зависел от часов. Фолд принимается всегда (и может закончить раздачу —
+    # тогда он должен попасть в журнал раньше её итога), остальные — после проверок
 
     # === 1) FOLD: если остался один игрок — начисляем приз и сохраняем ВСЕ стеки ===
     if action == "fold":
-        folds.add(uid)
-        state["folds"] = folds
-
-        alive = [p for p in players if p not in folds and stacks.get(p, 0) > 0]
-        if len(alive) == 1:
-            winner = alive[0]
-            pot = state.get("pot", 0)
-            stacks[winner] = stacks.get(winner, 0) + pot
-            # --- Сохраняем ВСЕ стеки в БД ---
-            for p, st in stacks.items():
-                set_balance_db(p, st)
-            revealed = {p: state["hole_cards"].get(p, []) for p in state["hole_cards"].keys()}
-            state.update({
-                "stacks": stacks,
-                "revealed_hands": revealed,
-                "winner": winner,
-                "game_over": True,
-                "game_over_reason": "fold",
-                "split_pots": {winner: pot},
-                "phase": "result",
-                "result_delay_deadline": time.time() + RESULT_DELAY,
-                "started": False,
-            })
-            game_states[table_id] = state
+        hand_log.log_action(table_id, seat, action, amount)
+        state.folded |= bit
+
+        alive = state.alive_mask()
+        if alive and alive & (alive - 1) == 0:
+            _win_uncontested(state, alive.bit_length() - 1)
             return
 
         # Передаем ход следующему
-        idx = players.index(uid)
-        for i in range(1, len(players)):
-            cand = players[(idx + i) % len(players)]
-            if cand not in folds and stacks.get(cand, 0) > 0:
-                state["current_player"] = cand
-                break
-        state["timer_deadline"] = now + DECISION_TIME
+        nxt = state.next_seat(seat, alive)
+        if nxt >= 0:
+            state.current_seat = nxt
+        state.timer_deadline = now + DECISION_TIME
 
     elif action == "check":
-        if contrib.get(uid, 0) != cb:
+        if contrib[seat] != cb:
             return
 
     elif action == "call":
-        needed = cb - contrib.get(uid, 0)
-        to_call = min(needed, stacks[uid])
-        stacks[uid] -= to_call
-        state["pot"] += to_call
-        contrib[uid] += to_call
+        to_call = min(cb - contrib[seat], stacks[seat])
+        stacks[seat] -= to_call
+        state.pot += to_call
+        contrib[seat] += to_call
 
     elif action in ("bet", "raise"):
         if cb > 0:
             if amount == cb:
-                needed = cb - contrib.get(uid, 0)
-                to_call = min(needed, stacks[uid])
-                stacks[uid] -= to_call
-                state["pot"] += to_call
-                contrib[uid] += to_call
-            elif amount > cb and stacks.get(uid, 0) >= (amount - contrib.get(uid, 0)):
-                state["current_bet"] = amount
-                diff = amount - contrib.get(uid, 0)
-                stacks[uid] -= diff
-                state["pot"] += diff
-                contrib[uid] = amount
+                to_call = min(cb - contrib[seat], stacks[seat])
+                stacks[seat] -= to_call
+                state.pot += to_call
+                contrib[seat] += to_call
+            elif amount > cb and stacks[seat] >= amount - contrib[seat]:
+                state.current_bet = amount
+                diff = amount - contrib[seat]
+                stacks[seat] -= diff
+                state.pot += diff
+                contrib[seat] = amount
             else:
                 return
         else:
-            if amount > 0 and stacks.get(uid, 0) >= amount:
-                state["current_bet"] = amount
-                diff = amount - contrib.get(uid, 0)
-                stacks[uid] -= diff
-                state["pot"] += diff
-                contrib[uid] = amount
+            if amount > 0 and stacks[seat] >= amount:
+                state.current_bet = amount
+                diff = amount - contrib[seat]
+                stacks[seat] -= diff
+                state.pot += diff
+                contrib[seat] = amount
             else:
                 return
 
     else:
         return
 
-    # Сохраняем изменения
-    state["stacks"] = stacks
-    state["contributions"] = contrib
+    if action != "fold":
+        hand_log.log_action(table_id, seat, action, amount)
 
     if action in ("bet", "raise"):
-        state["acted"] = {uid}
+        state.acted = bit
     else:
-        acted = set(state.get("acted", set()))
-        acted.add(uid)
-        state["acted"] = acted
+        state.acted |= bit
 
-    state["timer_deadline"] = now + DECISION_TIME
+    state.timer_deadline = now + DECISION_TIME
 
-    alive = [p for p in players if p not in folds and stacks.get(p, 0) > 0]
-    if state["acted"] >= set(alive):
-        state["acted"] = set()
-        state["timer_deadline"] = now + DECISION_TIME
+    alive = state.alive_mask()
+    if alive & ~state.acted == 0:
+        state.acted = 0
 
-        rnd = state.get("current_round")
-        deck = state.get("deck", [])
+        rnd = state.current_round
+        deck = state.deck
         idx = ROUNDS.index(rnd)
 
-        state["current_bet"] = 0
-        for p in alive:
-            state["contributions"][p] = 0
+        state.current_bet = 0
+        for s in range(len(contrib)):
+            if alive >> s & 1:
+                contrib[s] = 0
 
-        if rnd in ["pre-flop", "flop", "turn"]:
+        if rnd in ("pre-flop", "flop", "turn"):
             if deck:
                 deck.pop()
             cnt = 3 if rnd == "pre-flop" else 1
             for _ in range(cnt):
                 if deck:
-                    state["community"].append(deck.pop())
-            state["current_round"] = ROUNDS[idx + 1]
+                    state.community.append(deck.pop())
+            state.current_round = ROUNDS[idx + 1]
         elif rnd == "river":
-            state["current_round"] = "showdown"
-
-        state["deck"] = deck
+            state.current_round = "showdown"
 
     # === SHOWDOWN: делим пот и сохраняем ВСЕ стеки ===
-    if state.get("current_round") == "showdown":
-        alive = [p for p in players if p not in folds and stacks.get(p, 0) > 0]
-
+    if state.current_round == "showdown":
+        board = state.community
         hands = {}
-        for p in state["hole_cards"].keys():
-            hole = state["hole_cards"].get(p, [])
-            boards = state["community"]
-            hands[p] = hole + boards
-
-        scores = {p: evaluate_hand(hands[p]) for p in hands.keys()}
-        best_rank = max(score[0] for score in scores.values())
-        contenders = [p for p, score in scores.items() if score[0] == best_rank]
-        max_tb = max(scores[p][1] for p in contenders)
-        winners = [p for p in contenders if scores[p][1] == max_tb]
-
-        pot_total = state.get("pot", 0)
-        share, rem = divmod(pot_total, len(winners))
-        split = {w: share for w in winners}
+        scores = {}
+        # Пот делят только не сбросившие (в том числе all-in)
+        live = state.in_hand & ~state.folded
+        for s in range(len(stacks)):
+            if live >> s & 1:
+                p = state.hand_uids[s]
+                hands[p] = state.hole[s] + board
+                scores[s] = hand_strength(hands[p])
+        best = max(scores.values())
+        winners = [s for s, score in scores.items() if score == best]
+
+        share, rem = divmod(state.pot, len(winners))
+        split_seats = {s: share for s in winners}
         if rem:
-            dealer = players[state["dealer_index"]]
-            split[dealer] = split.get(dealer, 0) + rem
-
-        # === НАЧИСЛЯЕМ всем победителям, сохраняем все стеки в БД ===
-        for p, amt in split.items():
-            stacks[p] = stacks.get(p, 0) + amt
-        # --- Сохраняем ВСЕ финальные стеки ---
-        for p, st in stacks.items():
-            set_balance_db(p, st)
-
-        state.update({
-            "stacks": stacks,
-            "revealed_hands": hands,
-            "winner": winners[0] if len(winners) == 1 else winners,
-            "split_pots": split,
-            "game_over": True,
-            "game_over_reason": "showdown",
-            "phase": "result",
-            "result_delay_deadline": time.time() + RESULT_DELAY,
-            "started": False,
-        })
-        game_states[table_id] = state
+            d = state.dealer_seat
+            split_seats[d] = split_seats.get(d, 0) + rem
+
+        # === НАЧИСЛЯЕМ всем победителям ===
+        for s, amt in split_seats.items():
+            stacks[s] += amt
+
+        win_uids = [state.hand_uids[s] for s in winners]
+        _finish_hand(
+            state, "showdown",
+            win_uids[0] if len(win_uids) == 1 else win_uids,
+            {state.hand_uids[s]: amt for s, amt in split_seats.items()},
+            hands,
+        )
         return
 
-    if len(alive) > 1 and uid in alive:
-        idx_alive = alive.index(uid)
-        state["current_player"] = alive[(idx_alive + 1) % len(alive)]
+    if alive & bit and alive & ~bit:
+        state.current_seat = state.next_seat(seat, alive)
 
-    state.setdefault("player_actions", {})
-    state["player_actions"][uid] = {
-        "type": action,
-        "amount": amount if action in ("bet", "raise") else None,
-        "ts": now
-    }
-    state["player_actions"] = {
-        k: v for k, v in state["player_actions"].items()
-        if now - v["ts"] < 1.8
-    }
+    player = state.seats[seat]
+    if player is not None:
+        player.action = (action, amount if action in ("bet", "raise") else None, now)
 
-    game_states[table_id] = state
     return {"status": "action applied"}
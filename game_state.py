@@ -0,0 +1,167 @@
+# game_state.py
+# Состояние стола: класс со __slots__ вместо словаря со строковыми ключами.
+#
+# Всё, что относится к месту, хранится в массивах по индексу места
+# (0..MAX_SEATS-1): кто сидит, стек, вклад в текущий круг торговли,
+# карманные карты, последнее действие. Множества «сбросил» и «уже
+# ходил в этом круге» — битовые маски мест. Словари по user_id
+# собираются только для клиента (game_ws.build_public_payload).
+
+from typing import Dict, List, Optional, Tuple
+
+MAX_SEATS = 6
+
+
+class PlayerState:
+    """Игрок на месте: кто он и что показывать рядом с ним."""
+    __slots__ = ("uid", "username", "action")
+
+    def __init__(self, uid: str, username: Optional[str] = None):
+        self.uid = uid
+        self.username = username or uid
+        # Последнее действие для подсветки: (тип, сумма, time.time())
+        self.action: Optional[Tuple[str, Optional[int], float]] = None
+
+
+class GameState:
+    __slots__ = (
+        "table_id", "seats", "seat_of", "stacks", "contributions", "hole",
+        "hand_uids", "in_hand", "folded", "acted", "dealer_index", "dealer_seat",
+        "deck", "community", "pot", "current_bet", "current_round", "current_seat",
+        "started", "phase", "timer_deadline", "result_delay_deadline",
+        "winner", "game_over_reason", "revealed_hands", "split_pots",
+    )
+
+    def __init__(self, table_id: int, max_seats: int = MAX_SEATS):
+        self.table_id = table_id
+        # ---------- Рассадка ----------
+        self.seats: List[Optional[PlayerState]] = [None] * max_seats
+        self.seat_of: Dict[str, int] = {}
+        self.stacks: List[int] = [0] * max_seats
+        # ---------- Раздача ----------
+        self.contributions: List[int] = [0] * max_seats
+        self.hole: List[Optional[List[int]]] = [None] * max_seats
+        # Кто сдан в раздачу на каждом месте (остаётся, даже если игрок ушёл)
+        self.hand_uids: List[Optional[str]] = [None] * max_seats
+        self.in_hand = 0
+        self.folded = 0
+        self.acted = 0
+        self.dealer_index = -1   # индекс в списке игроков (players()), как видит клиент
+        self.dealer_seat = -1
+        self.deck: List[int] = []
+        self.community: List[int] = []
+        self.pot = 0
+        self.current_bet = 0
+        self.current_round: Optional[str] = None
+        self.current_seat = -1
+        self.started = False
+        self.phase = "waiting"
+        self.timer_deadline: Optional[float] = None
+        self.result_delay_deadline: Optional[float] = None
+        # ---------- Итог раздачи ----------
+        self.winner = None       # user_id или список при дележе
+        self.game_over_reason: Optional[str] = None
+        self.revealed_hands: Optional[Dict[str, List[int]]] = None
+        self.split_pots: Optional[Dict[str, int]] = None
+
+    # ---------- Рассадка ----------
+    def sit(self, uid: str, seat: int, stack: int, username: Optional[str] = None):
+        self.seats[seat] = PlayerState(uid, username)
+        self.seat_of[uid] = seat
+        self.stacks[seat] = stack
+
+    def unseat(self, uid: str) -> Optional[int]:
+        """
+        Освобождает место игрока; возвращает его индекс или None. Рука
+        в идущей раздаче остаётся — её сбрасывает game_engine.leave_hand.
+        """
+        seat = self.seat_of.pop(uid, None)
+        if seat is not None and self.seats[seat] is not None and self.seats[seat].uid == uid:
+            self.seats[seat] = None
+        return seat
+
+    def seat_uids(self) -> List[Optional[str]]:
+        return [p.uid if p else None for p in self.seats]
+
+    def players(self) -> List[str]:
+        """Сидящие игроки по порядку мест."""
+        return [p.uid for p in self.seats if p]
+
+    def occupied(self) -> List[int]:
+        return [i for i, p in enumerate(self.seats) if p]
+
+    def seated_in_hand(self, seat: int) -> bool:
+        """Место сдано в раздачу и за ним всё ещё тот же игрок."""
+        p = self.seats[seat]
+        return p is not None and p.uid == self.hand_uids[seat]
+
+    @property
+    def current_player(self) -> Optional[str]:
+        return self.hand_uids[self.current_seat] if self.current_seat >= 0 else None
+
+    def stack_of(self, uid: str) -> Optional[int]:
+        seat = self.seat_of.get(uid)
+        return self.stacks[seat] if seat is not None else None
+
+    def stacks_by_uid(self) -> Dict[str, int]:
+        """Стеки сидящих и сданных в раздачу (ушедший до конца раздачи — тоже)."""
+        out = {}
+        for seat, p in enumerate(self.seats):
+            uid = p.uid if p else self.hand_uids[seat]
+            if uid is not None:
+                out[uid] = self.stacks[seat]
+        return out
+
+    def alive_mask(self) -> int:
+        """Места, которые ещё в игре: сданы, не сбросили, есть фишки, не ушли."""
+        mask = 0
+        live = self.in_hand & ~self.folded
+        for seat in range(len(self.seats)):
+            if live >> seat & 1 and self.stacks[seat] > 0 and self.seated_in_hand(seat):
+                mask |= 1 << seat
+        return mask
+
+    def next_seat(self, seat: int, mask: int) -> int:
+        """Следующее после seat место из mask по кругу (-1, если таких нет)."""
+        n = len(self.seats)
+        for i in range(1, n + 1):
+            cand = (seat + i) % n
+            if mask >> cand & 1:
+                return cand
+        return -1
+
+    def clear_hand(self):
+        n = len(self.seats)
+        self.contributions = [0] * n
+        self.hole = [None] * n
+        self.hand_uids = [None] * n
+        self.in_hand = self.folded = self.acted = 0
+        self.deck = []
+        self.community = []
+        self.pot = self.current_bet = 0
+        self.current_round = None
+        self.current_seat = -1
+        self.started = False
+        self.timer_deadline = self.result_delay_deadline = None
+        self.winner = self.game_over_reason = None
+        self.revealed_hands = self.split_pots = None
+
+    # ---------- Снимок (snapshots.py) ----------
+    def to_snapshot(self) -> dict:
+        """Все поля состояния простыми типами — для orjson."""
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["seats"] = [[p.uid, p.username, p.action] if p else None for p in self.seats]
+        return data
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "GameState":
+        state = cls(data["table_id"], len(data["seats"]))
+        # Поля, которых нет в снимке (он от старой версии), остаются по умолчанию
+        for name in cls.__slots__:
+            if name in data and name != "seats":
+                setattr(state, name, data[name])
+        for seat, p in enumerate(data["seats"]):
+            if p is not None:
+                player = state.seats[seat] = PlayerState(p[0], p[1])
+                player.action = tuple(p[2]) if p[2] else None
+        return state
@@ -1,122 +1,689 @@
+import os
 import json
 import time
 import asyncio
+import logging
+import secrets
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+import orjson
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from game_engine import game_states, connections, start_hand, apply_action, DECISION_TIME, RESULT_DELAY
+
+import lobby
+import tables
+from game_engine import (game_states, connections, start_hand, apply_action, leave_hand,
+                         state_for)
+from game_state import GameState
+from cards import cards_to_str
 from auth import validate_telegram_init_data
+from metrics import Counter, Gauge, Histogram, timed
+from profiling import span, traced_tables
+from timers import scheduler
+from table_actor import run_in_table, submit
 
 router = APIRouter()
 MIN_PLAYERS = 2
 MAX_PLAYERS = 6
 
-async def broadcast(table_id: int):
-    state = game_states.get(table_id)
-    if not state:
-        return
+# Исходящая очередь соединения: сколько сообщений держим, прежде чем
+# заменить их одним свежим снапшотом
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", 16))
+# Сколько клиент может висеть на одной отправке, прежде чем его отключим.
+# Прерванная отправка оставляет поток кадров в неизвестном состоянии,
+# так что после таймаута соединение только закрывать.
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", 5.0))
+# Сколько секунд клиенту подсвечивается последнее действие игрока
+ACTION_HIGHLIGHT = 1.8
+# Все изменения стола за это окно (секунды) уходят одной рассылкой
+BROADCAST_WINDOW = float(os.getenv("WS_BROADCAST_WINDOW", 0.02))
+# Сколько секунд место держится за игроком после обрыва сокета (0 — сразу освобождаем)
+RECONNECT_GRACE = float(os.getenv("WS_RECONNECT_GRACE", 30))
+# Сколько последних патчей стола хранится для догоняющих после переподключения
+RESUME_BUFFER = int(os.getenv("WS_RESUME_BUFFER", 128))
+# Зрители: сколько сокетов на стол и не чаще скольких обновлений в секунду (0 — без лимита)
+MAX_SPECTATORS = int(os.getenv("WS_MAX_SPECTATORS", 5000))
+SPECTATOR_RATE = float(os.getenv("WS_SPECTATOR_RATE", 0))
+
+log = logging.getLogger(__name__)
+
+# ---------- Метрики ----------
+BROADCAST_SECONDS = Histogram("poker_broadcast_seconds",
+                              "Encoding and queueing one table broadcast for all its sockets")
+SEND_SECONDS = Histogram("poker_ws_send_seconds", "Sending one message to one socket")
+SEND_FAILURES = Counter("poker_ws_send_failures", "Sockets dropped after a failed or timed-out send")
+Gauge("poker_active_tables", "Tables with at least one seated player",
+      lambda: sum(1 for s in game_states.values() if s.seat_of))
+Gauge("poker_seated_players", "Players seated at all tables",
+      lambda: sum(len(s.seat_of) for s in game_states.values()))
+Gauge("poker_open_websockets", "Open game websockets",
+      lambda: sum(len(c) for c in connections.values()))
+Gauge("poker_spectators", "Open spectator websockets",
+      lambda: sum(len(f.conns) for f in spectator_feeds.values()))
+Gauge("poker_pending_tasks", "Unfinished asyncio tasks in the server loop",
+      lambda: len(asyncio.all_tasks()))
+
+
+class Connection:
+    """
+    Сокет за столом: чей он, какое состояние уже получил, и собственная
+    исходящая очередь, которую разбирает отдельная задача-писатель.
+    Медленный клиент задерживает только свою очередь, а не весь стол.
+    """
+    __slots__ = ("ws", "uid", "table_id", "seq", "hole", "pending",
+                 "_wake", "_idle", "_writer", "closed")
+
+    def __init__(self, ws, uid: Optional[str], table_id: Optional[int] = None):
+        self.ws = ws
+        self.uid = uid
+        self.table_id = table_id
+        self.seq = -1      # последний поставленный в очередь seq (-1 — нужен снапшот)
+        self.hole = None   # последние отправленные hole_cards (bytes)
+        self.pending: Deque[str] = deque()
+        self._wake = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._writer: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def stop(self):
+        self.closed = True
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+        self._idle.set()
+
+    def backlogged(self) -> bool:
+        return len(self.pending) >= SEND_QUEUE_SIZE
+
+    def push(self, msg: str):
+        if self.closed:
+            return
+        self.pending.append(msg)
+        self._idle.clear()
+        self._wake.set()
+
+    def replace_pending(self, msg: str):
+        """Выбрасывает неотправленное и ставит msg (свежий снапшот) вместо него."""
+        self.pending.clear()
+        self.push(msg)
+
+    async def drained(self):
+        """Ждёт, пока очередь опустеет (для тестов и бенчмарков)."""
+        await self._idle.wait()
+
+    async def _write_loop(self):
+        clock = time.perf_counter
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self.pending:
+                try:
+                    t0 = clock()
+                    async with asyncio.timeout(SEND_TIMEOUT):
+                        await self.ws.send_text(self.pending.popleft())
+                    elapsed = clock() - t0
+                    SEND_SECONDS.observe(elapsed)
+                    if self.table_id in traced_tables:
+                        span(self.table_id, "send", elapsed)
+                except Exception as e:
+                    SEND_FAILURES.inc()
+                    log.info("dropping ws %s at table %s: %r", self.uid, self.table_id, e)
+                    await self._drop()
+                    return
+            self._idle.set()
+
+    async def _drop(self):
+        self.closed = True
+        self.pending.clear()
+        self._idle.set()
+        conns = connections.get(self.table_id, [])
+        if self in conns:
+            conns.remove(self)
+        try:
+            await self.ws.close()
+        except Exception:
+            pass
+
+
+class TableView:
+    """
+    Последнее разосланное публичное состояние: поле -> JSON-байты, и
+    кольцевой буфер последних патчей (seq, изменённые поля) — из него
+    переподключившийся клиент догоняет пропущенное без снапшота.
+    """
+    __slots__ = ("seq", "fields", "history")
+
+    def __init__(self):
+        self.seq = 0
+        self.fields: Dict[str, bytes] = {}
+        self.history: Deque[Tuple[int, bytes]] = deque(maxlen=RESUME_BUFFER)
+
+
+table_views: Dict[int, TableView] = {}
+
+
+class SpectatorFeed:
+    """
+    Общая лента зрителей стола. Зрители видят одно и то же (публичное
+    состояние и карты рубашкой), поэтому патч и снапшот кодируются один
+    раз на обновление и раздаются всем сокетам как одна и та же строка.
+    Свой seq: при лимите частоты промежуточные рассылки стола
+    склеиваются в один патч.
+    """
+    __slots__ = ("conns", "seq", "fields", "latest", "sent_at", "timer", "_snap")
+
+    def __init__(self):
+        self.conns: Set[Connection] = set()
+        self.seq = 0
+        self.fields: Dict[str, bytes] = {}      # разослано зрителям
+        self.latest: Dict[str, bytes] = {}      # последняя рассылка стола
+        self.sent_at = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self._snap: Optional[Tuple[int, str]] = None
+
+    def snapshot(self) -> str:
+        """Снапшот текущего seq (кодируется один раз на seq)."""
+        if self._snap is None or self._snap[0] != self.seq:
+            self._snap = (self.seq, (b'{"type":"snapshot","seq":%d,"state":{' % self.seq
+                                     + _join_fields(self.fields) + b"}}").decode())
+        return self._snap[1]
 
-    N = MAX_PLAYERS
-    seats = state.get("seats", [None] * N)
-    player_seats = state.get("player_seats", {})
 
+spectator_feeds: Dict[int, SpectatorFeed] = {}
+
+
+def build_public_payload(state: GameState) -> dict:
+    """Публичная часть состояния стола — одинаковая для всех зрителей."""
     players_payload = []
-    for seat_idx, uid in enumerate(seats):
-        if not uid:
+    usernames = {}
+    actions = {}
+    now = time.time()
+    for seat_idx, p in enumerate(state.seats):
+        if p is None:
             continue
         players_payload.append({
-            "user_id": uid,
-            "username": state.get("usernames", {}).get(uid, uid),
+            "user_id": p.uid,
+            "username": p.username,
             "seat": seat_idx,
         })
+        usernames[p.uid] = p.username
+        # Подсветка действия держится ACTION_HIGHLIGHT секунд
+        if p.action is not None and now - p.action[2] < ACTION_HIGHLIGHT:
+            actions[p.uid] = {"type": p.action[0], "amount": p.action[1], "ts": p.action[2]}
+
+    contributions = {
+        state.hand_uids[s]: c for s, c in enumerate(state.contributions)
+        if state.in_hand >> s & 1
+    }
+
+    # Карты внутри движка — целые, в строки переводим только здесь
+    revealed = state.revealed_hands
+    if revealed is not None:
+        revealed = {u: cards_to_str(cs) for u, cs in revealed.items()}
 
-    payload = {
-        "phase": state.get("phase", "waiting"),
-        "started": state.get("started", False),
-        "players_count": len([u for u in seats if u]),
+    return {
+        "phase": state.phase,
+        "started": state.started,
+        "players_count": len(players_payload),
         "players": players_payload,
-        "seats": seats,
-        "community": state.get("community", []),
-        "current_player": state.get("current_player"),
-        "pot": state.get("pot", 0),
-        "current_bet": state.get("current_bet", 0),
-        "contributions": state.get("contributions", {}),
-        "stacks": state.get("stacks", {}),
-        "hole_cards": state.get("hole_cards", {}),
-        "usernames": state.get("usernames", {}),
-        "timer_deadline": state.get("timer_deadline"),
-        "result_delay_deadline": state.get("result_delay_deadline"),
-        "winner": state.get("winner"),
-        "revealed_hands": state.get("revealed_hands"),
-        "split_pots": state.get("split_pots"),
-        "dealer_index": state.get("dealer_index"),
-        "player_actions": state.get("player_actions", {}),
+        "seats": state.seat_uids(),
+        "community": cards_to_str(state.community),
+        "current_player": state.current_player,
+        "pot": state.pot,
+        "current_bet": state.current_bet,
+        "contributions": contributions,
+        "stacks": state.stacks_by_uid(),
+        "usernames": usernames,
+        "timer_deadline": state.timer_deadline,
+        "result_delay_deadline": state.result_delay_deadline,
+        "winner": state.winner,
+        "revealed_hands": revealed,
+        "split_pots": state.split_pots,
+        "dealer_index": state.dealer_index if state.dealer_index >= 0 else None,
+        "player_actions": actions,
     }
 
-    for ws in list(connections.get(table_id, [])):
-        try:
-            await ws.send_json(payload)
-        except:
-            try:
-                await ws.close()
-            except:
-                pass
-            connections.get(table_id, []).remove(ws)
 
-async def _auto_restart(table_id: int):
-    await asyncio.sleep(RESULT_DELAY)
+def hole_cards_view(state: GameState, viewer: Optional[str]) -> dict:
+    """
+    Карманные карты глазами viewer: свои — открыто, чужие — рубашкой
+    (null), после вскрытия (phase == "result") — все открыто.
+    """
+    show_all = state.phase == "result"
+    view = {}
+    for s, cs in enumerate(state.hole):
+        if cs is None:
+            continue
+        uid = state.hand_uids[s]
+        view[uid] = cards_to_str(cs) if show_all or uid == viewer else [None] * len(cs)
+    return view
+
+
+def _join_fields(fields: Dict[str, bytes]) -> bytes:
+    return b",".join(b'"' + k.encode() + b'":' + v for k, v in fields.items())
+
+
+def _snapshot(view: TableView, hole: bytes) -> bytes:
+    return (b'{"type":"snapshot","seq":%d,"state":{' % view.seq
+            + _join_fields(view.fields) + b',"hole_cards":' + hole + b"}}")
+
+
+def _replay(view: TableView, since: int, hole: bytes) -> Optional[List[bytes]]:
+    """
+    Патчи после since из буфера стола; к последнему добавлены текущие
+    hole_cards (в буфере только публичные поля). None — нужного куска
+    в буфере уже нет (или seq не из этой жизни стола), нужен снапшот.
+    """
+    if since == view.seq:
+        return []
+    history = view.history
+    if since > view.seq or not history or since + 1 < history[0][0]:
+        return None
+    msgs = []
+    for seq, body in history:
+        if seq > since:
+            msgs.append(b'{"type":"patch","seq":%d,"set":{' % seq + body)
+    msgs[-1] += (b"," if msgs[-1][-1:] != b"{" else b"") + b'"hole_cards":' + hole
+    return [m + b"}}" for m in msgs]
+
+
+@timed(BROADCAST_SECONDS)
+def _send_state(table_id: int):
+    """
+    Дельта-рассылка. Сокеты не ждём: сообщения встают в очереди
+    соединений, отправляют их писатели. Каждое поле публичного состояния
+    кодируется отдельно и сравнивается с последней рассылкой; изменения
+    уходят патчем
+    {"type": "patch", "seq": N, "set": {...}}. Соединение, которое
+    отстало (новое, после ошибки или запросившее resync), получает
+    полный {"type": "snapshot", "seq": N, "state": {...}}.
+    """
     state = game_states.get(table_id)
-    if state and state.get("phase") == "result":
-        start_hand(table_id)
-        state["phase"] = "pre-flop"
-        state["timer_deadline"] = time.time() + DECISION_TIME
-        await broadcast(table_id)
+    if not state:
+        return
 
-@router.websocket("/ws/game/{table_id}/{user_id}/{seat}")
-async def ws_game(websocket: WebSocket, table_id: int, user_id: str, seat: int):
-    init_data = websocket.query_params.get("initData", "")
-    if not validate_telegram_init_data(init_data):
-        await websocket.close(code=4401)
+    view = table_views.setdefault(table_id, TableView())
+    fields = {k: orjson.dumps(v) for k, v in build_public_payload(state).items()}
+    changed = {k: v for k, v in fields.items() if view.fields.get(k) != v}
+    view.fields = fields
+
+    conns: List[Connection] = list(connections.get(table_id, []))
+    holes: Dict[Optional[str], bytes] = {}
+    for conn in conns:
+        if conn.uid not in holes:
+            holes[conn.uid] = orjson.dumps(hole_cards_view(state, conn.uid))
+
+    prev_seq = view.seq
+    body = _join_fields(changed)
+    if changed or any(conn.hole != holes[conn.uid] for conn in conns):
+        view.seq += 1
+        view.history.append((view.seq, body))
+    patch_head = b'{"type":"patch","seq":%d,"set":{' % view.seq + body
+
+    for conn in conns:
+        if conn.seq == view.seq:
+            continue
+        hole = holes[conn.uid]
+        if conn.seq == prev_seq and not conn.backlogged():
+            msg = patch_head
+            if hole != conn.hole:
+                msg += (b"," if changed else b"") + b'"hole_cards":' + hole
+            conn.push((msg + b"}}").decode())
+        else:
+            # Отстал или очередь забита: устаревшие сообщения заменяем
+            # одним снапшотом последнего состояния
+            conn.replace_pending(_snapshot(view, hole).decode())
+        conn.seq = view.seq
+        conn.hole = hole
+
+    feed = spectator_feeds.get(table_id)
+    if feed is not None:
+        feed.latest = {**fields, "hole_cards": orjson.dumps(hole_cards_view(state, None))}
+        _feed_spectators(table_id, feed)
+
+
+def _feed_spectators(table_id: int, feed: SpectatorFeed):
+    """Отправляет зрителям свежее состояние сразу или, при лимите, отложенно."""
+    if feed.timer is not None:
         return
-    await websocket.accept()
-    uid = str(user_id)
-    username = uid
+    wait = feed.sent_at + 1 / SPECTATOR_RATE - time.monotonic() if SPECTATOR_RATE > 0 else 0
+    if wait > 0:
+        feed.timer = asyncio.get_running_loop().call_later(wait, _flush_spectators, table_id)
+    else:
+        _flush_spectators(table_id)
+
+
+def _flush_spectators(table_id: int):
+    feed = spectator_feeds.get(table_id)
+    if feed is None:
+        return
+    feed.timer = None
+    changed = {k: v for k, v in feed.latest.items() if feed.fields.get(k) != v}
+    if not changed:
+        return
+    feed.fields = feed.latest
+    prev_seq = feed.seq
+    feed.seq += 1
+    feed.sent_at = time.monotonic()
+    patch = (b'{"type":"patch","seq":%d,"set":{' % feed.seq + _join_fields(changed) + b"}}").decode()
+    for conn in feed.conns:
+        if conn.seq == prev_seq and not conn.backlogged():
+            conn.push(patch)
+        else:
+            conn.replace_pending(feed.snapshot())
+        conn.seq = feed.seq
+
+
+async def broadcast(table_id: int):
+    """Немедленная рассылка текущего состояния стола."""
+    _send_state(table_id)
+
+
+# ---------- Склейка рассылок ----------
+# Стол с отложенной рассылкой считается «грязным»: повторные запросы до
+# срабатывания таймера ничего не добавляют. Состояние читается в момент
+# срабатывания, поэтому последнее изменение всегда попадает в рассылку,
+# а изменение после неё заново помечает стол.
+_pending_broadcasts: Dict[int, asyncio.TimerHandle] = {}
+broadcast_stats = {"requested": 0, "sent": 0}
+
+
+def schedule_broadcast(table_id: int):
+    """Помечает стол изменённым; рассылка уйдёт через BROADCAST_WINDOW."""
+    broadcast_stats["requested"] += 1
+    if table_id in _pending_broadcasts:
+        return
+    loop = asyncio.get_running_loop()
+    _pending_broadcasts[table_id] = loop.call_later(
+        BROADCAST_WINDOW, _flush_broadcast, table_id
+    )
+
+
+def _flush_broadcast(table_id: int):
+    _pending_broadcasts.pop(table_id, None)
+    broadcast_stats["sent"] += 1
+    if table_id in traced_tables:
+        t0 = time.perf_counter()
+        _send_state(table_id)
+        span(table_id, "broadcast", time.perf_counter() - t0)
+    else:
+        _send_state(table_id)
+
+
+def broadcast_metrics() -> dict:
+    """Сколько рассылок запрошено, отправлено и сэкономлено склейкой."""
+    requested = broadcast_stats["requested"]
+    sent = broadcast_stats["sent"]
+    return {
+        "requested": requested,
+        "sent": sent,
+        "saved": requested - sent - len(_pending_broadcasts),
+        "pending": len(_pending_broadcasts),
+    }
+
+
+async def request_snapshot(table_id: int, conn: Connection):
+    """Клиент заметил разрыв в seq — пришлём ему полный снапшот."""
+    conn.seq = -1
+    await broadcast(table_id)
 
-    N = MAX_PLAYERS
+
+# ---------- Зрители ----------
+def _watch(table_id: int, conn: Connection) -> Optional[int]:
+    """Подписывает сокет зрителя на ленту стола; код закрытия при отказе."""
+    feed = spectator_feeds.get(table_id)
+    if feed is None:
+        feed = spectator_feeds[table_id] = SpectatorFeed()
+    if len(feed.conns) >= MAX_SPECTATORS:
+        return 1013
+    feed.conns.add(conn)
+    conn.start()
+    if feed.seq:
+        conn.seq = feed.seq
+        conn.push(feed.snapshot())
+    else:
+        # Лента только что создана: первое состояние придёт с рассылкой
+        state_for(table_id)
+        schedule_broadcast(table_id)
+    return None
+
+
+def _unwatch(table_id: int, conn: Connection):
+    feed = spectator_feeds.get(table_id)
+    if feed is None:
+        return
+    feed.conns.discard(conn)
+    if not feed.conns:
+        if feed.timer is not None:
+            feed.timer.cancel()
+        del spectator_feeds[table_id]
+
+
+def _spectator_resync(table_id: int, conn: Connection):
+    feed = spectator_feeds.get(table_id)
+    if feed is not None and feed.seq:
+        conn.seq = feed.seq
+        conn.replace_pending(feed.snapshot())
+
+# ---------- Дедлайны стола ----------
+def arm_timers(table_id: int):
+    """
+    Приводит таймеры стола в соответствие с его состоянием: во время
+    раздачи — авто-фолд текущего игрока в timer_deadline, после
+    результата — следующая раздача в result_delay_deadline. Вызывается
+    после каждого изменения; повторный вызов только переносит дедлайн.
+    Сработавший таймер ставит команду в очередь актора стола.
+    """
+    state = game_states.get(table_id)
+    decision, restart = (table_id, "decision"), (table_id, "restart")
+    if state and state.phase == "result" and state.result_delay_deadline:
+        scheduler.cancel(decision)
+        scheduler.schedule(restart, state.result_delay_deadline,
+                           lambda: submit(table_id, "restart", _restart_hand, table_id))
+    elif state and state.started and state.timer_deadline:
+        scheduler.cancel(restart)
+        uid = state.current_player
+        scheduler.schedule(decision, state.timer_deadline,
+                           lambda: submit(table_id, "timeout", _decision_timeout, table_id, uid))
+    else:
+        scheduler.cancel(decision)
+        scheduler.cancel(restart)
+
+
+async def _decision_timeout(table_id: int, uid: str):
+    state = game_states.get(table_id)
+    if not state or state.phase == "result" or state.current_player != uid:
+        return
+    await apply_action(table_id, uid, "fold")
+    schedule_broadcast(table_id)
+    arm_timers(table_id)
+
+
+async def _restart_hand(table_id: int):
+    state = game_states.get(table_id)
+    if state and state.phase == "result":
+        await start_hand(table_id)
+        schedule_broadcast(table_id)
+    arm_timers(table_id)
+
+# ---------- Удержание места при обрыве ----------
+# Оборвавшийся сокет не освобождает место сразу: RECONNECT_GRACE секунд
+# оно держится за игроком (таймер (table_id, "grace", uid) в общем
+# планировщике). При подключении игрок получает токен сессии
+# {"type": "session", "token": T}; переподключение с ?resume=T&since=SEQ
+# снимает таймер и вместо снапшота досылает пропущенные патчи из буфера
+# стола — без /api/join, записи баланса и новой раздачи.
+# (table_id, uid) -> токен последнего подключения
+resume_tokens: Dict[Tuple[int, str], str] = {}
+resume_stats = {"held": 0, "resumed": 0, "replayed": 0, "released": 0}
+
+
+def _connected(table_id: int, uid: str) -> bool:
+    return any(c.uid == uid and not c.closed for c in connections.get(table_id, ()))
+
+
+def hold_seat(table_id: int, uid: str):
+    """Держит место uid RECONNECT_GRACE секунд; не вернулся — место освобождается."""
+    resume_stats["held"] += 1
+    scheduler.schedule((table_id, "grace", uid), time.time() + RECONNECT_GRACE,
+                       lambda: submit(table_id, "release", release_seat, table_id, uid))
+
+
+def hold_seats(table_id: int):
+    """Места без сокетов (например, после восстановления из снимка) — на удержание."""
+    state = game_states.get(table_id)
+    if state is None or RECONNECT_GRACE <= 0:
+        return
+    for uid in state.players():
+        if not _connected(table_id, uid):
+            hold_seat(table_id, uid)
+
+
+def forget_seat(table_id: int, uid: str):
+    """Игрок ушёл сам (/api/leave): удержание и токен больше не нужны."""
+    scheduler.cancel((table_id, "grace", uid))
+    resume_tokens.pop((table_id, uid), None)
+
+
+def release_seat(table_id: int, uid: str):
+    """Окно переподключения истекло: освобождаем место и чистим связи игрока."""
+    if _connected(table_id, uid):
+        return
+    resume_stats["released"] += 1
+    forget_seat(table_id, uid)
+    state = game_states.get(table_id)
+    if state is not None and state.unseat(uid) is not None:
+        leave_hand(table_id, uid)
+    tables.player_disconnected(table_id, uid)
+    schedule_broadcast(table_id)
+    arm_timers(table_id)
+
+
+# ---------- Команды актора стола (выполняются в его задаче) ----------
+async def _join_ws(table_id: int, conn: Connection, seat: int,
+                   resume: Optional[str] = None, since: Optional[int] = None) -> Optional[int]:
+    """Регистрирует сокет за столом; возвращает код закрытия при отказе."""
     conns = connections.setdefault(table_id, [])
-    state = game_states.setdefault(table_id, {})
-    seats = state.setdefault("seats", [None] * N)
-    player_seats = state.setdefault("player_seats", {})
-    usernames = state.setdefault("usernames", {})
-    players = state.setdefault("players", [])
+    state = state_for(table_id)
 
     # Игрок должен быть зарегистрирован через HTTP /api/join
-    if player_seats.get(uid) != seat:
-        await websocket.close(code=4400)
-        return
+    if state.seat_of.get(conn.uid) != seat:
+        return 4400
 
-    usernames[uid] = username
-    players = [u for u in seats if u]
-    state["players"] = players
-    state["usernames"] = usernames
-    state["seats"] = seats
-    state["player_seats"] = player_seats
+    # Тот же игрок с нового сокета, а старый ещё не закрылся: старый
+    # больше ничего не получает и не занимает место в лимите
+    for old in [c for c in conns if c.uid == conn.uid]:
+        conns.remove(old)
+        await old.stop()
+        _close_later(old.ws, 4409)
 
     # Добавляем соединение
-    if websocket not in conns:
-        conns.append(websocket)
-    if len(conns) > N:
-        await websocket.close(code=1013)
+    if len(conns) >= MAX_PLAYERS:
+        return 1013
+    key = (table_id, conn.uid)
+    resumed = resume is not None and resume_tokens.get(key) == resume
+    scheduler.cancel((table_id, "grace", conn.uid))
+    conns.append(conn)
+    conn.start()
+    token = resume_tokens[key] = secrets.token_urlsafe(16)
+    conn.push('{"type":"session","token":"%s","grace":%s}' % (token, orjson.dumps(RECONNECT_GRACE).decode()))
+
+    if resumed:
+        # Переподключение: место и раздача те же, догоняем пропущенное
+        resume_stats["resumed"] += 1
+        view = table_views.get(table_id)
+        if view is not None and since is not None:
+            hole = orjson.dumps(hole_cards_view(state, conn.uid))
+            msgs = _replay(view, since, hole)
+            if msgs is not None:
+                resume_stats["replayed"] += 1
+                conn.seq = view.seq
+                conn.hole = hole
+                for msg in msgs:
+                    conn.push(msg.decode())
+    # Старт раздачи, только если никакой нет: идущую переподключение без
+    # токена не трогает (получит снапшот), после результата следующую
+    # начнёт таймер
+    elif (not state.started and state.phase == "waiting"
+          and len(state.occupied()) >= MIN_PLAYERS):
+        await start_hand(table_id)
+
+    schedule_broadcast(table_id)
+    arm_timers(table_id)
+    return None
+
+
+async def _action(table_id: int, uid: str, action: str, amount: int):
+    await apply_action(table_id, uid, action, amount)
+    schedule_broadcast(table_id)
+    arm_timers(table_id)
+
+
+# Закрытие сокета ждёт клиента (до SEND_TIMEOUT) — не в задаче актора,
+# иначе один зависший сокет держал бы все команды стола
+_closing: Set[asyncio.Task] = set()
+
+
+def _close_later(ws, code: int):
+    async def close():
+        try:
+            async with asyncio.timeout(SEND_TIMEOUT):
+                await ws.close(code=code)
+        except Exception:
+            pass
+
+    task = asyncio.create_task(close())
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+def _leave_ws(table_id: int, conn: Connection):
+    """Сокет закрылся: место держим RECONNECT_GRACE секунд, затем освобождаем."""
+    conns = connections.get(table_id, [])
+    if conn in conns:
+        conns.remove(conn)
+    state = game_states.get(table_id)
+    if state is None or state.seat_of.get(conn.uid) is None or _connected(table_id, conn.uid):
+        # Уже ушёл через /api/leave или успел переподключиться другим сокетом
         return
+    if RECONNECT_GRACE > 0:
+        hold_seat(table_id, conn.uid)
+    else:
+        release_seat(table_id, conn.uid)
 
-    # Старт новой раздачи если нужно
-    if len(players) >= MIN_PLAYERS and state.get("phase") != "pre-flop":
-        start_hand(table_id)
 
-    await broadcast(table_id)
+@router.websocket("/ws/game/{table_id}/{user_id}/{seat}")
+async def ws_game(websocket: WebSocket, table_id: int, user_id: str, seat: int):
+    init_data = websocket.query_params.get("initData", "")
+    user = validate_telegram_init_data(init_data)
+    if user is None:
+        await websocket.close(code=4401)
+        return
+    # Играть можно только за себя: user_id из пути должен совпасть с подписью
+    if user.user_id != str(user_id):
+        await websocket.close(code=4403)
+        return
+    await websocket.accept()
 
-    # Авто-ребут если только что result
-    st = game_states.get(table_id, {})
-    if st.get("phase") == "result":
-        asyncio.create_task(_auto_restart(table_id))
+    # Все изменения стола — через очередь его актора
+    # Переподключение: токен сессии и последний полученный seq
+    resume = websocket.query_params.get("resume")
+    try:
+        since = int(websocket.query_params["since"])
+    except (KeyError, ValueError):
+        since = None
+    conn = Connection(websocket, user.user_id, table_id)
+    refused = await run_in_table(table_id, "join", _join_ws, table_id, conn, seat, resume, since)
+    if refused:
+        await websocket.close(code=refused)
+        return
 
     try:
         while True:
@@ -124,37 +691,82 @@ async def ws_game(websocket: WebSocket, table_id: int, user_id: str, seat: int):
                 data = await websocket.receive_text()
             except WebSocketDisconnect:
                 break
+            traced = table_id in traced_tables
+            if traced:
+                t0 = time.perf_counter()
             msg = json.loads(data)
-            pid = str(msg.get("user_id"))
+            if msg.get("type") == "resync":
+                await request_snapshot(table_id, conn)
+                continue
+            # Ход — всегда от имени владельца сокета, user_id из сообщения не важен
+            pid = conn.uid
             action = msg.get("action")
             amount = int(msg.get("amount", 0) or 0)
+            if traced:
+                span(table_id, "validate", time.perf_counter() - t0)
+            await run_in_table(table_id, "action", _action, table_id, pid, action, amount)
+    except WebSocketDisconnect:
+        # Нормальное закрытие клиентом
+        pass
+    finally:
+        await run_in_table(table_id, "leave", _leave_ws, table_id, conn)
+        await conn.stop()
 
-            apply_action(table_id, pid, action, amount)
 
-            s = game_states[table_id]
-            s["players"] = [u for u in s.get("seats", [None] * N) if u]
-            await broadcast(table_id)
+@router.websocket("/ws/watch/{table_id}")
+async def ws_watch(websocket: WebSocket, table_id: int):
+    """
+    Зритель стола: тот же протокол снапшотов и патчей, что у игрока,
+    но без своих карт и без ходов. Клиент может только попросить resync.
+    """
+    init_data = websocket.query_params.get("initData", "")
+    user = validate_telegram_init_data(init_data)
+    if user is None:
+        await websocket.close(code=4401)
+        return
+    if table_id not in tables.TABLES:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
 
-            st = game_states.get(table_id, {})
-            if st.get("phase") == "result":
-                asyncio.create_task(_auto_restart(table_id))
+    conn = Connection(websocket, user.user_id, table_id)
+    refused = await run_in_table(table_id, "watch", _watch, table_id, conn)
+    if refused:
+        await websocket.close(code=refused)
+        return
+    try:
+        while True:
+            msg = json.loads(await websocket.receive_text())
+            if msg.get("type") == "resync":
+                _spectator_resync(table_id, conn)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _unwatch(table_id, conn)
+        await conn.stop()
+
+
+@router.websocket("/ws/lobby/{level}")
+async def ws_lobby(websocket: WebSocket, level: str):
+    """Лента лобби уровня: снапшот столов, затем события (см. lobby.py)."""
+    init_data = websocket.query_params.get("initData", "")
+    if validate_telegram_init_data(init_data) is None:
+        await websocket.close(code=4401)
+        return
+    if level not in tables.TABLE_LEVELS:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+
+    conn = Connection(websocket, None)
+    conn.start()
+    lobby.subscribe(level, conn)
+    try:
+        while True:
+            # Клиенту писать нечего; читаем, чтобы заметить закрытие
+            await websocket.receive_text()
     except WebSocketDisconnect:
-        # Нормальное закрытие клиентом
         pass
     finally:
-        # Освобождаем место и чистим все связи
-        if uid in player_seats:
-            seat_idx = player_seats[uid]
-            if 0 <= seat_idx < N and seats[seat_idx] == uid:
-                seats[seat_idx] = None
-            del player_seats[uid]
-        usernames.pop(uid, None)
-        if uid in players:
-            players.remove(uid)
-        state["players"] = [u for u in seats if u]
-        state["usernames"] = usernames
-        state["seats"] = seats
-        state["player_seats"] = player_seats
-        await broadcast(table_id)
-        if websocket in conns:
-            conns.remove(websocket)
+        lobby.unsubscribe(level, conn)
+        await conn.stop()
@@ -0,0 +1,223 @@
+# hand_eval.py
+# Табличный оценщик покерных комбинаций (5–7 карт).
+#
+# Сила руки — одно целое число: старшие биты — категория (HAND_RANKS),
+# далее по 4 бита на каждое значение тайбрейкера. Сравнение чисел даёт
+# тот же порядок, что и сравнение кортежей (rank, tiebreaker) из
+# старого evaluate_hand, поэтому strength_to_tuple() восстанавливает
+# прежний формат без потерь.
+#
+# Таблицы строятся один раз при импорте:
+#   _FLUSH_TABLE — 13-битная маска рангов одной масти -> сила
+#                  (флеш или стрит-флеш);
+#   _RANK_TABLE  — мультимножество рангов (по 3 бита на счётчик ранга)
+#                  -> сила без учёта мастей.
+# При 7 картах флеш исключает каре и фулл-хаус, так что если в какой-то
+# масти 5+ карт, ответ целиком берётся из _FLUSH_TABLE.
+# Карты — целые из cards.py.
+
+from itertools import combinations_with_replacement
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from cards import DECK_SIZE
+
+HAND_RANKS = {
+    'high_card': 1,
+    'one_pair': 2,
+    'two_pair': 3,
+    'three_of_a_kind': 4,
+    'straight': 5,
+    'flush': 6,
+    'full_house': 7,
+    'four_of_a_kind': 8,
+    'straight_flush': 9,
+}
+
+# Сколько значений тайбрейкера у каждой категории
+_TB_LEN = {1: 5, 2: 4, 3: 3, 4: 3, 5: 1, 6: 5, 7: 2, 8: 2, 9: 1}
+
+_CATEGORY_SHIFT = 20
+
+
+def _pack(category: int, tiebreaker: List[int]) -> int:
+    s = category << _CATEGORY_SHIFT
+    shift = _CATEGORY_SHIFT
+    for v in tiebreaker[:5]:
+        shift -= 4
+        s |= v << shift
+    return s
+
+
+def strength_to_tuple(strength: int) -> Tuple[int, List[int]]:
+    """Распаковывает силу руки обратно в (rank, tiebreaker)."""
+    category = strength >> _CATEGORY_SHIFT
+    shift = _CATEGORY_SHIFT
+    tb = []
+    for _ in range(_TB_LEN[category]):
+        shift -= 4
+        v = (strength >> shift) & 0xF
+        if not v:
+            break
+        tb.append(v)
+    return category, tb
+
+
+def _straight_high(mask: int) -> int:
+    """Старшая карта стрита в 13-битной маске рангов (0 — стрита нет)."""
+    for top in range(12, 3, -1):
+        window = 0x1F << (top - 4)
+        if mask & window == window:
+            return top + 2
+    # Колесо: A-2-3-4-5
+    if mask & 0x100F == 0x100F:
+        return 5
+    return 0
+
+
+def _flush_strength(mask: int) -> int:
+    high = _straight_high(mask)
+    if high:
+        return _pack(HAND_RANKS['straight_flush'], [high])
+    vals = [r + 2 for r in range(12, -1, -1) if mask >> r & 1][:5]
+    return _pack(HAND_RANKS['flush'], vals)
+
+
+def _rank_strength(counts: List[int]) -> int:
+    """Сила руки без флеша по счётчикам рангов (индекс 0 — двойка)."""
+    vals = []
+    for r in range(12, -1, -1):
+        vals.extend([r + 2] * counts[r])
+    mask = 0
+    for r, c in enumerate(counts):
+        if c:
+            mask |= 1 << r
+    straight_high = _straight_high(mask)
+    groups = sorted(
+        ((c, r + 2) for r, c in enumerate(counts) if c), reverse=True
+    )
+
+    if groups[0][0] == 4:
+        four = groups[0][1]
+        kicker = [max(v for v in vals if v != four)] if len(vals) > 4 else []
+        return _pack(HAND_RANKS['four_of_a_kind'], [four] + kicker)
+    if groups[0][0] == 3 and len(groups) > 1 and groups[1][0] >= 2:
+        return _pack(HAND_RANKS['full_house'], [groups[0][1], groups[1][1]])
+    if straight_high:
+        return _pack(HAND_RANKS['straight'], [straight_high])
+    if groups[0][0] == 3:
+        th = groups[0][1]
+        return _pack(HAND_RANKS['three_of_a_kind'],
+                     [th] + [v for v in vals if v != th][:2])
+    if groups[0][0] == 2 and len(groups) > 1 and groups[1][0] == 2:
+        hp, lp = groups[0][1], groups[1][1]
+        return _pack(HAND_RANKS['two_pair'],
+                     [hp, lp] + [v for v in vals if v not in (hp, lp)][:1])
+    if groups[0][0] == 2:
+        pair = groups[0][1]
+        return _pack(HAND_RANKS['one_pair'],
+                     [pair] + [v for v in vals if v != pair][:3])
+    return _pack(HAND_RANKS['high_card'], vals[:5])
+
+
+def _build_tables():
+    flush_table = [0] * (1 << 13)
+    for mask in range(1 << 13):
+        if mask.bit_count() >= 5:
+            flush_table[mask] = _flush_strength(mask)
+
+    # До 5 карт считаем напрямую, 6 и 7 — как максимум по всем
+    # вариантам выбросить одну карту: каждая рука из n карт
+    # «проталкивает» свою силу во все руки из n + 1 карты.
+    rank_table: Dict[int, int] = {}
+    five = []
+    for n in range(1, 6):
+        for combo in combinations_with_replacement(range(13), n):
+            counts = [0] * 13
+            key = 0
+            for r in combo:
+                counts[r] += 1
+                key += 1 << (3 * r)
+            if max(counts) > 4:
+                continue
+            rank_table[key] = _rank_strength(counts)
+            if n == 5:
+                five.append(key)
+    bits = [1 << (3 * r) for r in range(13)]
+    prev = five
+    for _ in (6, 7):
+        cur: Dict[int, int] = {}
+        for key in prev:
+            s = rank_table[key]
+            for b in bits:
+                if (key // b) & 7 == 4:
+                    continue
+                nk = key + b
+                if cur.get(nk, 0) < s:
+                    cur[nk] = s
+        rank_table.update(cur)
+        prev = list(cur)
+    return flush_table, rank_table
+
+
+_FLUSH_TABLE, _RANK_TABLE = _build_tables()
+
+# Карта -> (вклад в ключ рангов, индекс масти, бит ранга)
+_CARD_INFO = [(1 << (3 * (c >> 2)), c & 3, 1 << (c >> 2)) for c in range(DECK_SIZE)]
+
+
+def hand_strength(cards: Iterable[int]) -> int:
+    """Сила лучшей 5-карточной комбинации из 5–7 карт одним числом."""
+    key = 0
+    suit_masks = [0, 0, 0, 0]
+    for c in cards:
+        k, s, b = _CARD_INFO[c]
+        key += k
+        suit_masks[s] |= b
+    for m in suit_masks:
+        if m.bit_count() >= 5:
+            return _FLUSH_TABLE[m]
+    return _RANK_TABLE[key]
+
+
+# ---------- Пакетная оценка (NumPy) ----------
+_np_tables = None
+
+
+def _numpy_tables():
+    global _np_tables
+    if _np_tables is None:
+        keys = np.fromiter(sorted(_RANK_TABLE), dtype=np.int64, count=len(_RANK_TABLE))
+        vals = np.fromiter((_RANK_TABLE[k] for k in keys.tolist()),
+                           dtype=np.int32, count=len(keys))
+        flush = np.asarray(_FLUSH_TABLE, dtype=np.int32)
+        card_keys = np.array([k for k, _, _ in _CARD_INFO], dtype=np.int64)
+        # Бит ранга, сдвинутый в 16-битное поле своей масти
+        card_bits = np.array([b << (16 * s) for _, s, b in _CARD_INFO], dtype=np.int64)
+        _np_tables = (keys, vals, flush, card_keys, card_bits)
+    return _np_tables
+
+
+def evaluate_many(hands) -> "np.ndarray":
+    """
+    Векторная оценка: массив N×k (k = 5..7) карт-целых -> N сил рук.
+    Результат совпадает с hand_strength() для каждой строки.
+    """
+    keys, vals, flush, card_keys, card_bits = _numpy_tables()
+    h = np.asarray(hands)
+    if h.ndim != 2 or not 5 <= h.shape[1] <= 7:
+        raise ValueError("hands must be an N×5..7 array")
+    h = h.astype(np.intp, copy=False)
+
+    rank_keys = card_keys[h].sum(axis=1)
+    # Все четыре маски мастей одним числом: по 16 бит на масть.
+    # В 7 картах флеш возможен максимум в одной масти, а для масок
+    # меньше чем из 5 карт _FLUSH_TABLE хранит 0 — хватает максимума.
+    suit_masks = card_bits[h].sum(axis=1)
+    best_flush = flush[suit_masks & 0x1FFF]
+    for s in (1, 2, 3):
+        np.maximum(best_flush, flush[(suit_masks >> (16 * s)) & 0x1FFF], out=best_flush)
+
+    by_ranks = vals[np.searchsorted(keys, rank_keys)]
+    return np.where(best_flush > 0, best_flush, by_ranks)
@@ -0,0 +1,335 @@
+# hand_log.py
+# Журнал раздач: каждое start_hand / apply_action / итог раздачи пишется
+# в append-only бинарный лог, из которого стол можно восстановить,
+# прогнав события через настоящий движок.
+#
+# Запись: u32 длина полезной нагрузки, u32 crc32, нагрузка. Нагрузка
+# начинается с (u8 тип, u32 table_id, f64 time.time()), дальше — поля
+# события (см. encode_*). Оборванная или битая последняя запись при
+# чтении отбрасывается.
+#
+# Сегменты — файлы hands-YYYYMMDD-NNNN.bin в HAND_LOG_DIR; новый
+# начинается со сменой суток или по достижении HAND_LOG_SEGMENT_BYTES.
+# События копятся в памяти и раз в HAND_LOG_FLUSH_INTERVAL секунд
+# одной пачкой пишутся и fsync'аются в потоке, не блокируя event loop.
+#
+# Уход игрока посреди раздачи не на своём ходу пишется как ACTION
+# "leave" (на своём ходу это обычный фолд): он меняет, кто ещё в игре,
+# и без него повтор разошёлся бы с оригиналом.
+#
+# Восстановление стола:
+#   python -m hand_log replay TABLE_ID [--dir hand_log]
+
+import argparse
+import asyncio
+import logging
+import os
+import struct
+import sys
+import time
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from sharding import local_path
+
+HAND_LOG_DIR = local_path(os.getenv("HAND_LOG_DIR", "hand_log"))
+HAND_LOG_SEGMENT_BYTES = int(os.getenv("HAND_LOG_SEGMENT_BYTES", 64 * 1024 * 1024))
+HAND_LOG_FLUSH_INTERVAL = float(os.getenv("HAND_LOG_FLUSH_INTERVAL", 0.2))
+
+log = logging.getLogger(__name__)
+
+# ---------- Формат ----------
+START, ACTION, END = 1, 2, 3
+
+ACTIONS = ("fold", "check", "call", "bet", "raise")
+LEAVE_ACTION = "leave"
+_ACTION_CODE = {a: i for i, a in enumerate(ACTIONS + (LEAVE_ACTION,))}
+_CODE_ACTION = ACTIONS + (LEAVE_ACTION,)
+
+_HEADER = struct.Struct("<II")       # длина, crc32
+_EVENT = struct.Struct("<BId")       # тип, стол, время
+_SEAT_STACK = struct.Struct("<Bd")   # место, стек
+_ACTION = struct.Struct("<BBd")      # место, действие, сумма
+_UID_LEN = struct.Struct("<H")       # длина uid в байтах
+
+
+def _num(x: float):
+    # Суммы хранятся как f64; целые возвращаем целыми, как в движке
+    return int(x) if x.is_integer() else x
+
+
+def _frame(payload: bytes) -> bytes:
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def encode_start(table_id: int, ts: float, dealer_index: int,
+                 seats: List[Tuple[int, str, float]], deck: List[int]) -> bytes:
+    """Начало раздачи: дилер, (место, игрок, стек до блайндов), колода до раздачи карт."""
+    parts = [_EVENT.pack(START, table_id, ts), bytes((dealer_index, len(seats)))]
+    for seat, uid, stack in seats:
+        raw = uid.encode()
+        parts.append(_SEAT_STACK.pack(seat, stack) + _UID_LEN.pack(len(raw)) + raw)
+    parts.append(bytes((len(deck),)) + bytes(deck))
+    return _frame(b"".join(parts))
+
+
+def encode_action(table_id: int, ts: float, seat: int, action: str, amount: float) -> bytes:
+    return _frame(_EVENT.pack(ACTION, table_id, ts)
+                  + _ACTION.pack(seat, _ACTION_CODE[action], amount))
+
+
+def encode_end(table_id: int, ts: float, stacks: List[Tuple[int, float]]) -> bytes:
+    """Итог раздачи: стеки мест после расчёта — для сверки при повторе."""
+    return _frame(_EVENT.pack(END, table_id, ts) + bytes((len(stacks),))
+                  + b"".join(_SEAT_STACK.pack(s, v) for s, v in stacks))
+
+
+def decode(payload: bytes) -> tuple:
+    """
+    (START, table_id, ts, dealer_index, [(seat, uid, stack)], deck)
+    (ACTION, table_id, ts, seat, action, amount)
+    (END, table_id, ts, [(seat, stack)])
+    """
+    kind, table_id, ts = _EVENT.unpack_from(payload)
+    pos = _EVENT.size
+    if kind == ACTION:
+        seat, code, amount = _ACTION.unpack_from(payload, pos)
+        return ACTION, table_id, ts, seat, _CODE_ACTION[code], _num(amount)
+    if kind == START:
+        dealer_index, n = payload[pos], payload[pos + 1]
+        pos += 2
+        seats = []
+        for _ in range(n):
+            seat, stack = _SEAT_STACK.unpack_from(payload, pos)
+            pos += _SEAT_STACK.size
+            ln, = _UID_LEN.unpack_from(payload, pos)
+            pos += _UID_LEN.size
+            uid = payload[pos:pos + ln].decode()
+            pos += ln
+            seats.append((seat, uid, _num(stack)))
+        ln = payload[pos]
+        deck = list(payload[pos + 1:pos + 1 + ln])
+        return START, table_id, ts, dealer_index, seats, deck
+    if kind == END:
+        n = payload[pos]
+        pos += 1
+        stacks = []
+        for i in range(n):
+            seat, stack = _SEAT_STACK.unpack_from(payload, pos + i * _SEAT_STACK.size)
+            stacks.append((seat, _num(stack)))
+        return END, table_id, ts, stacks
+    raise ValueError(f"unknown hand log record type {kind}")
+
+
+# ---------- Чтение ----------
+def segments(directory: str = HAND_LOG_DIR) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory))
+            if f.startswith("hands-") and f.endswith(".bin")]
+
+
+def read_segment(path: str) -> Iterator[bytes]:
+    """Нагрузки записей сегмента по порядку; на оборванной/битой записи — стоп."""
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    while pos + _HEADER.size <= len(data):
+        length, crc = _HEADER.unpack_from(data, pos)
+        start = pos + _HEADER.size
+        payload = data[start:start + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            log.warning("%s: torn record at offset %d, ignoring the rest", path, pos)
+            return
+        yield payload
+        pos = start + length
+
+
+def read_events(paths: Iterable[str], table_id: Optional[int] = None) -> Iterator[tuple]:
+    want = None if table_id is None else struct.pack("<I", table_id)
+    for path in paths:
+        for payload in read_segment(path):
+            # Чужие столы отсеиваем, не декодируя запись целиком
+            if want is not None and payload[1:5] != want:
+                continue
+            yield decode(payload)
+
+
+# ---------- Запись ----------
+class HandLog:
+    def __init__(self, directory: Optional[str] = HAND_LOG_DIR,
+                 segment_bytes: int = HAND_LOG_SEGMENT_BYTES,
+                 interval: float = HAND_LOG_FLUSH_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.interval = interval
+        self._buf: List[bytes] = []
+        self._file = None
+        self._day: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.records = 0
+
+    @property
+    def active(self) -> bool:
+        """Лог пишется только между start() и close()."""
+        return self._task is not None
+
+    # ---------- Жизненный цикл ----------
+    async def start(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            log.exception("final hand log flush failed")
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    # ---------- События движка ----------
+    def log_start(self, table_id: int, dealer_index: int,
+                  seats: List[Tuple[int, str, float]], deck: List[int]):
+        if self._task is not None:
+            self._buf.append(encode_start(table_id, time.time(), dealer_index, seats, deck))
+
+    def log_action(self, table_id: int, seat: int, action: str, amount: float):
+        if self._task is not None and action in _ACTION_CODE:
+            self._buf.append(encode_action(table_id, time.time(), seat, action, amount))
+
+    def log_leave(self, table_id: int, seat: int):
+        if self._task is not None:
+            self._buf.append(encode_action(table_id, time.time(), seat, LEAVE_ACTION, 0))
+
+    def log_end(self, table_id: int, stacks: List[Tuple[int, float]]):
+        if self._task is not None:
+            self._buf.append(encode_end(table_id, time.time(), stacks))
+
+    # ---------- Сброс на диск ----------
+    async def flush(self):
+        """Пишет накопленное одной пачкой и делает fsync (в потоке)."""
+        async with self._flush_lock:
+            if not self._buf:
+                return
+            batch, self._buf = self._buf, []
+            await asyncio.to_thread(self._write, b"".join(batch))
+            self.records += len(batch)
+
+    def _write(self, data: bytes):
+        day = time.strftime("%Y%m%d", time.gmtime())
+        if self._file is None or day != self._day or self._file.tell() + len(data) > self.segment_bytes:
+            self._open_segment(day)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _open_segment(self, day: str):
+        if self._file:
+            self._file.close()
+        prefix = f"hands-{day}-"
+        existing = [p for p in segments(self.directory) if os.path.basename(p).startswith(prefix)]
+        n = 0
+        if existing:
+            last = existing[-1]
+            n = int(os.path.basename(last)[len(prefix):-4])
+            if os.path.getsize(last) < self.segment_bytes:
+                # После рестарта дописываем в недозаполненный сегмент
+                self._file = open(last, "ab")
+                self._day = day
+                return
+            n += 1
+        self._file = open(os.path.join(self.directory, f"{prefix}{n:04d}.bin"), "ab")
+        self._day = day
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("hand log flush failed")
+
+
+# Общий журнал процесса
+hand_log = HandLog()
+
+
+# ---------- Повтор ----------
+async def replay(table_id: int, events: Iterable[tuple]):
+    """
+    Восстанавливает стол, прогоняя события через настоящий движок.
+    Работает с game_engine.game_states и кэшем балансов текущего
+    процесса, поэтому вызывать его нужно в отдельном процессе (CLI,
+    бенчмарк), а не на живом сервере. Возвращает (GameState, раздач,
+    расхождений с записанными итогами).
+    """
+    import game_engine
+    from game_state import GameState
+
+    state = None
+    hands = mismatches = 0
+    for ev in events:
+        if ev[1] != table_id:
+            continue
+        if ev[0] == START:
+            _, _, _, dealer_index, seats, deck = ev
+            state = game_engine.game_states[table_id] = GameState(table_id)
+            for seat, uid, stack in seats:
+                state.sit(uid, seat, stack)
+            # start_hand сдвигает дилера на одного
+            state.dealer_index = (dealer_index - 1) % len(seats)
+            await game_engine.start_hand(
+                table_id, deck=deck, stacks={uid: stack for _, uid, stack in seats}
+            )
+            hands += 1
+        elif ev[0] == ACTION and state is not None:
+            _, _, _, seat, action, amount = ev
+            uid = state.hand_uids[seat]
+            if action == LEAVE_ACTION:
+                state.unseat(uid)
+                game_engine.leave_hand(table_id, uid)
+            else:
+                await game_engine.apply_action(table_id, uid, action, amount)
+        elif ev[0] == END and state is not None:
+            if any(state.stacks[seat] != stack for seat, stack in ev[3]):
+                mismatches += 1
+    return state, hands, mismatches
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m hand_log")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    rp = sub.add_parser("replay", help="восстановить стол из журнала")
+    rp.add_argument("table_id", type=int)
+    rp.add_argument("--dir", default=HAND_LOG_DIR)
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    state, hands, mismatches = asyncio.run(
+        replay(args.table_id, read_events(segments(args.dir), args.table_id))
+    )
+    elapsed = time.perf_counter() - t0
+    if state is None:
+        print(f"table {args.table_id}: no hands in {args.dir}")
+        return 1
+    print(f"table {args.table_id}: {hands} hands replayed in {elapsed:.3f}s, "
+          f"{mismatches} mismatches")
+    print(f"phase {state.phase}, round {state.current_round}, pot {state.pot}")
+    for uid, stack in state.stacks_by_uid().items():
+        print(f"  {uid}: {stack}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
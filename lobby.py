@@ -0,0 +1,114 @@
+# lobby.py
+# Лента лобби: вместо опроса /api/tables клиент подписывается на
+# /ws/lobby/{level} (game_ws) и получает снапшот столов уровня один раз,
+# а дальше — только события:
+#   {"type": "snapshot", "level": L, "version": V, "tables": [...]}
+#   {"type": "table",    "level": L, "version": V, "table": {...}}   — новый стол
+#   {"type": "players",  "level": L, "version": V, "id": T, "players": N}
+# Изменения на других шардах (sharding.py) приходят без событий —
+# подписчикам тогда уходит новый снапшот уровня (refresh()).
+#
+# У каждого уровня своя версия: она растёт с каждым событием. Снапшот
+# уровня кодируется один раз на версию и используется и лентой, и
+# /api/tables (ETag — версия уровня, на совпадение If-None-Match — 304).
+# Трафик лобби растёт с числом изменений, а не с числом клиентов ×
+# частоту опроса.
+#
+# Модуль не знает, откуда берутся столы: tables регистрирует источник
+# через set_source() и сообщает об изменениях через publish().
+
+import secrets
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import orjson
+
+# Версии уровней живут в памяти процесса — ETag прошлого запуска не должен совпасть
+_BOOT = secrets.token_hex(4)
+
+_source: Optional[Callable[[str], List[dict]]] = None
+_versions: Dict[str, int] = {}
+_encoded: Dict[str, Tuple[int, bytes]] = {}
+subscribers: Dict[str, Set] = {}
+lobby_stats = {"events": 0, "messages": 0, "snapshots": 0}
+
+
+def set_source(func: Callable[[str], List[dict]]):
+    """func(level) -> список столов уровня в том виде, в каком их видит клиент."""
+    global _source
+    _source = func
+
+
+def version(level: str) -> int:
+    return _versions.get(level, 0)
+
+
+def etag(level: str) -> str:
+    return f'"{_BOOT}-{level}-{version(level)}"'
+
+
+def tables_json(level: str) -> bytes:
+    """Столы уровня в JSON; пересчитывается только после изменений."""
+    v = version(level)
+    cached = _encoded.get(level)
+    if cached is None or cached[0] != v:
+        cached = _encoded[level] = (v, orjson.dumps(_source(level)))
+    return cached[1]
+
+
+def snapshot_message(level: str) -> str:
+    lobby_stats["snapshots"] += 1
+    return (b'{"type":"snapshot","level":' + orjson.dumps(level)
+            + b',"version":%d,"tables":' % version(level)
+            + tables_json(level) + b"}").decode()
+
+
+def bump(level: str) -> int:
+    """Изменение без события (например, восстановление из снимка при старте)."""
+    v = _versions[level] = version(level) + 1
+    return v
+
+
+def publish(level: str, event: dict):
+    """Новая версия уровня и событие всем подписчикам этого уровня."""
+    v = bump(level)
+    lobby_stats["events"] += 1
+    conns = subscribers.get(level)
+    if not conns:
+        return
+    msg = orjson.dumps({**event, "level": level, "version": v}).decode()
+    for conn in list(conns):
+        if conn.closed:
+            conns.discard(conn)
+        elif conn.backlogged():
+            # Медленный клиент: вместо очереди событий — один свежий снапшот
+            conn.replace_pending(snapshot_message(level))
+        else:
+            conn.push(msg)
+            lobby_stats["messages"] += 1
+
+
+def refresh(level: str):
+    """Столы уровня изменились не событием: новая версия и снапшот всем подписчикам."""
+    bump(level)
+    conns = subscribers.get(level)
+    if not conns:
+        return
+    msg = snapshot_message(level)
+    for conn in list(conns):
+        if conn.closed:
+            conns.discard(conn)
+        else:
+            conn.replace_pending(msg)
+
+
+def subscribe(level: str, conn):
+    subscribers.setdefault(level, set()).add(conn)
+    conn.push(snapshot_message(level))
+
+
+def unsubscribe(level: str, conn):
+    conns = subscribers.get(level)
+    if conns is not None:
+        conns.discard(conn)
+        if not conns:
+            del subscribers[level]
@@ -0,0 +1,167 @@
+# metrics.py
+# Метрики процесса в текстовом формате Prometheus (GET /metrics).
+#
+# Свои простые счётчики, гистограммы и датчики вместо prometheus_client:
+# на горячем пути (ход, рассылка, отправка в сокет) запись — это
+# bisect по границам корзин и пара сложений, без блокировок и аллокаций.
+# Пишут в метрики только из event loop.
+#
+# Датчики (Gauge) не хранят значение, а вычисляют его функцией в момент
+# выдачи /metrics — поддерживать их в актуальном состоянии не нужно.
+
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Границы корзин по умолчанию, секунды: от 50 мкс до 10 с
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List["_Metric"] = []
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+def _labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{v}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class _Metric:
+    __slots__ = ("name", "help", "label", "_children")
+    kind = ""
+
+    def __init__(self, name: str, help: str, label: Optional[str] = None,
+                 register: bool = True):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._children: Dict[str, "_Metric"] = {}
+        if register:
+            _registry.append(self)
+
+    def labels(self, value: str):
+        """Дочерняя метрика для значения метки (создаётся при первом обращении)."""
+        child = self._children.get(value)
+        if child is None:
+            child = self._children[value] = self._child()
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def _samples(self, pairs) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.label is None:
+            lines += self._samples(())
+        else:
+            for value, child in sorted(self._children.items()):
+                lines += child._samples(((self.label, value),))
+        return lines
+
+
+class Counter(_Metric):
+    __slots__ = ("value",)
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, label: Optional[str] = None,
+                 register: bool = True):
+        super().__init__(name, help, label, register)
+        self.value = 0
+
+    def _child(self):
+        return Counter(self.name, self.help, register=False)
+
+    def inc(self, n: int = 1):
+        self.value += n
+
+    def _samples(self, pairs) -> List[str]:
+        return [f"{self.name}_total{_labels(pairs)} {_fmt(self.value)}"]
+
+
+class Gauge(_Metric):
+    __slots__ = ("func",)
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, func: Callable[[], float]):
+        super().__init__(name, help)
+        self.func = func
+
+    def _samples(self, pairs) -> List[str]:
+        return [f"{self.name}{_labels(pairs)} {_fmt(self.func())}"]
+
+
+class Histogram(_Metric):
+    __slots__ = ("bounds", "counts", "sum")
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, label: Optional[str] = None,
+                 buckets: Sequence[float] = LATENCY_BUCKETS, register: bool = True):
+        super().__init__(name, help, label, register)
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)   # последняя — +Inf
+        self.sum = 0.0
+
+    def _child(self):
+        return Histogram(self.name, self.help, buckets=self.bounds, register=False)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def _samples(self, pairs) -> List[str]:
+        lines = []
+        total = 0
+        for bound, n in zip(self.bounds + (float("inf"),), self.counts):
+            total += n
+            lines.append(f"{self.name}_bucket{_labels(pairs + (('le', _fmt(bound)),))} {total}")
+        lines.append(f"{self.name}_sum{_labels(pairs)} {_fmt(self.sum)}")
+        lines.append(f"{self.name}_count{_labels(pairs)} {total}")
+        return lines
+
+
+def timed(hist: Histogram):
+    """Декоратор: длительность вызова функции (или корутины) — в hist."""
+    def deco(func):
+        clock = time.perf_counter
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                t0 = clock()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    hist.observe(clock() - t0)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                t0 = clock()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    hist.observe(clock() - t0)
+        return wrapper
+    return deco
+
+
+def render() -> str:
+    """Все зарегистрированные метрики в текстовом формате Prometheus 0.0.4."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,125 @@
+# profiling.py
+# Профилирование живого сервера по запросу администратора (эндпоинты
+# /admin/* в server.py, доступны только с ADMIN_TOKEN).
+#
+# Профиль снимается заданное число секунд с потока event loop:
+#   - "pstats"    — cProfile, файл открывается pstats / snakeviz;
+#   - "collapsed" — сэмплирующий профилировщик: отдельный поток раз в
+#                   interval секунд читает стек потока цикла; результат —
+#                   строки «f1;f2;f3 N» для flamegraph.pl / speedscope.
+# Одновременно идёт не больше одного профиля. Когда профиль не снимается,
+# ничего не работает: ни хуков, ни потоков.
+#
+# Трассировка стола: для столов из traced_tables точки обработки хода
+# (разбор сообщения, очередь актора, движок, БД, рассылка) пишут
+# интервалы в кольцевой буфер стола. Выключенная трассировка — это одна
+# проверка `table_id in traced_tables` в этих точках.
+
+import asyncio
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Tuple
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+TRACE_SPANS = int(os.getenv("TRACE_SPANS", 2000))
+
+_profiling = False
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+# ---------- Профиль ----------
+async def capture(seconds: float, fmt: str = "pstats", interval: float = 0.005) -> bytes:
+    """Профиль потока event loop за seconds секунд в формате fmt."""
+    global _profiling
+    if _profiling:
+        raise ProfilerBusy("profile already running")
+    if fmt not in ("pstats", "collapsed"):
+        raise ValueError(f"unknown profile format {fmt!r}")
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    _profiling = True
+    try:
+        if fmt == "pstats":
+            return await _capture_cprofile(seconds)
+        return await _capture_samples(seconds, interval)
+    finally:
+        _profiling = False
+
+
+async def _capture_cprofile(seconds: float) -> bytes:
+    # cProfile ставит хук на текущий поток — это и есть поток цикла
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        prof.disable()
+    prof.create_stats()
+    # Тот же формат, что у Profile.dump_stats
+    return marshal.dumps(prof.stats)
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample(thread_id: int, interval: float, stop: threading.Event, stacks: Counter):
+    while not stop.wait(interval):
+        frame = sys._current_frames().get(thread_id)
+        names = []
+        while frame is not None:
+            names.append(_frame_name(frame.f_code))
+            frame = frame.f_back
+        if names:
+            stacks[";".join(reversed(names))] += 1
+
+
+async def _capture_samples(seconds: float, interval: float) -> bytes:
+    stacks: Counter = Counter()
+    stop = threading.Event()
+    sampler = threading.Thread(
+        target=_sample, args=(threading.get_ident(), max(interval, 0.001), stop, stacks),
+        name="profile-sampler", daemon=True,
+    )
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        stop.set()
+        await asyncio.to_thread(sampler.join)
+    return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common()).encode()
+
+
+# ---------- Трассировка столов ----------
+# table_id -> (time.time() начала, интервал, длительность в мс)
+traced_tables: Dict[int, Deque[Tuple[float, str, float]]] = {}
+
+
+def start_trace(table_id: int):
+    traced_tables.setdefault(table_id, deque(maxlen=TRACE_SPANS))
+
+
+def stop_trace(table_id: int) -> List[dict]:
+    return _dump(traced_tables.pop(table_id, ()))
+
+
+def trace_spans(table_id: int) -> List[dict]:
+    return _dump(traced_tables.get(table_id, ()))
+
+
+def span(table_id: int, name: str, seconds: float):
+    """Записывает интервал name длительностью seconds, закончившийся только что."""
+    spans = traced_tables.get(table_id)
+    if spans is not None:
+        spans.append((time.time() - seconds, name, seconds * 1000))
+
+
+def _dump(spans) -> List[dict]:
+    return [{"ts": ts, "span": name, "ms": round(ms, 3)} for ts, name, ms in spans]
@@ -1,41 +1,121 @@
 import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
 import uvicorn
-from fastapi import FastAPI, Query, Depends, HTTPException
+from fastapi import FastAPI, Query, Depends, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 
-from db_utils import init_schema, get_balance_db, set_balance_db
+import lobby
+from db_utils import init_pool, close_pool, init_schema_async
+from balance_cache import balances
 from tables import (
-    list_tables,
+    TABLE_LEVELS,
     create_table,
-    join_table,
     leave_table,
     get_balance,
     get_table_config,
     get_players,
+    list_local_tables,
 )
 from table_manager import TableManager
-from game_ws import router as game_router, broadcast
-from game_engine import game_states
-from auth import require_auth
+from game_ws import (router as game_router, schedule_broadcast, broadcast_metrics,
+                     arm_timers, hold_seats, forget_seat, resume_stats)
+from game_engine import game_states, leave_hand
+from auth import require_auth, require_admin, TelegramUser
+from cards import parse_card
+from equity import equity_async, warm_up, DEFAULT_TIME_BUDGET
+from timers import scheduler
+from hand_log import hand_log
+from snapshots import snapshots
+from table_actor import run_in_table, actor_metrics, close_actors
+from sharding import ShardRouter, claim_shard, lobby_sync, shard_stats, SHARD_COUNT, SHARD_INDEX
+import metrics
+import profiling
 
 app = FastAPI()
 
+# Пул процессов для расчёта эквити (создаётся на старте)
+EQUITY_WORKERS = int(os.getenv("EQUITY_WORKERS", os.cpu_count() or 1))
+equity_pool: Optional[ProcessPoolExecutor] = None
+# Сколько запросов эквити считается одновременно (каждый занимает весь
+# пул); лишние сразу получают 429, а не копятся в очереди пула
+EQUITY_MAX_CONCURRENT = int(os.getenv("EQUITY_MAX_CONCURRENT", EQUITY_WORKERS))
+equity_slots = asyncio.Semaphore(EQUITY_MAX_CONCURRENT)
+EQUITY_REJECTED = metrics.Counter("poker_equity_rejected", "Equity requests refused while the pool was busy")
+
 
 @app.get("/healthz")
 def healthz():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "broadcasts": broadcast_metrics(),
+        "tables": actor_metrics(),
+        "lobby": {**lobby.lobby_stats,
+                  "subscribers": sum(len(s) for s in lobby.subscribers.values())},
+        "resume": resume_stats,
+        "shard": {"index": SHARD_INDEX, "count": SHARD_COUNT, **shard_stats},
+    }
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus (async: датчик задач читает текущий loop)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     """
-    Инициализируем схему balances через db_utils.
+    Поднимаем пул соединений и инициализируем схему balances через db_utils.
     """
-    init_schema()
+    # Один процесс на номер шарда — до того, как открыты журналы шарда
+    claim_shard()
+    init_pool()
+    await init_schema_async()
+    # Догоняем журнал балансов после падения и запускаем групповые коммиты
+    await balances.start()
+    # Журнал раздач: пачками с fsync раз в HAND_LOG_FLUSH_INTERVAL
+    await hand_log.start()
+    # Столы из последнего снимка — до того, как клиенты начнут переподключаться
+    # Их игроки ещё не подключены — места держатся окно переподключения
+    for table_id in await snapshots.start():
+        arm_timers(table_id)
+        hold_seats(table_id)
+    # Общее лобби шардов: свои столы — в хранилище, чужие — оттуда
+    await lobby_sync.start(list_local_tables, TABLE_LEVELS)
+    global equity_pool
+    # spawn, а не fork: форк процесса с работающим event loop небезопасен
+    equity_pool = ProcessPoolExecutor(
+        max_workers=EQUITY_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    # Поднимаем воркеры и строим таблицы заранее, не дожидаясь результата
+    for _ in range(EQUITY_WORKERS):
+        equity_pool.submit(warm_up)
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if equity_pool is not None:
+        equity_pool.shutdown(wait=False, cancel_futures=True)
+    await scheduler.close()
+    await lobby_sync.close()
+    await close_actors()
+    await snapshots.close()
+    await hand_log.close()
+    await balances.close()
+    close_pool()
+
 
+# Запросы к столам других шардов — их владельцам (см. sharding.py)
+app.add_middleware(ShardRouter)
 
-# CORS
+# CORS (снаружи роутера: ответы-редиректы тоже с CORS-заголовками)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -49,14 +129,26 @@ app.include_router(game_router)
 
 # API для игровых столов
 @app.get("/api/tables")
-def get_tables(level: str = Query(...), auth=Depends(require_auth)):
-    """Получить список столов указанного уровня"""
-    all_tables = list_tables()
-    return {"tables": [t for t in all_tables if t["level"] == level]}
+async def get_tables(
+    level: str = Query(...),
+    if_none_match: Optional[str] = Header(None),
+    auth=Depends(require_auth),
+):
+    """
+    Получить список столов указанного уровня. Для клиентов, которые ещё
+    опрашивают, а не слушают /ws/lobby/{level}: ETag — версия уровня,
+    без изменений — 304 без тела.
+    """
+    etag = lobby.etag(level)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    body = b'{"tables":' + lobby.tables_json(level) + b"}"
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @app.post("/api/tables")
-def create_table_endpoint(level: str = Query(...)):
+async def create_table_endpoint(level: str = Query(...)):
     """Создать новый стол"""
     return create_table(level)
 
@@ -64,11 +156,12 @@ def create_table_endpoint(level: str = Query(...)):
 @app.post("/api/join")
 async def join(
     table_id: int = Query(...),
-    user_id: str = Query(...),
     seat: int = Query(...),
     deposit: float = Query(...),
-    auth=Depends(require_auth),
+    user: TelegramUser = Depends(require_auth),
 ):
+    # Садимся только за себя: user_id — из подписи initData
+    user_id = user.user_id
     cfg = get_table_config(table_id)
     if deposit < cfg["min_deposit"] or deposit > cfg["max_deposit"]:
         raise HTTPException(400, "Deposit out of range")
@@ -79,33 +172,107 @@ async def join(
 @app.post("/api/leave")
 async def leave_table_endpoint(
     table_id: int = Query(...),
-    user_id: str = Query(...),
-    auth=Depends(require_auth),
+    user: TelegramUser = Depends(require_auth),
 ):
     """
     Игрок покидает стол — удаляем из памяти, сохраняем баланс, оповещаем WS.
     """
-    result = leave_table(table_id, user_id)
-    # Сохраняем баланс уходящего
-    stacks = game_states.get(table_id, {}).get("stacks", {})
-    if user_id in stacks:
-        set_balance_db(user_id, stacks[user_id])
-    # Оповещаем всех клиентов
-    await broadcast(table_id)
-    return result
+    user_id = user.user_id
+
+    def leave():
+        result = leave_table(table_id, user_id)
+        # Сохраняем баланс уходящего
+        state = game_states.get(table_id)
+        stack = state.stack_of(user_id) if state else None
+        if stack is not None:
+            balances.set(user_id, stack)
+        # Место больше не держим: сокет мог закрыться раньше этого запроса
+        if state is not None and state.unseat(user_id) is not None:
+            # Посреди раздачи: рука сбрасывается, остался один — пот ему
+            leave_hand(table_id, user_id)
+        forget_seat(table_id, user_id)
+        # Оповещаем всех клиентов
+        schedule_broadcast(table_id)
+        arm_timers(table_id)
+        return result
+
+    return await run_in_table(table_id, "leave", leave)
 
 
 @app.get("/api/balance")
-async def api_get_balance(user_id: str = Query(...), auth=Depends(require_auth)):
-    """Возвращает текущий баланс игрока из БД."""
-    bal = get_balance_db(user_id)
+async def api_get_balance(user: TelegramUser = Depends(require_auth)):
+    """Возвращает текущий баланс игрока (из кэша, при промахе — из БД)."""
+    bal = await balances.current(user.user_id)
     return {"balance": bal}
 
 
+@app.get("/api/equity")
+async def api_equity(
+    hands: List[str] = Query(..., description="Карты руки через запятую, например As,Kd"),
+    board: str = Query("", description="Открытые карты борда через запятую"),
+    time_budget: float = Query(DEFAULT_TIME_BUDGET, gt=0),
+    target_error: Optional[float] = Query(None, gt=0),
+    auth=Depends(require_auth),
+):
+    """Вероятности выигрыша/дележа для олл-ина (перебор или Монте-Карло)."""
+    if equity_slots.locked():
+        EQUITY_REJECTED.inc()
+        raise HTTPException(429, "Equity calculator is busy", headers={"Retry-After": "1"})
+    try:
+        hole = [[parse_card(c) for c in h.split(",") if c.strip()] for h in hands]
+        community = [parse_card(c) for c in board.split(",") if c.strip()]
+        async with equity_slots:
+            return await equity_async(
+                equity_pool, EQUITY_WORKERS, hole, community,
+                time_budget=time_budget, target_error=target_error,
+            )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
 @app.get("/api/balance_legacy")
-def get_balance_legacy(table_id: int = Query(...), user_id: str = Query(...)):
+def get_balance_legacy(table_id: int = Query(...), user: TelegramUser = Depends(require_auth)):
     """(Legacy) Получить баланс игрока для старого кода"""
-    return get_balance(table_id, user_id)
+    return get_balance(table_id, user.user_id)
+
+
+# ---------- Администрирование: профиль и трассировка (нужен ADMIN_TOKEN) ----------
+@app.post("/admin/profile")
+async def admin_profile(
+    seconds: float = Query(10.0, gt=0),
+    format: str = Query("pstats", pattern="^(pstats|collapsed)$"),
+    interval: float = Query(0.005, gt=0, description="Шаг сэмплирования для collapsed, с"),
+    admin=Depends(require_admin),
+):
+    """Профиль event loop за seconds секунд: pstats (cProfile) или collapsed-стеки."""
+    try:
+        data = await profiling.capture(seconds, format, interval)
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(409, str(e))
+    name = "profile.pstats" if format == "pstats" else "profile.collapsed.txt"
+    return Response(
+        data,
+        media_type="application/octet-stream" if format == "pstats" else "text/plain",
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
+
+
+@app.post("/admin/trace/{table_id}")
+def admin_trace_start(table_id: int, admin=Depends(require_admin)):
+    """Включает запись интервалов обработки ходов стола."""
+    profiling.start_trace(table_id)
+    return {"status": "tracing", "table_id": table_id}
+
+
+@app.get("/admin/trace/{table_id}")
+def admin_trace_get(table_id: int, admin=Depends(require_admin)):
+    return {"table_id": table_id, "spans": profiling.trace_spans(table_id)}
+
+
+@app.delete("/admin/trace/{table_id}")
+def admin_trace_stop(table_id: int, admin=Depends(require_admin)):
+    """Выключает трассировку и отдаёт накопленное."""
+    return {"table_id": table_id, "spans": profiling.stop_trace(table_id)}
 
 
 # Статика фронтенда
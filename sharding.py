@@ -0,0 +1,307 @@
+# sharding.py
+# Столы разнесены по шардам — процессам uvicorn (отдельным процессам одной
+# машины или машинам Fly). Всё состояние стола живёт в памяти одного шарда,
+# владелец определяется по id: owner(table_id) = (table_id - 1) % SHARD_COUNT.
+# Новые столы шард создаёт только со своими id.
+#
+# Один шард — один процесс со своим номером: SHARD_INDEX в окружении или
+# позиция FLY_MACHINE_ID в SHARD_INSTANCES. `uvicorn --workers N` для
+# шардирования не годится: воркеры получают одно окружение (один номер)
+# и один порт (редирект не попадёт в нужный). Процессы одной машины
+# запускаются отдельно, каждый со своим SHARD_INDEX и портом. При
+# SHARD_COUNT > 1 без явного номера сервер не стартует, а второй процесс
+# с уже занятым номером останавливает блокировка SHARD_LOCK.
+#
+# Маршрутизация — ASGI-прослойка ShardRouter: запрос к чужому столу
+# (путь /ws/game/{id}/..., /ws/watch/{id}, /admin/trace/{id} или параметр
+# table_id) отдаётся шарду-владельцу:
+#   - SHARD_INSTANCES (id машин Fly через запятую) — заголовком
+#     fly-replay: прокси Fly повторяет запрос, включая рукопожатие
+#     WebSocket, на нужной машине; номер шарда — позиция FLY_MACHINE_ID;
+#   - SHARD_URLS (базовые URL шардов через запятую) — редиректом 307.
+#     Браузерный WebSocket редиректы не выполняет, поэтому в лобби у
+#     столов есть url владельца, и страница стола открывается сразу там.
+#
+# Лобби общее: каждый шард раз в LOBBY_SYNC_INTERVAL пишет свои столы в
+# общее хранилище (LOBBY_STORE — файл SQLite, общий для воркеров одной
+# машины) и читает чужие. Изменения на других шардах доходят до
+# подписчиков /ws/lobby снапшотом уровня. Шард, который давно не
+# обновлял свои строки (упал), из лобби пропадает.
+
+import asyncio
+import fcntl
+import logging
+import os
+import re
+import sqlite3
+import time
+import urllib.parse
+from typing import Callable, Dict, Iterable, List, Optional
+
+import orjson
+
+import lobby
+
+log = logging.getLogger(__name__)
+
+SHARD_INSTANCES = [s for s in os.getenv("SHARD_INSTANCES", "").split(",") if s]
+SHARD_URLS = [s.rstrip("/") for s in os.getenv("SHARD_URLS", "").split(",") if s]
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", len(SHARD_INSTANCES) or len(SHARD_URLS) or 1))
+if SHARD_INSTANCES and os.getenv("FLY_MACHINE_ID") in SHARD_INSTANCES:
+    SHARD_INDEX = SHARD_INSTANCES.index(os.getenv("FLY_MACHINE_ID"))
+    SHARD_INDEX_SET = True
+else:
+    SHARD_INDEX = int(os.getenv("SHARD_INDEX", 0))
+    SHARD_INDEX_SET = "SHARD_INDEX" in os.environ
+# Файл блокировки номера шарда на машине (к имени добавляется номер)
+SHARD_LOCK = os.getenv("SHARD_LOCK", "shard.lock")
+
+LOBBY_STORE = os.getenv("LOBBY_STORE", "")
+LOBBY_SYNC_INTERVAL = float(os.getenv("LOBBY_SYNC_INTERVAL", 0.5))
+# Строки шарда, не обновлявшиеся столько секунд, считаются мёртвыми
+LOBBY_STALE = float(os.getenv("LOBBY_STALE", 10))
+
+
+# ---------- Владелец стола ----------
+def owner(table_id: int) -> int:
+    return (table_id - 1) % SHARD_COUNT
+
+
+def is_local(table_id: int) -> bool:
+    return SHARD_COUNT <= 1 or owner(table_id) == SHARD_INDEX
+
+
+def next_table_id(existing: Iterable[int]) -> int:
+    """Следующий свободный id, принадлежащий этому шарду."""
+    table_id = max(existing, default=0) + 1
+    while not is_local(table_id):
+        table_id += 1
+    return table_id
+
+
+def shard_url(table_id: int) -> Optional[str]:
+    """Базовый URL шарда-владельца (только при маршрутизации редиректами)."""
+    return SHARD_URLS[owner(table_id)] if SHARD_URLS else None
+
+
+def local_path(path: str) -> str:
+    """Свой файл журнала или снимка для каждого шарда одной машины."""
+    if not path or SHARD_COUNT <= 1:
+        return path
+    return f"{path}.{SHARD_INDEX}"
+
+
+_lock_file = None
+
+
+def claim_shard():
+    """
+    Проверка на старте: номер шарда задан явно и не занят другим
+    процессом этой машины (иначе два процесса вели бы одни столы и
+    писали в одни журналы). Блокировка держится до выхода процесса.
+    """
+    global _lock_file
+    if SHARD_COUNT <= 1 or _lock_file is not None:
+        return
+    if not SHARD_INDEX_SET:
+        raise RuntimeError(
+            f"SHARD_COUNT={SHARD_COUNT} needs SHARD_INDEX (or FLY_MACHINE_ID listed in "
+            "SHARD_INSTANCES) per process; uvicorn --workers cannot run shards")
+    if not 0 <= SHARD_INDEX < SHARD_COUNT:
+        raise RuntimeError(f"SHARD_INDEX={SHARD_INDEX} is out of range for SHARD_COUNT={SHARD_COUNT}")
+    f = open(local_path(SHARD_LOCK), "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        raise RuntimeError(f"shard {SHARD_INDEX} is already running in another process")
+    _lock_file = f
+
+
+# ---------- Маршрутизация ----------
+_TABLE_PATH = re.compile(r"^/(?:ws/(?:game|watch)|admin/trace)/(\d+)")
+
+
+def _table_of(scope) -> Optional[int]:
+    m = _TABLE_PATH.match(scope["path"])
+    if m:
+        return int(m.group(1))
+    qs = scope.get("query_string", b"")
+    if b"table_id=" not in qs:
+        return None
+    value = urllib.parse.parse_qs(qs.decode("latin-1")).get("table_id")
+    try:
+        return int(value[0]) if value else None
+    except ValueError:
+        return None
+
+
+def _route_headers(scope, table_id: int) -> Optional[List[tuple]]:
+    """Заголовки ответа, отправляющего запрос владельцу; None — маршрутизации нет."""
+    shard = owner(table_id)
+    if SHARD_INSTANCES:
+        return [(b"fly-replay", b"instance=" + SHARD_INSTANCES[shard].encode())]
+    if SHARD_URLS:
+        base = SHARD_URLS[shard]
+        if scope["type"] == "websocket":
+            base = "ws" + base[len("http"):] if base.startswith("http") else base
+        location = base + scope.get("root_path", "") + scope["path"]
+        if scope.get("query_string"):
+            location += "?" + scope["query_string"].decode("latin-1")
+        return [(b"location", location.encode())]
+    return None
+
+
+class ShardRouter:
+    """ASGI-прослойка: запросы к столам других шардов уходят владельцу."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if SHARD_COUNT > 1 and scope["type"] in ("http", "websocket"):
+            table_id = _table_of(scope)
+            if table_id is not None and not is_local(table_id):
+                headers = _route_headers(scope, table_id)
+                if headers is not None:
+                    shard_stats["routed"] += 1
+                    await self._redirect(scope, receive, send, headers)
+                    return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _redirect(scope, receive, send, headers):
+        start = {"status": 307, "headers": headers + [(b"content-length", b"0")]}
+        if scope["type"] == "http":
+            await send({"type": "http.response.start", **start})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await receive()  # websocket.connect
+        # Ответ на рукопожатие обычным HTTP (расширение ASGI). Некоторые версии
+        # uvicorn при этом пишут в лог «returned without completing handshake» —
+        # ответ всё равно уходит как есть.
+        if "websocket.http.response" in scope.get("extensions", {}):
+            await send({"type": "websocket.http.response.start", **start})
+            await send({"type": "websocket.http.response.body", "body": b""})
+        else:
+            await send({"type": "websocket.close", "code": 4307})
+
+
+shard_stats = {"routed": 0, "syncs": 0, "remote_tables": 0}
+
+
+# ---------- Общее лобби ----------
+class SQLiteLobbyStore:
+    """
+    Столы шардов в файле SQLite: строка на (шард, уровень) со списком
+    столов в JSON. Общий файл видят все воркеры машины; сетевое
+    хранилище для нескольких машин реализует те же три метода.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lobby_tables ("
+            " shard INTEGER, level TEXT, tables BLOB, updated REAL,"
+            " PRIMARY KEY (shard, level))"
+        )
+
+    def put(self, shard: int, levels: Dict[str, bytes], now: float):
+        """Перезаписывает столы шарда по уровням и продлевает его строки."""
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO lobby_tables VALUES (?, ?, ?, ?)",
+                [(shard, level, data, now) for level, data in levels.items()],
+            )
+            self._conn.execute("UPDATE lobby_tables SET updated = ? WHERE shard = ?", (now, shard))
+
+    def load(self, exclude_shard: int, since: float) -> List[tuple]:
+        """(уровень, столы JSON) других живых шардов."""
+        return self._conn.execute(
+            "SELECT level, tables FROM lobby_tables WHERE shard != ? AND updated >= ?"
+            " ORDER BY shard", (exclude_shard, since),
+        ).fetchall()
+
+    def drop(self, shard: int):
+        with self._conn:
+            self._conn.execute("DELETE FROM lobby_tables WHERE shard = ?", (shard,))
+
+    def close(self):
+        self._conn.close()
+
+
+class LobbySync:
+    """Фоновая синхронизация лобби этого шарда с общим хранилищем."""
+
+    def __init__(self):
+        self.store: Optional[SQLiteLobbyStore] = None
+        # уровень -> столы других шардов
+        self.remote: Dict[str, List[dict]] = {}
+        self._source: Optional[Callable[[str], List[dict]]] = None
+        self._levels: List[str] = []
+        self._written: Dict[str, bytes] = {}
+        self._seen: Dict[str, bytes] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, source: Callable[[str], List[dict]], levels: Iterable[str]):
+        """source(level) — свои столы уровня. Без LOBBY_STORE лобби остаётся локальным."""
+        if not LOBBY_STORE or SHARD_COUNT <= 1:
+            return
+        self._source = source
+        self._levels = list(levels)
+        self.store = await asyncio.to_thread(SQLiteLobbyStore, LOBBY_STORE)
+        await self.sync()
+        self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(LOBBY_SYNC_INTERVAL)
+            try:
+                await self.sync()
+            except Exception:
+                log.exception("lobby sync failed")
+
+    async def sync(self):
+        # Свои уровни кодируем каждый раз (это дёшево), пишем только изменившиеся;
+        # запись заодно продлевает жизнь строк шарда
+        encoded = {level: orjson.dumps(self._source(level)) for level in self._levels}
+        changed = {k: v for k, v in encoded.items() if self._written.get(k) != v}
+        now = time.time()
+        await asyncio.to_thread(self.store.put, SHARD_INDEX, changed, now)
+        self._written.update(changed)
+
+        rows = await asyncio.to_thread(self.store.load, SHARD_INDEX, now - LOBBY_STALE)
+        by_level: Dict[str, List[bytes]] = {}
+        for level, data in rows:
+            by_level.setdefault(level, []).append(data)
+        for level in set(self._seen) | set(by_level):
+            parts = by_level.get(level, [])
+            key = b"\n".join(parts)
+            if self._seen.get(level, b"") != key:
+                self._seen[level] = key
+                self.remote[level] = [t for data in parts for t in orjson.loads(data)]
+                lobby.refresh(level)
+        shard_stats["syncs"] += 1
+        shard_stats["remote_tables"] = sum(len(t) for t in self.remote.values())
+
+    def remote_tables(self, level: str) -> List[dict]:
+        return self.remote.get(level, [])
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.store is not None:
+            await asyncio.to_thread(self.store.drop, SHARD_INDEX)
+            self.store.close()
+            self.store = None
+
+
+lobby_sync = LobbySync()
@@ -0,0 +1,211 @@
+# snapshots.py
+# Снимки состояния столов для быстрого рестарта: после деплоя или
+# падения раздачи продолжаются с того места, где остановились, и
+# клиенты переподключаются в ту же раздачу.
+#
+# Файл SNAPSHOT_PATH — последовательность записей «u32 длина, u32 crc32,
+# orjson-нагрузка», одна запись — один стол (его уровень, seat_map и
+# GameState.to_snapshot()). Раз в SNAPSHOT_INTERVAL секунд дописываются
+# только столы, которые изменились с прошлого снимка (версия актора
+# стола выросла); при восстановлении для каждого стола берётся последняя
+# запись. Когда файл вырастает в SNAPSHOT_COMPACT_RATIO раз больше живых
+# данных, он переписывается целиком через временный файл.
+#
+# Кодирование идёт в event loop (команды актора не делают await посреди
+# изменения стола, так что каждый стол снимается целым) с уступкой циклу
+# каждые SNAPSHOT_BATCH столов; запись и fsync — в потоке.
+#
+# Соединения не сохраняются: клиенты переподключаются сами.
+
+import asyncio
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Dict, List, Optional
+
+import orjson
+
+import lobby
+import tables
+from game_data import seat_map
+from game_engine import game_states
+from game_state import GameState
+from sharding import local_path
+from table_actor import actors
+
+SNAPSHOT_PATH = local_path(os.getenv("SNAPSHOT_PATH", "tables.snap"))
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", 1.0))
+SNAPSHOT_COMPACT_RATIO = 2
+SNAPSHOT_COMPACT_MIN = 1024 * 1024
+SNAPSHOT_BATCH = 256
+
+log = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("<II")   # длина, crc32
+
+
+def _version(table_id: int) -> int:
+    actor = actors.get(table_id)
+    return actor.version if actor else 0
+
+
+def encode_table(table_id: int, state: GameState, ts: float) -> bytes:
+    meta = tables.TABLES.get(table_id)
+    payload = orjson.dumps({
+        "id": table_id,
+        "ts": ts,
+        "level": meta["level"] if meta else None,
+        "players": seat_map.get(table_id, []),
+        "state": state.to_snapshot(),
+    })
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_snapshot(path: str) -> Dict[int, dict]:
+    """Последняя запись по каждому столу; оборванный хвост отбрасывается."""
+    out: Dict[int, dict] = {}
+    if not path or not os.path.exists(path):
+        return out
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    while pos + _HEADER.size <= len(data):
+        length, crc = _HEADER.unpack_from(data, pos)
+        start = pos + _HEADER.size
+        payload = data[start:start + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            log.warning("%s: torn record at offset %d, ignoring the rest", path, pos)
+            break
+        record = orjson.loads(payload)
+        out[record["id"]] = record
+        pos = start + length
+    return out
+
+
+class SnapshotStore:
+    def __init__(self, path: Optional[str] = SNAPSHOT_PATH,
+                 interval: float = SNAPSHOT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        # Версия актора и размер записи стола на момент последнего снимка
+        self._versions: Dict[int, int] = {}
+        self._sizes: Dict[int, int] = {}
+        self._file = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.written = 0
+        self.compactions = 0
+
+    # ---------- Жизненный цикл ----------
+    async def start(self) -> List[int]:
+        """Восстанавливает столы из файла и запускает снимки; возвращает id столов."""
+        if not self.path:
+            return []
+        restored = self.restore()
+        self._file = open(self.path, "ab")
+        self._task = asyncio.create_task(self._snapshot_loop())
+        return restored
+
+    async def close(self):
+        """
+        Последний снимок — после остановки акторов, когда столы уже не
+        меняются; файл переписывается целиком, чтобы старт читал минимум.
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._file:
+            try:
+                await self.snapshot(full=True)
+            except Exception:
+                log.exception("final snapshot failed")
+            self._file.close()
+            self._file = None
+
+    # ---------- Восстановление ----------
+    def restore(self) -> List[int]:
+        started = time.perf_counter()
+        records = read_snapshot(self.path)
+        now = time.time()
+        for table_id, record in records.items():
+            state = GameState.from_snapshot(record["state"])
+            # Время простоя не засчитываем игроку, чей ход
+            downtime = max(0.0, now - record["ts"])
+            if state.timer_deadline:
+                state.timer_deadline += downtime
+            if state.result_delay_deadline:
+                state.result_delay_deadline += downtime
+            game_states[table_id] = state
+            seat_map[table_id] = record["players"]
+            if record["level"]:
+                tables.register_table(table_id, record["level"])
+                lobby.bump(record["level"])
+            # Восстановленное уже лежит в файле — дописывать его заново незачем
+            self._versions[table_id] = _version(table_id)
+            self._sizes[table_id] = len(orjson.dumps(record)) + _HEADER.size
+        if records:
+            log.warning("restored %d tables from %s in %.1f ms", len(records), self.path,
+                        (time.perf_counter() - started) * 1000)
+        return list(records)
+
+    # ---------- Снимки ----------
+    async def snapshot(self, full: bool = False):
+        """Дописывает изменившиеся столы; full — переписывает файл всеми столами."""
+        async with self._lock:
+            ts = time.time()
+            records = []
+            for i, table_id in enumerate(list(game_states)):
+                if i and i % SNAPSHOT_BATCH == 0:
+                    await asyncio.sleep(0)
+                state = game_states.get(table_id)
+                version = _version(table_id)
+                if state is None or (not full and self._versions.get(table_id) == version):
+                    continue
+                record = encode_table(table_id, state, ts)
+                records.append(record)
+                self._versions[table_id] = version
+                self._sizes[table_id] = len(record)
+            if full:
+                await asyncio.to_thread(self._rewrite, records)
+                self.compactions += 1
+            elif records:
+                await asyncio.to_thread(self._append, records)
+            self.written += len(records)
+
+    def _append(self, records: List[bytes]):
+        self._file.write(b"".join(records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _rewrite(self, records: List[bytes]):
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "ab")
+
+    def _needs_compaction(self) -> bool:
+        size = self._file.tell()
+        return (size > SNAPSHOT_COMPACT_MIN
+                and size > SNAPSHOT_COMPACT_RATIO * sum(self._sizes.values()))
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.snapshot(full=self._needs_compaction())
+            except Exception:
+                log.exception("table snapshot failed")
+
+
+# Общее хранилище снимков процесса
+snapshots = SnapshotStore()
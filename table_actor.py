@@ -0,0 +1,138 @@
+# table_actor.py
+# Актор стола: у каждого стола своя задача и входящая очередь команд
+# (join, leave, action, timeout, restart). Все изменения состояния стола
+# выполняются по очереди в этой задаче, поэтому обработчики WS, HTTP и
+# таймеры не гоняются друг с другом, а разные столы идут независимо и
+# без блокировок.
+#
+# Команда — функция (обычная или корутина) с аргументами; вызывающий
+# получает её результат или исключение через future.
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+from profiling import span, traced_tables
+
+log = logging.getLogger(__name__)
+
+
+class TableActor:
+    __slots__ = ("table_id", "queue", "task", "version", "commands", "max_depth",
+                 "total_latency", "max_latency")
+
+    def __init__(self, table_id: int):
+        self.table_id = table_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        # Растёт после каждой команды: по нему snapshots видит, что стол менялся
+        self.version = 0
+        # Метрики: сколько команд выполнено, пиковая глубина очереди,
+        # время от постановки в очередь до завершения команды
+        self.commands: Dict[str, int] = {}
+        self.max_depth = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        # Невыполненные команды отменяем, чтобы их никто не ждал вечно
+        while not self.queue.empty():
+            self.queue.get_nowait()[3].cancel()
+
+    def submit(self, kind: str, func: Callable, *args) -> asyncio.Future:
+        """Ставит команду в очередь; future завершится её результатом."""
+        if self.task is None or self.task.done():
+            self.start()
+        fut = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((kind, func, args, fut, time.perf_counter()))
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return fut
+
+    async def _run(self):
+        while True:
+            kind, func, args, fut, queued_at = await self.queue.get()
+            traced = self.table_id in traced_tables
+            if traced:
+                started = time.perf_counter()
+                span(self.table_id, "queue", started - queued_at)
+            try:
+                result = func(*args)
+                if asyncio.iscoroutine(result):
+                    result = await result
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+                else:
+                    log.exception("table %s: %s failed", self.table_id, kind)
+            else:
+                if not fut.done():
+                    fut.set_result(result)
+            self.version += 1
+            if traced:
+                span(self.table_id, kind, time.perf_counter() - started)
+            latency = time.perf_counter() - queued_at
+            self.commands[kind] = self.commands.get(kind, 0) + 1
+            self.total_latency += latency
+            if latency > self.max_latency:
+                self.max_latency = latency
+
+
+actors: Dict[int, TableActor] = {}
+
+
+def actor_for(table_id: int) -> TableActor:
+    actor = actors.get(table_id)
+    if actor is None:
+        actor = actors[table_id] = TableActor(table_id)
+    return actor
+
+
+def submit(table_id: int, kind: str, func: Callable, *args) -> asyncio.Future:
+    """Команда без ожидания (таймеры): ошибка не теряется, а пишется в лог."""
+    fut = actor_for(table_id).submit(kind, func, *args)
+    fut.add_done_callback(_log_failure)
+    return fut
+
+
+def _log_failure(fut: asyncio.Future):
+    if not fut.cancelled() and fut.exception() is not None:
+        log.error("table command failed", exc_info=fut.exception())
+
+
+async def run_in_table(table_id: int, kind: str, func: Callable, *args) -> Any:
+    """Выполняет команду в акторе стола и возвращает её результат."""
+    return await actor_for(table_id).submit(kind, func, *args)
+
+
+async def close_actors():
+    for actor in list(actors.values()):
+        await actor.stop()
+    actors.clear()
+
+
+def actor_metrics() -> dict:
+    """Сводка по акторам: глубина очередей и задержка обработки команд."""
+    total = sum(sum(a.commands.values()) for a in actors.values())
+    latency = sum(a.total_latency for a in actors.values())
+    return {
+        "tables": len(actors),
+        "queued": sum(a.queue.qsize() for a in actors.values()),
+        "max_queue_depth": max((a.max_depth for a in actors.values()), default=0),
+        "commands": total,
+        "avg_latency_ms": latency / total * 1000 if total else 0.0,
+        "max_latency_ms": max((a.max_latency for a in actors.values()), default=0.0) * 1000,
+    }
@@ -4,28 +4,32 @@
 import tables
 import game_engine
 import game_ws
+from table_actor import run_in_table
 
 class TableManager:
     @staticmethod
     async def leave(player_id: str, table_id: str, via_ws: bool = False):
         """
-        Универсальный выход игрока со стола.
+        Универсальный выход игрока со стола (в очереди актора стола).
         1) Удаляет игрока из game_states
         2) Вызывает HTTP-логику leave_table для seat_map и сохранения баланса
         3) Рассылает новое состояние через WebSocket всем подключённым
         """
+        return await run_in_table(table_id, "leave", TableManager._leave, player_id, table_id)
+
+    @staticmethod
+    def _leave(player_id: str, table_id: str):
         # 1) Удаляем из game_states
         state = game_engine.game_states.get(table_id)
-        if state is not None:
-            idx = state["player_seats"].pop(player_id, None)
-            if idx is not None and 0 <= idx < len(state["seats"]):
-                state["seats"][idx] = None
+        if state is not None and state.unseat(player_id) is not None:
+            game_engine.leave_hand(table_id, player_id)
 
         # 2) HTTP-логика: seat_map и БД
         tables.leave_table(table_id, player_id)
 
         # 3) Broadcast через WS
-        await game_ws.broadcast(table_id)
+        game_ws.schedule_broadcast(table_id)
+        game_ws.arm_timers(table_id)
         return {"status": "ok"}
 
     @staticmethod
@@ -42,26 +46,14 @@ class TableManager:
                 400,
                 f"Deposit {deposit} not in [{cfg['min_deposit']}, {cfg['max_deposit']}] range",
             )
-        # 1) Добавляем в HTTP-слой (seat_map и БД)
-        tables.join_table(player_id, table_id, deposit, seat_idx)
-        # 2) Обновляем состояние в game_states
-        state = game_engine.game_states.setdefault(
-            table_id,
-            {
-                "seats": [None] * cfg.get("max_players", 6),
-                "player_seats": {},
-                "players": [],
-                "stacks": {},
-            },
+        return await run_in_table(
+            table_id, "join", TableManager._join, player_id, table_id, deposit, seat_idx
         )
-        # Проверяем, что место свободно
-        if state["seats"][seat_idx] is not None:
-            from fastapi import HTTPException
-            raise HTTPException(400, "Seat already taken")
-        state["seats"][seat_idx] = player_id
-        state["player_seats"][player_id] = seat_idx
-        # Инициализируем стек
-        state["stacks"][player_id] = deposit
-        # 3) Рассылаем обновлённый стейт
-        await game_ws.broadcast(table_id)
+
+    @staticmethod
+    async def _join(player_id: str, table_id: int, deposit: int, seat_idx: int):
+        # 1) Добавляем в HTTP-слой (seat_map, место и стек в game_states, баланс)
+        await tables.join_table(player_id, table_id, deposit, seat_idx)
+        # 2) Рассылаем обновлённый стейт
+        game_ws.schedule_broadcast(table_id)
         return {"status": "ok"}
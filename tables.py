@@ -1,8 +1,13 @@
+from typing import Dict, List, Optional
+
 from fastapi import HTTPException
 
+import lobby
+import sharding
 from game_data import seat_map
-from game_engine import game_states
-from db_utils import set_balance_db
+from game_engine import game_states, leave_hand, state_for
+from game_state import GameState
+from balance_cache import balances
 
 # Конфигурация уровней столов
 TABLE_LEVELS = {
@@ -18,55 +23,87 @@ TABLES = {
     3: {"level": "vip"},
 }
 
+# Индекс уровень -> id столов (по порядку создания)
+LEVEL_INDEX: Dict[str, List[int]] = {level: [] for level in TABLE_LEVELS}
+
 # Минимальное число игроков для старта
 MIN_PLAYERS = 2
 
-# Инициализируем состояния для предустановленных столов
-for tid in TABLES.keys():
-    game_states.setdefault(tid, {})
-    seat_map.setdefault(tid, [])
 
+def register_table(table_id: int, level: str):
+    """Заносит стол в TABLES и индекс уровней (создание, восстановление из снимка)."""
+    old = TABLES.get(table_id)
+    if old is not None and table_id in LEVEL_INDEX.get(old["level"], []):
+        LEVEL_INDEX[old["level"]].remove(table_id)
+    TABLES[table_id] = {"level": level}
+    LEVEL_INDEX.setdefault(level, []).append(table_id)
 
-def list_tables() -> list:
-    """Возвращает список всех столов с их параметрами."""
-    out = []
-    for tid, meta in TABLES.items():
-        level = meta["level"]
-        cfg = TABLE_LEVELS[level]
-        out.append(
-            {
-                "id": tid,
-                "level": level,
-                "sb": cfg["sb"],
-                "bb": cfg["bb"],
-                "min_deposit": cfg["min_deposit"],
-                "max_deposit": cfg["max_deposit"],
-                "players": len(seat_map.get(tid, [])),
-            }
-        )
-    return out
 
+# Инициализируем состояния для предустановленных столов (своих для шарда)
+for tid, meta in list(TABLES.items()):
+    if not sharding.is_local(tid):
+        del TABLES[tid]
+        continue
+    register_table(tid, meta["level"])
+    state_for(tid)
+    seat_map.setdefault(tid, [])
 
-def create_table(level: str) -> dict:
-    """Создает новый стол указанного уровня."""
-    if level not in TABLE_LEVELS:
-        raise HTTPException(status_code=400, detail="Invalid level")
-    new_id = max(TABLES.keys(), default=0) + 1
-    TABLES[new_id] = {"level": level}
-    seat_map[new_id] = []
-    game_states[new_id] = {}
+
+def table_info(table_id: int) -> dict:
+    level = TABLES[table_id]["level"]
     cfg = TABLE_LEVELS[level]
     return {
-        "id": new_id,
+        "id": table_id,
         "level": level,
         "sb": cfg["sb"],
         "bb": cfg["bb"],
         "min_deposit": cfg["min_deposit"],
         "max_deposit": cfg["max_deposit"],
-        "players": 0,
+        "players": len(seat_map.get(table_id, [])),
+        **({"url": sharding.shard_url(table_id)} if sharding.SHARD_URLS else {}),
     }
 
 
+def list_local_tables(level: Optional[str] = None) -> list:
+    """Столы этого шарда с их параметрами: все или только уровня level (по индексу)."""
+    ids = LEVEL_INDEX.get(level, []) if level is not None else TABLES.keys()
+    return [table_info(tid) for tid in ids]
+
+
+def list_tables(level: Optional[str] = None) -> list:
+    """Столы всех шардов (чужие — из общего лобби, см. sharding.py)."""
+    local = list_local_tables(level)
+    if sharding.SHARD_COUNT <= 1:
+        return local
+    levels = [level] if level is not None else list(TABLE_LEVELS)
+    remote = [t for lv in levels for t in sharding.lobby_sync.remote_tables(lv)]
+    return sorted(local + remote, key=lambda t: t["id"]) if remote else local
+
+
+lobby.set_source(list_tables)
+
+
+def _players_changed(table_id: int):
+    meta = TABLES.get(table_id)
+    if meta is not None:
+        lobby.publish(meta["level"], {
+            "type": "players", "id": table_id, "players": len(seat_map.get(table_id, [])),
+        })
+
+
+def create_table(level: str) -> dict:
+    """Создает новый стол указанного уровня."""
+    if level not in TABLE_LEVELS:
+        raise HTTPException(status_code=400, detail="Invalid level")
+    new_id = sharding.next_table_id(TABLES.keys())
+    register_table(new_id, level)
+    seat_map[new_id] = []
+    game_states[new_id] = GameState(new_id)
+    info = table_info(new_id)
+    lobby.publish(level, {"type": "table", "table": info})
+    return info
+
+
 def get_table_config(table_id: int) -> dict:
     """Возвращает конфигурацию стола."""
     meta = TABLES.get(table_id)
@@ -78,41 +115,44 @@ def get_table_config(table_id: int) -> dict:
     return cfg
 
 
-def join_table(user_id: str, table_id: int, deposit: float, seat_idx: int) -> dict:
+async def join_table(user_id: str, table_id: int, deposit: float, seat_idx: int) -> dict:
     """Регистрация игрока за столом с указанием депозита и места."""
     cfg = get_table_config(table_id)
     if deposit < cfg["min_deposit"] or deposit > cfg["max_deposit"]:
         raise HTTPException(400, "Deposit out of range")
 
+    state = state_for(table_id)
+
+    if not (0 <= seat_idx < cfg.get("max_players", 6)):
+        raise HTTPException(400, "Invalid seat")
+    seated = state.seats[seat_idx]
+    if seated is not None and seated.uid == user_id:
+        # Место держится за игроком после обрыва сокета — он просто
+        # возвращается: стек и баланс не трогаем
+        return {"status": "ok", "players": seat_map.get(table_id, [])}
+    if seated is not None:
+        raise HTTPException(400, "Seat already taken")
+    # Место ушедшего посреди раздачи занято до её конца: его стек ещё в игре
+    if state.started and state.in_hand >> seat_idx & 1:
+        raise HTTPException(400, "Seat already taken")
+
+    # Только после проверок: отказ не должен ни менять баланс, ни
+    # показывать игрока в лобби
     users = seat_map.setdefault(table_id, [])
-    if user_id in users:
+    seated_before = user_id in users
+    if seated_before:
         users.remove(user_id)
     users.append(user_id)
+    if not seated_before:
+        _players_changed(table_id)
 
     # Сохраняем депозит как баланс игрока
-    set_balance_db(user_id, deposit)
-
-    state = game_states.setdefault(
-        table_id,
-        {
-            "seats": [None] * cfg.get("max_players", 6),
-            "player_seats": {},
-            "players": [],
-            "stacks": {},
-            "usernames": {},
-        },
-    )
+    balances.assign(user_id, deposit)
 
-    if not (0 <= seat_idx < cfg.get("max_players", 6)):
-        raise HTTPException(400, "Invalid seat")
-    if state["seats"][seat_idx] is not None:
-        raise HTTPException(400, "Seat already taken")
-
-    state["seats"][seat_idx] = user_id
-    state["player_seats"][user_id] = seat_idx
-    state["stacks"][user_id] = deposit
-    if user_id not in state["players"]:
-        state["players"].append(user_id)
+    # Пересадка: прежнее место освобождается
+    if state.unseat(user_id) is not None:
+        leave_hand(table_id, user_id)
+    state.sit(user_id, seat_idx, deposit)
 
     return {"status": "ok", "players": users}
 
@@ -125,18 +165,25 @@ def leave_table(table_id: int, user_id: str) -> dict:
     if user_id not in users:
         raise HTTPException(status_code=400, detail="User not at table")
     users.remove(user_id)
-    # Сбрасываем флаг начала игры, если игроков стало меньше минимума
-    if len(users) < MIN_PLAYERS:
-        game_states.get(table_id, {}).pop("started", None)
+    _players_changed(table_id)
     return {"status": "ok", "players": users}
 
 
+def player_disconnected(table_id: int, user_id: str):
+    """Сокет игрока закрылся и место освобождено — в лобби его больше не считаем."""
+    users = seat_map.get(table_id)
+    if users and user_id in users:
+        users.remove(user_id)
+        _players_changed(table_id)
+
+
 def get_balance(table_id: int, user_id: str) -> dict:
     """
     Возвращает баланс (стек) пользователя на столе.
     """
-    stacks = game_states.get(table_id, {}).get("stacks", {})
-    return {"balance": stacks.get(user_id, 0)}
+    state = game_states.get(table_id)
+    stack = state.stack_of(user_id) if state else None
+    return {"balance": stack or 0}
 
 
 def get_players(table_id: int) -> list:
@@ -0,0 +1,102 @@
+# Общие настройки тестов: SQLite в памяти вместо Postgres, токен бота
+# для подписи initData, без журналов и снимков на диске. Окружение
+# задаётся до импорта модулей сервера — они читают его при импорте.
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BOT_TOKEN = "test-bot-token"
+os.environ.update(
+    DATABASE_URL="sqlite:///:memory:",
+    BOT_TOKEN=BOT_TOKEN,
+    TELEGRAM_BOT_TOKEN=BOT_TOKEN,
+    BALANCE_JOURNAL="",
+    HAND_LOG_DIR="",
+    SNAPSHOT_PATH="",
+    EQUITY_WORKERS="1",
+)
+
+import pytest  # noqa: E402
+
+
+def init_data(uid: str, token: str = BOT_TOKEN) -> str:
+    """initData, подписанный как у Telegram WebApp."""
+    fields = {
+        "auth_date": str(int(time.time())),
+        "user": json.dumps({"id": uid, "first_name": f"u{uid}"}),
+    }
+    data_check = "\n".join(sorted(f"{k}={v}" for k, v in fields.items()))
+    secret = hashlib.sha256(token.encode()).digest()
+    fields["hash"] = hmac.new(secret, data_check.encode(), hashlib.sha256).hexdigest()
+    return urllib.parse.urlencode(fields)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Сервер целиком (startup/shutdown) в TestClient — один на все тесты."""
+    from fastapi.testclient import TestClient
+    import server
+
+    os.chdir(ROOT)
+    with TestClient(server.app) as c:
+        yield c
+
+
+@pytest.fixture
+def new_table(client):
+    """Свежий стол уровня low: id."""
+    def make(level: str = "low") -> int:
+        r = client.post("/api/tables", params={"level": level})
+        assert r.status_code == 200
+        return r.json()["id"]
+    return make
+
+
+def ws_url(table_id: int, uid: str, seat: int, **params) -> str:
+    params["initData"] = init_data(uid)
+    return f"/ws/game/{table_id}/{uid}/{seat}?" + urllib.parse.urlencode(params)
+
+
+class TableSocket:
+    """Сокет игрока в тестах: собирает состояние из снапшотов и патчей, как webapp."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.state: dict = {}
+        self.seq = -1
+        self.token = None
+
+    def recv(self) -> dict:
+        msg = self.ws.receive_json()
+        if msg["type"] == "session":
+            self.token = msg["token"]
+        elif msg["type"] == "snapshot":
+            self.state, self.seq = msg["state"], msg["seq"]
+        elif msg["type"] == "patch":
+            self.state.update(msg["set"])
+            self.seq = msg["seq"]
+        return self.state
+
+    def wait(self, check, limit: int = 50) -> dict:
+        """Читает сообщения, пока состояние не удовлетворит check."""
+        for _ in range(limit):
+            if self.state and check(self.state):
+                return self.state
+            self.recv()
+        raise AssertionError(f"state never matched: {self.state}")
+
+    def act(self, uid: str, action: str, amount: int = 0):
+        self.ws.send_json({"action": action, "amount": amount, "user_id": uid})
+
+
+def join(client, table_id: int, uid: str, seat: int, deposit: int = 20):
+    r = client.post("/api/join", params=dict(table_id=table_id, seat=seat, deposit=deposit),
+                    headers={"Authorization": init_data(uid)})
+    assert r.status_code == 200, r.text
@@ -0,0 +1,55 @@
+# /admin/*: без ADMIN_TOKEN эндпоинтов как будто нет, с ним — профиль и трассировка.
+import pstats
+
+import pytest
+
+from conftest import TableSocket, join, ws_url
+
+TOKEN = "test-admin-token"
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", TOKEN)
+    return {"X-Admin-Token": TOKEN}
+
+
+def test_admin_is_hidden_without_token(client):
+    assert client.post("/admin/profile", params={"seconds": 0.1}).status_code == 404
+    assert client.get("/admin/trace/1").status_code == 404
+
+
+def test_admin_needs_the_right_token(client, admin):
+    assert client.post("/admin/trace/1").status_code == 403
+    r = client.post("/admin/trace/1", headers={"X-Admin-Token": "wrong"})
+    assert r.status_code == 403
+
+
+def test_profile_formats(client, admin, tmp_path):
+    r = client.post("/admin/profile", params={"seconds": 0.2, "format": "collapsed"},
+                    headers=admin)
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain")
+    r = client.post("/admin/profile", params={"seconds": 0.2}, headers=admin)
+    assert r.status_code == 200
+    path = tmp_path / "profile.pstats"
+    path.write_bytes(r.content)
+    assert pstats.Stats(str(path)).total_calls > 0
+
+
+def test_trace_records_action_spans(client, new_table, admin):
+    t = new_table()
+    join(client, t, "ad_a", 0)
+    join(client, t, "ad_b", 1)
+    assert client.post(f"/admin/trace/{t}", headers=admin).json()["status"] == "tracing"
+    with client.websocket_connect(ws_url(t, "ad_a", 0)) as wa, \
+            client.websocket_connect(ws_url(t, "ad_b", 1)) as wb:
+        sock = {"ad_a": TableSocket(wa), "ad_b": TableSocket(wb)}
+        st = sock["ad_a"].wait(lambda s: s.get("current_player"))
+        uid = st["current_player"]
+        sock[uid].act(uid, "call")
+        sock["ad_a"].wait(lambda s: s["current_player"] != uid)
+    spans = client.get(f"/admin/trace/{t}", headers=admin).json()["spans"]
+    assert spans
+    stopped = client.delete(f"/admin/trace/{t}", headers=admin).json()["spans"]
+    assert len(stopped) >= len(spans)
+    assert client.get(f"/admin/trace/{t}", headers=admin).json()["spans"] == []
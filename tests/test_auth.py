@@ -0,0 +1,25 @@
+from conftest import init_data
+
+
+def test_join_without_signature_is_rejected(client, new_table):
+    table_id = new_table()
+    r = client.post("/api/join", params={"table_id": table_id, "seat": 0, "deposit": 5})
+    assert r.status_code == 401
+
+
+def test_balance_without_signature_is_rejected(client):
+    assert client.get("/api/balance").status_code == 401
+    assert client.get("/api/balance", headers={"Authorization": "hash=bogus"}).status_code == 401
+
+
+def test_join_acts_as_signed_user_only(client, new_table):
+    table_id = new_table()
+    # user_id в параметрах больше не читается: садится владелец подписи
+    r = client.post("/api/join", headers={"Authorization": init_data("701")},
+                    params={"table_id": table_id, "user_id": "999", "seat": 0, "deposit": 5})
+    assert r.status_code == 200
+    assert r.json()["players"] == ["701"]
+    r = client.post("/api/leave", headers={"Authorization": init_data("701")},
+                    params={"table_id": table_id})
+    assert r.status_code == 200
+    assert r.json()["players"] == []
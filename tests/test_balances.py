@@ -0,0 +1,147 @@
+# Кэш балансов: два шарда над одной БД не теряют изменения друг друга,
+# повтор журнала после падения не применяет сброс дважды.
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from balance_cache import BalanceCache
+from conftest import ROOT
+from db_utils import get_balances, set_balance_db
+
+
+async def _shard(index: int, journal=None) -> BalanceCache:
+    cache = BalanceCache(journal_path=journal, writer=f"test-shard-{index}", shared=True)
+    # Как на старте: seq писателя продолжается с записанного в БД
+    await cache.recover()
+    return cache
+
+
+def test_two_shards_do_not_lose_updates(client):
+    set_balance_db("bal_u1", 1000)
+
+    async def run():
+        a, b = await _shard(0), await _shard(1)
+        # Игрок сидит за столами обоих шардов: оба видят 1000
+        assert await a.get("bal_u1") == 1000
+        assert await b.get("bal_u1") == 1000
+        a.set_many({"bal_u1": 1020})  # выиграл 20 на шарде 0
+        b.set_many({"bal_u1": 990})   # проиграл 10 на шарде 1
+        # До сброса каждый показывает БД плюс своё несброшенное
+        assert await a.current("bal_u1") == 1020
+        await a.flush()
+        assert await b.current("bal_u1") == 1010
+        await b.flush()
+        return await a.current("bal_u1"), await b.current("bal_u1")
+
+    assert asyncio.run(run()) == (1010, 1010)
+    assert get_balances(["bal_u1"]) == {"bal_u1": 1010}
+
+
+def test_assign_overrides_and_later_hands_add(client):
+    set_balance_db("bal_u2", 1000)
+
+    async def run():
+        a, b = await _shard(0), await _shard(1)
+        await b.get("bal_u2")
+        a.assign("bal_u2", 300)      # сел на шарде 0 с депозитом 300
+        await a.flush()
+        b.set_many({"bal_u2": 950})  # раздача на шарде 1 от прежних 1000
+        await b.flush()
+        return await a.current("bal_u2")
+
+    assert asyncio.run(run()) == 250
+
+
+def test_recover_skips_flush_already_in_db(client, tmp_path):
+    journal = str(tmp_path / "journal.log")
+    set_balance_db("bal_u3", 1000)
+
+    async def crash_after_commit():
+        a = BalanceCache(journal_path=journal, writer="test-shard-2", shared=True)
+        await a.start()
+        await a.get("bal_u3")
+        a.set_many({"bal_u3": 1100})
+        # Сброс закоммичен, а журнал не очищен — процесс упал
+        await a.save(a.writer, a._seq, a._assign, a._deltas)
+        a._task.cancel()
+
+    async def restart():
+        a = await _shard(2, journal)
+        return a._seq
+
+    asyncio.run(crash_after_commit())
+    assert asyncio.run(restart()) == 1
+    assert get_balances(["bal_u3"]) == {"bal_u3": 1100}
+
+
+# Процесс сервера в миниатюре: 200 раздач по 8 игрокам, на середине
+# удачный сброс, затем сброс, во время которого процесс убивают —
+# до коммита в БД (before) или после него, пока журнал не очищен (after)
+_PLAY = r"""
+import asyncio, json, random, sys
+import db_utils
+from balance_cache import BalanceCache
+
+stage, journal = sys.argv[1:]
+users = ["k%d" % i for i in range(8)]
+
+async def main():
+    db_utils.init_schema()
+    for u in users:
+        db_utils.set_balance_db(u, 1000)
+    cache = BalanceCache(journal_path=journal, writer="kill", interval=3600)
+    await cache.start()
+    await cache.get_many(users)
+    rnd = random.Random(1)
+    stacks = dict.fromkeys(users, 1000)
+    for hand in range(200):
+        for u in rnd.sample(users, 3):
+            stacks[u] += rnd.randint(-50, 50)
+        cache.set_many(dict(stacks))
+        await asyncio.sleep(0)
+        if hand == 100:
+            await cache.flush()
+    print(json.dumps(stacks), flush=True)
+
+    async def save(*args):
+        if stage == "after":
+            await db_utils.apply_balance_changes_async(*args)
+        print("flushing", flush=True)
+        await asyncio.sleep(60)
+
+    cache.save = save
+    await cache.flush()
+
+asyncio.run(main())
+"""
+
+_RECOVER = r"""
+import asyncio, json, sys
+import db_utils
+from balance_cache import BalanceCache
+
+asyncio.run(BalanceCache(journal_path=sys.argv[1], writer="kill").recover())
+print(json.dumps(db_utils.get_balances(["k%d" % i for i in range(8)])))
+"""
+
+
+@pytest.mark.parametrize("stage", ["before", "after"])
+def test_sigkill_during_flush_loses_nothing(tmp_path, stage):
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'balances.db'}"}
+    journal = str(tmp_path / "balance_journal.log")
+    play = subprocess.Popen([sys.executable, "-c", _PLAY, stage, journal], cwd=ROOT, env=env,
+                            stdout=subprocess.PIPE, text=True)
+    try:
+        expected = json.loads(play.stdout.readline())
+        assert play.stdout.readline().strip() == "flushing"
+    finally:
+        play.send_signal(signal.SIGKILL)
+        play.wait()
+    recovered = subprocess.run([sys.executable, "-c", _RECOVER, journal], cwd=ROOT, env=env,
+                               capture_output=True, text=True, check=True)
+    assert json.loads(recovered.stdout) == expected
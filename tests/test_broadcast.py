@@ -0,0 +1,69 @@
+# Склейка рассылок: серия изменений в одном окне — одна рассылка, и
+# последнее состояние доходит до каждого сокета.
+import asyncio
+import json
+
+import game_engine
+import game_ws
+from game_state import GameState
+
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(json.loads(text))
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+def test_burst_is_coalesced_and_last_state_reaches_everyone():
+    t = 90003
+    uids = ["bc_a", "bc_b", "bc_c"]
+
+    async def run():
+        state = game_engine.game_states[t] = GameState(t)
+        for seat, uid in enumerate(uids):
+            state.sit(uid, seat, 100)
+        await game_engine.start_hand(t, stacks=dict.fromkeys(uids, 100))
+        conns = game_engine.connections[t] = [
+            game_ws.Connection(RecordingWebSocket(), uid, t) for uid in uids]
+        for conn in conns:
+            conn.start()
+        await game_ws.broadcast(t)
+        for conn in conns:
+            await conn.drained()
+        sent = game_ws.broadcast_stats["sent"]
+
+        # Три хода подряд, каждый просит рассылку
+        for _ in range(3):
+            seat = state.current_seat
+            owed = state.current_bet - state.contributions[seat]
+            await game_engine.apply_action(t, state.hand_uids[seat], "call" if owed else "check")
+            game_ws.schedule_broadcast(t)
+        while t in game_ws._pending_broadcasts:
+            await asyncio.sleep(0.005)
+        for conn in conns:
+            await conn.drained()
+            await conn.stop()
+        return state, conns, game_ws.broadcast_stats["sent"] - sent
+
+    try:
+        state, conns, flushed = asyncio.run(run())
+    finally:
+        game_engine.game_states.pop(t, None)
+        game_engine.connections.pop(t, None)
+        game_ws.table_views.pop(t, None)
+
+    assert flushed == 1
+    assert state.community  # три хода закрыли префлоп
+    public = json.loads(json.dumps(game_ws.build_public_payload(state)))
+    for conn in conns:
+        snapshot, *patches = [m for m in conn.ws.sent if m["type"] in ("snapshot", "patch")]
+        assert snapshot["type"] == "snapshot" and len(patches) == 1
+        view = dict(snapshot["state"])
+        view.update(patches[0]["set"])
+        assert patches[0]["seq"] == snapshot["seq"] + 1
+        assert {k: view[k] for k in public} == public
@@ -0,0 +1,81 @@
+# Очередь соединения: зависший клиент отключается по SEND_TIMEOUT, его
+# очередь не растёт, а остальные сокеты стола получают всё без задержки.
+import asyncio
+import json
+
+import game_engine
+import game_ws
+from game_state import GameState
+
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(json.loads(text))
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+class StuckWebSocket:
+    """Клиент перестал читать: отправка не завершается никогда."""
+
+    def __init__(self):
+        self.closed = False
+
+    async def send_text(self, text: str) -> None:
+        await asyncio.Event().wait()
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed = True
+
+
+def test_stuck_socket_is_dropped_without_stalling_others(monkeypatch):
+    monkeypatch.setattr(game_ws, "SEND_TIMEOUT", 0.2)
+    t = 90004
+    updates = 3 * game_ws.SEND_QUEUE_SIZE
+
+    async def run():
+        state = game_engine.game_states[t] = GameState(t)
+        state.sit("ct_a", 0, 100)
+        state.sit("ct_b", 1, 100)
+        stuck = game_ws.Connection(StuckWebSocket(), "ct_a", t)
+        fast = game_ws.Connection(RecordingWebSocket(), "ct_b", t)
+        game_engine.connections[t] = [stuck, fast]
+        stuck.start()
+        fast.start()
+        failures = game_ws.SEND_FAILURES.value
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        longest = 0
+        for _ in range(updates):
+            state.pot += 1
+            game_ws._send_state(t)
+            longest = max(longest, len(stuck.pending))
+            await asyncio.sleep(0)
+        await fast.drained()
+        fast_done = loop.time() - started
+        await asyncio.sleep(game_ws.SEND_TIMEOUT * 2)
+        result = (stuck, fast, longest, fast_done,
+                  game_ws.SEND_FAILURES.value - failures, list(game_engine.connections[t]))
+        await fast.stop()
+        return result
+
+    try:
+        stuck, fast, longest, fast_done, failures, conns = asyncio.run(run())
+    finally:
+        game_engine.game_states.pop(t, None)
+        game_engine.connections.pop(t, None)
+        game_ws.table_views.pop(t, None)
+
+    # Быстрый получил каждое обновление, не дожидаясь таймаута зависшего
+    assert fast_done < game_ws.SEND_TIMEOUT
+    assert [m["type"] for m in fast.ws.sent] == ["snapshot"] + ["patch"] * (updates - 1)
+    assert fast.ws.sent[-1]["set"]["pot"] == updates
+    # Очередь зависшего ограничена: лишнее заменяется одним снапшотом
+    assert longest <= game_ws.SEND_QUEUE_SIZE
+    # По таймауту он отключён и убран со стола
+    assert stuck.closed and stuck.ws.closed and not stuck.pending
+    assert conns == [fast] and failures == 1
@@ -0,0 +1,62 @@
+# Движок раздачи: шоудаун и бюджет памяти GameState.
+import asyncio
+import json
+import subprocess
+import sys
+
+import game_engine
+from cards import parse_card
+from conftest import ROOT
+from game_state import GameState
+
+
+def _cards(*names):
+    return [parse_card(n) for n in names]
+
+
+def test_folded_seat_does_not_win_showdown():
+    t = 90002
+    uids = ["sd_a", "sd_b", "sd_c"]
+
+    async def play():
+        state = game_engine.game_states[t] = GameState(t)
+        for seat, uid in enumerate(uids):
+            state.sit(uid, seat, 100)
+        await game_engine.start_hand(t, stacks=dict.fromkeys(uids, 100))
+        folder = state.current_seat
+        others = [s for s in range(3) if s != folder]
+        # У сбросившего лучшая рука, среди оставшихся короли сильнее дам
+        state.hole[folder] = _cards("As", "Ad")
+        state.hole[others[0]] = _cards("Ks", "Kd")
+        state.hole[others[1]] = _cards("Qs", "Qd")
+        # Колода берётся с конца: сжигание, флоп, сжигание, тёрн, сжигание, ривер
+        state.deck = _cards("4c", "3h", "Js", "3d", "9h", "7d", "2c", "3s")
+        await game_engine.apply_action(t, state.hand_uids[folder], "fold")
+        while state.phase != "result":
+            seat = state.current_seat
+            owed = state.current_bet - state.contributions[seat]
+            await game_engine.apply_action(t, state.hand_uids[seat], "call" if owed else "check")
+        return state.hand_uids[folder], state.hand_uids[others[0]], state
+
+    try:
+        folded, king, state = asyncio.run(play())
+    finally:
+        game_engine.game_states.pop(t, None)
+    assert state.game_over_reason == "showdown"
+    assert state.winner == king
+    assert folded not in state.revealed_hands and len(state.revealed_hands) == 2
+
+
+def test_table_memory_stays_within_budget():
+    # tracemalloc в отдельном процессе: потоки тестового сервера не
+    # должны попадать в замер. Байты зависят от версии Python, поэтому
+    # границы относительные: стол против того же стола словарём (сейчас
+    # ~0.72, до слотов — 1.0), выделения на ход против стола (~0.2, до
+    # слотов — 0.51)
+    code = ("import json, bench.memory as m; m.TABLES = 300; m.HANDS = 10; "
+            "print(json.dumps(m.measure()))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True,
+                         text=True, check=True).stdout
+    measured = json.loads(out.strip().splitlines()[-1])
+    assert measured["table_bytes"] < 0.85 * measured["dict_table_bytes"]
+    assert measured["action_peak_bytes"] < 0.35 * measured["table_bytes"]
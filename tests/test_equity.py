@@ -0,0 +1,63 @@
+# /api/equity: только с подписью и не больше EQUITY_MAX_CONCURRENT расчётов
+# сразу; значения — против известных эквити и точного подсчёта.
+import asyncio
+
+import pytest
+
+import server
+from cards import CARD_STR
+from conftest import init_data
+
+PARAMS = {"hands": ["As,Ad", "Kc,Kd"], "board": "2c,7d,9h,Js,4c"}
+
+
+def test_equity_requires_signature(client):
+    assert client.get("/api/equity", params=PARAMS).status_code == 401
+
+
+def _equity(client, hands, board=""):
+    r = client.get("/api/equity", params={"hands": hands, "board": board},
+                   headers={"Authorization": init_data("eq_1")})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_river_is_exact(client):
+    res = _equity(client, **PARAMS)
+    assert res["exhaustive"] and res["samples"] == 1
+    assert [p["equity"] for p in res["players"]] == [1.0, 0.0]
+    # Оба играют туза с королём с борда: делёж
+    res = _equity(client, ["As,Kd", "Ac,Kh"], "2c,7d,9h,Js,4s")
+    assert [(p["win"], p["tie"], p["equity"]) for p in res["players"]] == [(0, 1, 0.5)] * 2
+
+
+def test_turn_counts_every_river(client):
+    # У королей два аута из 44 оставшихся карт
+    res = _equity(client, ["As,Ad", "Kc,Kd"], "2c,7d,9h,Js")
+    assert res["exhaustive"] and res["samples"] == 44
+    assert res["players"][1]["equity"] == pytest.approx(2 / 44)
+
+
+def test_preflop_aces_against_kings(client):
+    res = _equity(client, ["As,Ad", "Kc,Kd"])
+    assert not res["exhaustive"]
+    aces, kings = (p["equity"] for p in res["players"])
+    assert aces == pytest.approx(0.82, abs=0.01)
+    assert kings == pytest.approx(0.18, abs=0.01)
+
+
+def test_too_many_hands_are_refused(client):
+    # 24 руки оставляют в колоде 4 карты — на борд из пяти докруток нет
+    hands = [CARD_STR[2 * i] + "," + CARD_STR[2 * i + 1] for i in range(24)]
+    r = client.get("/api/equity", params={"hands": hands},
+                   headers={"Authorization": init_data("eq_1")})
+    assert r.status_code == 400
+    assert "At most 23 hands" in r.json()["detail"]
+
+
+def test_equity_busy_is_refused(client, monkeypatch):
+    # Все слоты заняты
+    monkeypatch.setattr(server, "equity_slots", asyncio.Semaphore(0))
+    r = client.get("/api/equity", params=PARAMS, headers={"Authorization": init_data("eq_1")})
+    assert r.status_code == 429
+    assert r.headers["retry-after"] == "1"
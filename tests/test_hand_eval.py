@@ -0,0 +1,80 @@
+# Табличный и пакетный оценщики против простого эталона: лучшая из всех
+# пятёрок, комбинация определяется прямым подсчётом рангов и мастей.
+import random
+from collections import Counter
+from itertools import combinations
+
+import numpy as np
+
+from hand_eval import (HAND_RANKS, _FLUSH_TABLE, evaluate_many, hand_strength,
+                       strength_to_tuple)
+
+SAMPLES = {5: 10_000, 6: 10_000, 7: 10_000}
+
+
+def _five(cards):
+    ranks = sorted((c >> 2) + 2 for c in cards)[::-1]
+    flush = len({c & 3 for c in cards}) == 1
+    uniq = sorted(set(ranks), reverse=True)
+    high = 0
+    if len(uniq) == 5 and uniq[0] - uniq[4] == 4:
+        high = uniq[0]
+    elif uniq == [14, 5, 4, 3, 2]:
+        high = 5
+    groups = sorted(((n, r) for r, n in Counter(ranks).items()), reverse=True)
+    shape = [n for n, _ in groups]
+    by_group = [r for _, r in groups]
+    if high and flush:
+        return HAND_RANKS["straight_flush"], [high]
+    if shape == [4, 1]:
+        return HAND_RANKS["four_of_a_kind"], by_group
+    if shape == [3, 2]:
+        return HAND_RANKS["full_house"], by_group
+    if flush:
+        return HAND_RANKS["flush"], ranks
+    if high:
+        return HAND_RANKS["straight"], [high]
+    if shape == [3, 1, 1]:
+        return HAND_RANKS["three_of_a_kind"], by_group
+    if shape == [2, 2, 1]:
+        return HAND_RANKS["two_pair"], by_group
+    if shape == [2, 1, 1, 1]:
+        return HAND_RANKS["one_pair"], by_group
+    return HAND_RANKS["high_card"], ranks
+
+
+def reference(cards):
+    return max(_five(five) for five in combinations(cards, 5))
+
+
+def _hands(n_cards, count, seed):
+    rnd = random.Random(seed)
+    deck = list(range(52))
+    return [rnd.sample(deck, n_cards) for _ in range(count)]
+
+
+def test_evaluators_match_reference():
+    for n_cards, count in SAMPLES.items():
+        hands = _hands(n_cards, count, n_cards)
+        batch = evaluate_many(np.array(hands)).tolist()
+        for cards, strength in zip(hands, batch):
+            expected = reference(cards)
+            assert strength_to_tuple(hand_strength(cards)) == expected, cards
+            assert strength_to_tuple(strength) == expected, cards
+
+
+def test_flush_table_matches_reference():
+    # Все маски из 5–7 рангов одной масти — полный перебор таблицы флешей
+    for mask in range(1 << 13):
+        ranks = [r for r in range(13) if mask >> r & 1]
+        if 5 <= len(ranks) <= 7:
+            cards = [r * 4 for r in ranks]
+            assert strength_to_tuple(_FLUSH_TABLE[mask]) == reference(cards), ranks
+
+
+def test_evaluate_many_matches_hand_strength():
+    # Выборка побольше: пакетный оценщик против табличного
+    for n_cards, count in SAMPLES.items():
+        hands = _hands(n_cards, count * 10, 100 + n_cards)
+        expected = [hand_strength(h) for h in hands]
+        assert evaluate_many(np.array(hands)).tolist() == expected
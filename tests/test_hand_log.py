@@ -0,0 +1,45 @@
+# Журнал раздач: формат записей и то, что в него попадает.
+import asyncio
+import time
+
+import game_engine
+from game_state import GameState
+from hand_log import ACTION, START, HandLog, decode, encode_start, read_events, segments
+
+
+def test_start_roundtrips_long_uid():
+    uid = "u" * 300
+    seats = [(0, uid, 100), (3, "short", 55.5)]
+    payload = encode_start(7, time.time(), 1, seats, list(range(52)))[8:]
+    ev = decode(payload)
+    assert ev[0] == START and ev[3] == 1 and ev[4] == seats and ev[5] == list(range(52))
+
+
+def test_only_accepted_actions_are_logged(tmp_path, monkeypatch):
+    log = HandLog(directory=str(tmp_path), interval=3600)
+    monkeypatch.setattr(game_engine, "hand_log", log)
+    t = 90001
+
+    async def play():
+        await log.start()
+        state = game_engine.game_states[t] = GameState(t)
+        state.sit("hl_a", 0, 100)
+        state.sit("hl_b", 1, 100)
+        await game_engine.start_hand(t, stacks={"hl_a": 100, "hl_b": 100})
+        uid = state.current_player
+        # Недопустимые: чек при недоставленном блайнде, рейз больше стека, чужой ход,
+        # неизвестное действие
+        await game_engine.apply_action(t, uid, "check")
+        await game_engine.apply_action(t, uid, "raise", 10_000)
+        await game_engine.apply_action(t, "hl_a" if uid == "hl_b" else "hl_b", "call")
+        await game_engine.apply_action(t, uid, "dance")
+        await game_engine.apply_action(t, uid, "call")
+        await log.close()
+
+    try:
+        asyncio.run(play())
+    finally:
+        game_engine.game_states.pop(t, None)
+    events = list(read_events(segments(str(tmp_path))))
+    assert [e[0] for e in events] == [START, ACTION]
+    assert events[1][4] == "call"
@@ -0,0 +1,36 @@
+# Уход из-за стола посреди раздачи: раздача не зависает, пот достаётся
+# оставшемуся, а следующий севший получает новую раздачу.
+import pytest
+
+import game_engine
+from conftest import TableSocket, init_data, join, ws_url
+
+
+@pytest.mark.parametrize("on_turn", [True, False])
+def test_leave_mid_hand_pays_the_pot_and_deals_again(client, new_table, monkeypatch, on_turn):
+    monkeypatch.setattr(game_engine, "RESULT_DELAY", 0.2)
+    t = new_table()
+    a, b, c = (f"lv_{on_turn:d}_{x}" for x in "abc")
+    join(client, t, a, 0)
+    join(client, t, b, 1)
+    with client.websocket_connect(ws_url(t, a, 0)) as wa, \
+            client.websocket_connect(ws_url(t, b, 1)) as wb:
+        sock = {a: TableSocket(wa), b: TableSocket(wb)}
+        st = sock[a].wait(lambda s: s.get("current_player"))
+        current = st["current_player"]
+        leaver = current if on_turn else ({a, b} - {current}).pop()
+        stayer = ({a, b} - {leaver}).pop()
+        gain = st["contributions"][leaver]
+
+        r = client.post("/api/leave", params={"table_id": t},
+                        headers={"Authorization": init_data(leaver)})
+        assert r.status_code == 200
+        st = sock[stayer].wait(lambda s: s["phase"] == "result")
+        assert st["winner"] == stayer
+        assert st["stacks"][stayer] == 20 + gain
+
+        join(client, t, c, 2)
+        with client.websocket_connect(ws_url(t, c, 2)) as wc:
+            st = TableSocket(wc).wait(
+                lambda s: s["started"] and set(s["contributions"]) == {stayer, c})
+            assert st["phase"] == "pre-flop" and st["current_player"] in (stayer, c)
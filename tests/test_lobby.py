@@ -0,0 +1,81 @@
+# Лобби: ETag списка столов, версия уровня на каждом изменении и лента
+# /ws/lobby/{level}.
+import json
+import urllib.parse
+
+import game_ws
+import lobby
+from conftest import init_data, join
+
+LEVEL = "mid"
+
+
+def _tables(client, etag=None):
+    headers = {"Authorization": init_data("lb_watch")}
+    if etag:
+        headers["If-None-Match"] = etag
+    return client.get("/api/tables", params={"level": LEVEL}, headers=headers)
+
+
+def test_unchanged_level_answers_304(client):
+    first = _tables(client)
+    assert first.status_code == 200 and first.headers["etag"]
+    again = _tables(client, first.headers["etag"])
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["etag"] == first.headers["etag"]
+
+
+def test_version_bumps_on_create_join_and_leave(client, new_table):
+    etag = _tables(client).headers["etag"]
+    v = lobby.version(LEVEL)
+
+    t = new_table(LEVEL)
+    assert lobby.version(LEVEL) == v + 1
+    created = _tables(client, etag)
+    assert created.status_code == 200
+    assert t in [row["id"] for row in created.json()["tables"]]
+
+    join(client, t, "lb_a", 0, deposit=100)
+    assert lobby.version(LEVEL) == v + 2
+    joined = _tables(client, created.headers["etag"])
+    assert joined.status_code == 200
+
+    r = client.post("/api/leave", params={"table_id": t},
+                    headers={"Authorization": init_data("lb_a")})
+    assert r.status_code == 200
+    assert lobby.version(LEVEL) == v + 3
+    assert _tables(client, joined.headers["etag"]).status_code == 200
+
+
+def test_backlogged_subscriber_gets_one_snapshot(client):
+    # Писатель не запущен — очередь никто не разбирает
+    conn = game_ws.Connection(None, None)
+    lobby.subscribe(LEVEL, conn)
+    try:
+        for _ in range(game_ws.SEND_QUEUE_SIZE):
+            conn.push("{}")
+        lobby.publish(LEVEL, {"type": "players", "id": 0, "players": 0})
+        assert [json.loads(m)["type"] for m in conn.pending] == ["snapshot"]
+        assert json.loads(conn.pending[0])["version"] == lobby.version(LEVEL)
+    finally:
+        lobby.subscribers[LEVEL].discard(conn)
+
+
+def test_lobby_feed_sends_snapshot_then_events(client, new_table):
+    url = f"/ws/lobby/{LEVEL}?" + urllib.parse.urlencode({"initData": init_data("lb_feed")})
+    with client.websocket_connect(url) as ws:
+        snap = ws.receive_json()
+        assert snap["type"] == "snapshot" and snap["level"] == LEVEL
+        assert snap["version"] == lobby.version(LEVEL)
+        assert snap["tables"] == json.loads(lobby.tables_json(LEVEL))
+
+        t = new_table(LEVEL)
+        created = ws.receive_json()
+        assert created["type"] == "table" and created["table"]["id"] == t
+        assert created["version"] == snap["version"] + 1
+
+        join(client, t, "lb_f", 0, deposit=100)
+        joined = ws.receive_json()
+        assert joined == {"type": "players", "id": t, "players": 1,
+                          "level": LEVEL, "version": snap["version"] + 2}
@@ -0,0 +1,27 @@
+# /metrics: текстовый формат Prometheus с метриками хода, рассылки и сокетов.
+from conftest import TableSocket, join, ws_url
+
+
+def test_metrics_are_prometheus_text(client, new_table):
+    t = new_table()
+    join(client, t, "mt_a", 0)
+    join(client, t, "mt_b", 1)
+    with client.websocket_connect(ws_url(t, "mt_a", 0)) as wa, \
+            client.websocket_connect(ws_url(t, "mt_b", 1)) as wb:
+        sock = {"mt_a": TableSocket(wa), "mt_b": TableSocket(wb)}
+        st = sock["mt_a"].wait(lambda s: s.get("current_player"))
+        uid, seq = st["current_player"], sock["mt_a"].seq
+        sock[uid].act(uid, "fold")
+        sock["mt_a"].wait(lambda s: sock["mt_a"].seq > seq and s["phase"] == "result")
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = r.text.splitlines()
+    assert "# TYPE poker_apply_action_seconds histogram" in lines
+    count = next(line for line in lines if line.startswith("poker_apply_action_seconds_count "))
+    assert int(count.split()[1]) >= 1
+    assert any(line.startswith('poker_apply_action_seconds_bucket{le="+Inf"} ') for line in lines)
+    assert "# TYPE poker_open_websockets gauge" in lines
+    hands = next(line for line in lines if line.startswith("poker_hands_completed_total "))
+    assert int(hands.split()[1]) >= 1
@@ -0,0 +1,160 @@
+# Переподключение игрока: раздача не перезапускается, старый сокет заменяется.
+import asyncio
+import time
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+import game_engine
+import game_ws
+from conftest import TableSocket, join, ws_url
+
+
+def test_reconnect_without_token_keeps_running_hand(client, new_table):
+    t = new_table()
+    join(client, t, "rc_a", 0)
+    join(client, t, "rc_b", 1)
+    with client.websocket_connect(ws_url(t, "rc_a", 0)) as wa:
+        a = TableSocket(wa)
+        with client.websocket_connect(ws_url(t, "rc_b", 1)) as wb:
+            b = TableSocket(wb)
+            st = b.wait(lambda s: s.get("current_player"))
+            # Колл и чек — флоп
+            sock = {"rc_a": a, "rc_b": b}
+            while not st["community"]:
+                uid, seq = st["current_player"], b.seq
+                owed = st["current_bet"] - st["contributions"].get(uid, 0)
+                sock[uid].act(uid, "call" if owed else "check")
+                st = b.wait(lambda s: b.seq > seq and s["current_player"] != uid)
+            community = list(st["community"])
+            assert len(community) == 3
+        # Сокет B оборвался; B возвращается без токена сессии
+        with client.websocket_connect(ws_url(t, "rc_b", 1)) as wb:
+            st = TableSocket(wb).wait(lambda s: "community" in s)
+            assert st["started"] and st["community"] == community
+            assert game_engine.game_states[t].current_round == "flop"
+
+
+def test_reconnect_after_result_waits_for_timer(client, new_table):
+    t = new_table()
+    join(client, t, "rr_a", 0)
+    join(client, t, "rr_b", 1)
+    with client.websocket_connect(ws_url(t, "rr_a", 0)) as wa:
+        a = TableSocket(wa)
+        with client.websocket_connect(ws_url(t, "rr_b", 1)) as wb:
+            b = TableSocket(wb)
+            st = b.wait(lambda s: s.get("current_player"))
+            uid = st["current_player"]
+            {"rr_a": a, "rr_b": b}[uid].act(uid, "fold")
+            b.wait(lambda s: s["phase"] == "result")
+        # Результат раздачи показывается до таймера, а не сбрасывается новой
+        with client.websocket_connect(ws_url(t, "rr_b", 1)) as wb:
+            st = TableSocket(wb).wait(lambda s: "phase" in s)
+            assert st["phase"] == "result"
+
+
+def test_second_socket_replaces_first(client, new_table):
+    t = new_table()
+    join(client, t, "rp_a", 0)
+    with client.websocket_connect(ws_url(t, "rp_a", 0)) as first:
+        TableSocket(first).wait(lambda s: "phase" in s)
+        with client.websocket_connect(ws_url(t, "rp_a", 0)) as second:
+            TableSocket(second).wait(lambda s: "phase" in s)
+            conns = game_engine.connections[t]
+            assert [c.uid for c in conns] == ["rp_a"]
+            with pytest.raises(WebSocketDisconnect) as closed:
+                while True:
+                    first.receive_json()
+            assert closed.value.code == 4409
+
+
+class HungClose:
+    """Сокет, клиент которого не отвечает на закрытие."""
+
+    def __init__(self, ws):
+        self.ws = ws
+
+    async def send_text(self, text: str) -> None:
+        await self.ws.send_text(text)
+
+    async def close(self, code: int = 1000) -> None:
+        await asyncio.Event().wait()
+
+
+def test_replacing_a_hung_socket_does_not_stall_the_table(client, new_table):
+    t = new_table()
+    join(client, t, "rh_a", 0)
+    with client.websocket_connect(ws_url(t, "rh_a", 0)) as first:
+        TableSocket(first).wait(lambda s: "phase" in s)
+        old = game_engine.connections[t][0]
+        old.ws = HungClose(old.ws)
+        t0 = time.monotonic()
+        with client.websocket_connect(ws_url(t, "rh_a", 0)) as second:
+            TableSocket(second).wait(lambda s: "phase" in s)
+            # Закрытие старого сокета ждёт до SEND_TIMEOUT, но не в акторе стола
+            assert time.monotonic() - t0 < game_ws.SEND_TIMEOUT / 2
+            assert game_engine.connections[t][0].ws is not old.ws
+
+
+def _patches_until(view_seq: int, table_id: int):
+    """Ждёт, пока рассылка стола дойдёт до view_seq (сокетов может не быть)."""
+    deadline = time.monotonic() + 5
+    while game_ws.table_views[table_id].seq < view_seq:
+        assert time.monotonic() < deadline, "broadcast never came"
+        time.sleep(0.005)
+
+
+def _drop_then_seat_others(client, t, uid, others):
+    """uid подключается и отваливается; пока его нет, садятся others — по патчу на каждого."""
+    join(client, t, uid, 0)
+    with client.websocket_connect(ws_url(t, uid, 0)) as ws:
+        sock = TableSocket(ws)
+        sock.wait(lambda s: "phase" in s and sock.token)
+        state = dict(sock.state)
+    since = sock.seq
+    for seat, other in enumerate(others, start=1):
+        join(client, t, other, seat)
+        _patches_until(since + seat, t)
+    return sock.token, since, state
+
+
+def test_resume_replays_exactly_the_missed_patches(client, new_table):
+    t = new_table()
+    token, since, state = _drop_then_seat_others(client, t, "rs_a", ["rs_b", "rs_c"])
+    replayed = game_ws.resume_stats["replayed"]
+    with client.websocket_connect(ws_url(t, "rs_a", 0, resume=token, since=since)) as ws:
+        msgs = [ws.receive_json() for _ in range(3)]
+    assert [m["type"] for m in msgs] == ["session", "patch", "patch"]
+    assert [m["seq"] for m in msgs[1:]] == [since + 1, since + 2]
+    assert "hole_cards" in msgs[-1]["set"]
+    for m in msgs[1:]:
+        state.update(m["set"])
+    assert state["seats"][:3] == ["rs_a", "rs_b", "rs_c"]
+    assert game_ws.resume_stats["replayed"] == replayed + 1
+
+
+@pytest.mark.parametrize("case", ["unknown", "expired", "too_old"])
+def test_resume_falls_back_to_snapshot(client, new_table, monkeypatch, case):
+    if case == "too_old":
+        # Буфер стола держит только последний патч
+        monkeypatch.setattr(game_ws, "RESUME_BUFFER", 1)
+    elif case == "expired":
+        monkeypatch.setattr(game_ws, "RECONNECT_GRACE", 0.05)
+    t = new_table()
+    a = f"rf_{case}"
+    token, since, _ = _drop_then_seat_others(client, t, a, [a + "_b", a + "_c"])
+    if case == "unknown":
+        token = "bogus"
+    elif case == "expired":
+        # Окно переподключения истекло: место отдано, токен забыт
+        deadline = time.monotonic() + 5
+        while a in game_engine.game_states[t].seat_of:
+            assert time.monotonic() < deadline, "seat was never released"
+            time.sleep(0.01)
+        join(client, t, a, 0)
+    with client.websocket_connect(ws_url(t, a, 0, resume=token, since=since)) as ws:
+        session, snapshot = ws.receive_json(), ws.receive_json()
+    assert session["type"] == "session" and session["token"] != token
+    assert snapshot["type"] == "snapshot"
+    assert snapshot["seq"] == game_ws.table_views[t].seq
+    assert snapshot["state"]["seats"][0] == a
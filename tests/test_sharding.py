@@ -0,0 +1,130 @@
+# Шарды: номер задаётся явно, один процесс на номер; запросы к чужому
+# столу уходят владельцу; лобби собирает столы всех шардов.
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import orjson
+import pytest
+from starlette.testclient import WebSocketDenialResponse
+
+import lobby
+import sharding
+import tables
+from conftest import ROOT, init_data, ws_url
+
+_CLAIM = "import sharding; sharding.claim_shard(); print('ok', flush=True); input()"
+
+
+def _start(tmp_path, index: str):
+    env = {**os.environ, "SHARD_COUNT": "2", "SHARD_INDEX": index,
+           "SHARD_LOCK": str(tmp_path / "shard.lock")}
+    return subprocess.Popen([sys.executable, "-c", _CLAIM], cwd=ROOT, env=env, text=True,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def test_shards_need_explicit_index(tmp_path):
+    env = {k: v for k, v in os.environ.items() if k != "SHARD_INDEX"}
+    proc = subprocess.run([sys.executable, "-c", _CLAIM], cwd=ROOT, text=True, input="",
+                          capture_output=True,
+                          env={**env, "SHARD_COUNT": "2", "SHARD_LOCK": str(tmp_path / "l")})
+    assert proc.returncode != 0
+    assert "needs SHARD_INDEX" in proc.stderr
+
+
+def test_second_process_with_same_index_fails(tmp_path):
+    first = _start(tmp_path, "1")
+    try:
+        assert first.stdout.readline().strip() == "ok"
+        second = _start(tmp_path, "1")
+        _, err = second.communicate("", timeout=30)
+        assert second.returncode != 0
+        assert "already running" in err
+        other = _start(tmp_path, "0")
+        out, _ = other.communicate("", timeout=30)
+        assert out.strip() == "ok"
+    finally:
+        first.communicate("", timeout=30)
+
+
+# Стол 2 при двух шардах принадлежит шарду 1, стол 1 — этому (шарду 0)
+@pytest.fixture
+def two_shards(monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_COUNT", 2)
+    monkeypatch.setattr(sharding, "SHARD_INSTANCES", [])
+    monkeypatch.setattr(sharding, "SHARD_URLS", ["http://s0:8000", "http://s1:8001"])
+
+
+def test_remote_table_redirects_to_owner(client, two_shards):
+    r = client.get("/api/balance_legacy", params={"table_id": 2}, follow_redirects=False)
+    assert r.status_code == 307
+    assert r.headers["location"] == "http://s1:8001/api/balance_legacy?table_id=2"
+    # Свой стол обрабатывается здесь
+    r = client.get("/api/balance_legacy", params={"table_id": 1},
+                   headers={"Authorization": init_data("sh_a")})
+    assert r.status_code == 200
+
+    url = ws_url(2, "sh_a", 0)
+    with pytest.raises(WebSocketDenialResponse) as denied:
+        with client.websocket_connect(url):
+            pass
+    assert denied.value.status_code == 307
+    assert denied.value.headers["location"] == "ws://s1:8001" + url
+
+
+def test_remote_table_is_replayed_on_fly(client, two_shards, monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_INSTANCES", ["m0", "m1"])
+    monkeypatch.setattr(sharding, "SHARD_URLS", [])
+    r = client.post("/admin/trace/2", follow_redirects=False)
+    assert r.status_code == 307
+    assert r.headers["fly-replay"] == "instance=m1"
+
+
+def test_tables_of_all_shards_are_listed(client, two_shards, monkeypatch, tmp_path):
+    path = str(tmp_path / "lobby.db")
+    monkeypatch.setattr(sharding, "LOBBY_STORE", path)
+    sync = sharding.LobbySync()
+    monkeypatch.setattr(sharding, "lobby_sync", sync)
+    # Шард 1 уже записал свой стол в общее хранилище
+    store = sharding.SQLiteLobbyStore(path)
+    remote = {**tables.table_info(3), "id": 1002, "players": 4}
+    store.put(1, {"vip": orjson.dumps([remote])}, time.time())
+
+    async def run():
+        await sync.start(tables.list_local_tables, tables.TABLE_LEVELS)
+        await sync.close()
+
+    try:
+        asyncio.run(run())
+        assert sync.remote_tables("vip") == [remote]
+        r = client.get("/api/tables", params={"level": "vip"},
+                       headers={"Authorization": init_data("sh_a")})
+        listed = r.json()["tables"]
+        assert remote in listed and 3 in [t["id"] for t in listed]
+        assert [t["id"] for t in listed] == sorted(t["id"] for t in listed)
+    finally:
+        store.close()
+        # Кэш уровня не должен пережить подмену шардов
+        lobby.bump("vip")
+
+
+def test_shard_publishes_its_own_tables(two_shards, monkeypatch, tmp_path):
+    path = str(tmp_path / "lobby.db")
+    monkeypatch.setattr(sharding, "LOBBY_STORE", path)
+    sync = sharding.LobbySync()
+
+    async def run():
+        await sync.start(tables.list_local_tables, tables.TABLE_LEVELS)
+        # Шард 1 видит столы шарда 0, пока тот жив
+        rows = sharding.SQLiteLobbyStore(path).load(1, time.time() - 5)
+        await sync.close()
+        gone = sharding.SQLiteLobbyStore(path).load(1, 0)
+        return rows, gone
+
+    rows, gone = asyncio.run(run())
+    seen = {level: orjson.loads(data) for level, data in rows}
+    assert seen["low"] == tables.list_local_tables("low")
+    # Остановленный шард убирает свои строки
+    assert gone == []
@@ -0,0 +1,123 @@
+# Снимки столов: раздача переживает рестарт целиком, оборванный или битый
+# хвост файла отбрасывается, простой не съедает время на ход.
+import asyncio
+import time
+
+import pytest
+
+import game_engine
+import snapshots
+import tables
+from cards import FULL_DECK
+from game_state import GameState
+
+
+@pytest.fixture
+def store_env(monkeypatch, tmp_path):
+    """Пустые столы процесса для снимков: чужие столы сессии не трогаем."""
+    states, seats = {}, {}
+    monkeypatch.setattr(snapshots, "game_states", states)
+    monkeypatch.setattr(snapshots, "seat_map", seats)
+    monkeypatch.setattr(game_engine, "game_states", states)
+    monkeypatch.setattr(tables, "TABLES", {})
+    monkeypatch.setattr(tables, "LEVEL_INDEX", {})
+    return states, seats, str(tmp_path / "tables.snap")
+
+
+def _mid_hand(table_id: int) -> GameState:
+    """Стол на флопе: блайнды, колл, чек."""
+    state = game_engine.game_states[table_id] = GameState(table_id)
+    state.sit("sn_a", 0, 0, "alice")
+    state.sit("sn_b", 3, 0)
+    asyncio.run(game_engine.start_hand(table_id, deck=FULL_DECK,
+                                       stacks={"sn_a": 50, "sn_b": 70}))
+    for _ in range(2):
+        uid = state.current_player
+        seat = state.seat_of[uid]
+        owed = state.current_bet - state.contributions[seat]
+        game_engine._apply_action(table_id, uid, "call" if owed else "check")
+    assert state.current_round == "flop" and len(state.community) == 3
+    return state
+
+
+def test_mid_hand_table_survives_restart(store_env):
+    states, seats, path = store_env
+    t = 90017
+    state = _mid_hand(t)
+    seats[t] = [0, 3]
+    tables.register_table(t, "low")
+    expected = state.to_snapshot()
+
+    async def snapshot_and_close():
+        store = snapshots.SnapshotStore(path, interval=3600)
+        assert await store.start() == []
+        await store.snapshot()
+        written = store.written
+        await store.close()
+        return written
+
+    assert asyncio.run(snapshot_and_close()) == 1
+
+    # «Рестарт»: процесс пуст, всё берётся из файла
+    states.clear()
+    seats.clear()
+    tables.TABLES.clear()
+    tables.LEVEL_INDEX.clear()
+    assert snapshots.SnapshotStore(path).restore() == [t]
+
+    restored = states[t].to_snapshot()
+    assert abs(restored.pop("timer_deadline") - expected.pop("timer_deadline")) < 1
+    assert restored == expected
+    assert states[t].seats[0].username == "alice"
+    assert seats[t] == [0, 3]
+    assert tables.TABLES[t] == {"level": "low"} and tables.LEVEL_INDEX["low"] == [t]
+
+    # Раздача продолжается с того же места
+    uid = states[t].current_player
+    game_engine._apply_action(t, uid, "check")
+    assert states[t].current_player != uid and states[t].current_round == "flop"
+
+
+@pytest.mark.parametrize("tail", ["torn", "bad_crc"])
+def test_broken_tail_record_is_ignored(store_env, tail):
+    states, _, path = store_env
+    t = 90018
+    state = GameState(t)
+    state.sit("sn_c", 1, 40)
+    state.pot = 1
+    good = snapshots.encode_table(t, state, time.time())
+    state.pot = 2
+    newer = snapshots.encode_table(t, state, time.time())
+    state.pot = 3
+    broken = snapshots.encode_table(t, state, time.time())
+    if tail == "torn":
+        # Процесс упал посреди записи
+        broken = broken[:len(broken) // 2]
+    else:
+        broken = broken[:-2] + b"!!"
+    with open(path, "wb") as f:
+        f.write(good + newer + broken)
+
+    assert snapshots.read_snapshot(path)[t]["state"]["pot"] == 2
+    assert snapshots.SnapshotStore(path).restore() == [t]
+    assert states[t].pot == 2 and states[t].stack_of("sn_c") == 40
+
+
+def test_restore_shifts_deadlines_by_downtime(store_env):
+    states, _, path = store_env
+    t, u = 90019, 90020
+    downtime = 100.0
+    ts = time.time() - downtime
+    on_turn = GameState(t)
+    on_turn.timer_deadline = ts + 20
+    in_result = GameState(u)
+    in_result.result_delay_deadline = ts + 3
+    with open(path, "wb") as f:
+        f.write(snapshots.encode_table(t, on_turn, ts) + snapshots.encode_table(u, in_result, ts))
+
+    now = time.time()
+    snapshots.SnapshotStore(path).restore()
+    # У игрока остались те же 20 секунд на ход, у результата — те же 3
+    assert states[t].timer_deadline == pytest.approx(now + 20, abs=1)
+    assert states[u].result_delay_deadline == pytest.approx(now + 3, abs=1)
+    assert states[t].result_delay_deadline is None and states[u].timer_deadline is None
@@ -0,0 +1,62 @@
+# Зрители: одна лента на стол, карманные карты только рубашкой, ходить нельзя.
+import urllib.parse
+
+import game_engine
+import game_ws
+from conftest import TableSocket, init_data, join, ws_url
+
+
+def watch_url(table_id: int, uid: str) -> str:
+    return f"/ws/watch/{table_id}?" + urllib.parse.urlencode({"initData": init_data(uid)})
+
+
+def _hidden(state: dict) -> bool:
+    return all(cards == [None, None] for cards in state["hole_cards"].values())
+
+
+def test_spectators_share_one_feed_and_see_no_cards(client, new_table):
+    t = new_table()
+    join(client, t, "sp_a", 0)
+    join(client, t, "sp_b", 1)
+    with client.websocket_connect(ws_url(t, "sp_a", 0)) as wa, \
+            client.websocket_connect(ws_url(t, "sp_b", 1)) as wb:
+        a = TableSocket(wa)
+        players = {"sp_a": a, "sp_b": TableSocket(wb)}
+        st = a.wait(lambda s: s.get("current_player"))
+        # Зритель — в том числе сам игрок со второго устройства
+        with client.websocket_connect(watch_url(t, "sp_a")) as w1, \
+                client.websocket_connect(watch_url(t, "sp_watch")) as w2:
+            first = [w1.receive_json(), w2.receive_json()]
+            assert [m["type"] for m in first] == ["snapshot", "snapshot"]
+            assert first[0] == first[1]
+            assert _hidden(first[0]["state"]) and len(first[0]["state"]["hole_cards"]) == 2
+            feed = game_ws.spectator_feeds[t]
+            assert len(feed.conns) == 2
+
+            uid = st["current_player"]
+            owed = st["current_bet"] - st["contributions"][uid]
+            players[uid].act(uid, "call" if owed else "check")
+            patch = [w1.receive_json(), w2.receive_json()]
+            assert patch[0] == patch[1] and patch[0]["type"] == "patch"
+            assert patch[0]["seq"] == first[0]["seq"] + 1
+            assert "hole_cards" not in patch[0]["set"] or _hidden(patch[0]["set"])
+            assert game_ws.spectator_feeds[t] is feed
+    assert t not in game_ws.spectator_feeds
+
+
+def test_spectator_cannot_act(client, new_table):
+    t = new_table()
+    join(client, t, "sa_a", 0)
+    join(client, t, "sa_b", 1)
+    with client.websocket_connect(ws_url(t, "sa_a", 0)) as wa, \
+            client.websocket_connect(ws_url(t, "sa_b", 1)):
+        st = TableSocket(wa).wait(lambda s: s.get("current_player"))
+        uid = st["current_player"]
+        state = game_engine.game_states[t]
+        with client.websocket_connect(watch_url(t, uid)) as w:
+            w.receive_json()
+            # Фолд от имени текущего игрока через сокет зрителя ничего не меняет
+            w.send_json({"action": "fold", "amount": 0, "user_id": uid})
+            w.send_json({"type": "resync"})
+            assert w.receive_json()["type"] == "snapshot"
+        assert state.started and state.current_player == uid and not state.folded
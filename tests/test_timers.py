@@ -0,0 +1,53 @@
+# Дедлайны: планировщик сам по себе и авто-фолд / следующая раздача за столом.
+import asyncio
+import time
+
+import game_engine
+from conftest import TableSocket, join, ws_url
+from timers import TimerScheduler
+
+
+def test_scheduler_fires_in_order_and_skips_replaced():
+    fired = []
+
+    async def run():
+        timers = TimerScheduler()
+        now = time.time()
+        timers.schedule("late", now + 0.06, lambda: fired.append("late"))
+        timers.schedule("moved", now + 0.01, lambda: fired.append("moved-early"))
+        timers.schedule("moved", now + 0.04, lambda: fired.append("moved"))
+        timers.schedule("cancelled", now + 0.02, lambda: fired.append("cancelled"))
+        timers.cancel("cancelled")
+
+        async def coro():
+            fired.append("coroutine")
+        timers.schedule("coro", now + 0.02, coro)
+        await asyncio.sleep(0.15)
+        left = len(timers)
+        await timers.close()
+        return left
+
+    assert asyncio.run(run()) == 0
+    assert fired == ["coroutine", "moved", "late"]
+
+
+def test_expired_decision_folds_and_next_hand_follows(client, new_table, monkeypatch):
+    monkeypatch.setattr(game_engine, "DECISION_TIME", 0.2)
+    monkeypatch.setattr(game_engine, "RESULT_DELAY", 0.2)
+    t = new_table()
+    join(client, t, "tm_a", 0)
+    join(client, t, "tm_b", 1)
+    timeouts = game_engine.DECISION_TIMEOUTS.value
+    with client.websocket_connect(ws_url(t, "tm_a", 0)) as wa, \
+            client.websocket_connect(ws_url(t, "tm_b", 1)):
+        a = TableSocket(wa)
+        st = a.wait(lambda s: s.get("current_player"))
+        # Никто не ходит: ход текущего игрока сгорает фолдом
+        sleeper, dealer = st["current_player"], st["dealer_index"]
+        st = a.wait(lambda s: s["phase"] == "result", limit=200)
+        assert st["winner"] == ({"tm_a", "tm_b"} - {sleeper}).pop()
+        assert game_engine.DECISION_TIMEOUTS.value > timeouts
+        # Через RESULT_DELAY — следующая раздача, дилер сдвинулся
+        st = a.wait(lambda s: s["phase"] == "pre-flop" and s["dealer_index"] != dealer,
+                    limit=200)
+        assert st["started"] and st["winner"] is None
@@ -0,0 +1,132 @@
+# timers.py
+# Единый планировщик дедлайнов всех столов: авто-фолд по истечении
+# времени на ход и старт следующей раздачи после RESULT_DELAY.
+#
+# Вместо отдельной спящей задачи на каждый стол — одна куча
+# (when, seq, key) и одна фоновая задача, которая спит до ближайшего
+# дедлайна. Ключ — (table_id, вид таймера); повторный schedule() с тем
+# же ключом заменяет дедлайн. Заменённые и отменённые записи остаются в
+# куче и пропускаются при извлечении (ленивое удаление); когда их
+# становится слишком много, куча перестраивается.
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+# Перестраиваем кучу, когда мёртвых записей больше, чем живых, в столько раз
+_COMPACT_RATIO = 2
+_COMPACT_MIN = 1024
+
+
+class TimerScheduler:
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._active: Dict[Hashable, Tuple[float, int, Callable[[], Any]]] = {}
+        self._seq = itertools.count()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self.fired = 0
+
+    # ---------- Жизненный цикл ----------
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._heap.clear()
+        self._active.clear()
+
+    # ---------- Дедлайны ----------
+    def schedule(self, key: Hashable, when: float, callback: Callable[[], Any]):
+        """
+        Ставит (или переносит) таймер key на момент when (time.time()).
+        callback вызывается в задаче планировщика; если он вернул
+        корутину, она запускается отдельной задачей.
+        """
+        if self._task is None or self._task.done():
+            self.start()
+        seq = next(self._seq)
+        self._active[key] = (when, seq, callback)
+        heapq.heappush(self._heap, (when, seq, key))
+        if self._heap[0][1] == seq:
+            # Новый дедлайн раньше всех — будим задачу, чтобы пересчитала сон
+            self._wake.set()
+        if (len(self._heap) > _COMPACT_MIN
+                and len(self._heap) > _COMPACT_RATIO * len(self._active)):
+            self._compact()
+
+    def cancel(self, key: Hashable):
+        self._active.pop(key, None)
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        entry = self._active.get(key)
+        return entry[0] if entry else None
+
+    def __len__(self) -> int:
+        return len(self._active)
+
+    def _compact(self):
+        self._heap = [(when, seq, key) for key, (when, seq, _) in self._active.items()]
+        heapq.heapify(self._heap)
+
+    # ---------- Фоновая задача ----------
+    def _fire_due(self) -> Optional[float]:
+        """Запускает наступившие таймеры; возвращает, сколько спать до следующего."""
+        now = time.time()
+        heap = self._heap
+        while heap:
+            when, seq, key = heap[0]
+            entry = self._active.get(key)
+            if entry is None or entry[1] != seq:
+                heapq.heappop(heap)
+                continue
+            if when > now:
+                return when - now
+            heapq.heappop(heap)
+            del self._active[key]
+            self.fired += 1
+            try:
+                result = entry[2]()
+            except Exception:
+                log.exception("timer callback failed")
+                continue
+            if asyncio.iscoroutine(result):
+                task = asyncio.create_task(result)
+                self._running.add(task)
+                task.add_done_callback(self._on_done)
+        return None
+
+    def _on_done(self, task: asyncio.Task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error("timer callback failed", exc_info=task.exception())
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            delay = self._fire_due()
+            try:
+                if delay is None:
+                    await self._wake.wait()
+                else:
+                    async with asyncio.timeout(delay):
+                        await self._wake.wait()
+            except TimeoutError:
+                pass
+
+
+# Общий планировщик процесса
+scheduler = TimerScheduler()
@@ -25,7 +25,7 @@ export async function createTable(level) {
 }
 
 export async function joinTable(tableId, userId) {
-  const url = `${BASE}/api/join?table_id=${tableId}&user_id=${encodeURIComponent(userId)}`;
+  const url = `${BASE}/api/join?table_id=${tableId}`;
   const res = await fetch(url, {
     method: 'POST',
     headers: {
@@ -37,7 +37,7 @@ export async function joinTable(tableId, userId) {
 }
 
 export async function getBalance(userId) {
-  const url = `${BASE}/api/balance?user_id=${encodeURIComponent(userId)}`;
+  const url = `${BASE}/api/balance`;
   const res = await fetch(url, {
     headers: {
       Authorization: window.initData,
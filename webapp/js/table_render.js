@@ -166,7 +166,7 @@ function joinSeat(seatId) {
     return;
   }
   fetch(
-    `/api/join?table_id=${window.currentTableId}&user_id=${window.currentUserId}&seat=${seatId}&deposit=${dep}`,
+    `/api/join?table_id=${window.currentTableId}&seat=${seatId}&deposit=${dep}`,
     { method: 'POST', headers: { Authorization: window.initData } }
   )
     .then(res => {
@@ -35,7 +35,7 @@ setJoinHandler(async seat => {
   }
   try {
     const res = await fetch(
-      `/api/join?table_id=${tableId}&user_id=${userId}&seat=${seat}&deposit=${dep}`,
+      `/api/join?table_id=${tableId}&seat=${seat}&deposit=${dep}`,
       { method: 'POST', headers: { Authorization: window.initData } }
     );
     if (!res.ok) {
@@ -338,8 +338,7 @@ function updateUI(state) {
 }
 
 function connectWs(seat) {
-  ws = createWebSocket(tableId, userId, seat, e => {
-    const state = JSON.parse(e.data);
+  ws = createWebSocket(tableId, userId, seat, state => {
     window.currentTableState = state;
     updateUI(state);
     renderTable(state, userId);
@@ -363,7 +362,7 @@ if (!leaveBtn) {
     // 2) Оповещаем сервер о выходе
     try {
       const res = await fetch(
-        `/api/leave?table_id=${tableId}&user_id=${userId}`,
+        `/api/leave?table_id=${tableId}`,
         { method: 'POST', headers: { Authorization: window.initData } }
       );
       console.log('[ui_game] /api/leave status:', res.status);
@@ -17,7 +17,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
   // ======= Баланс =======
   if (balanceSpan) {
-    fetch(`/api/balance?user_id=${encodeURIComponent(userId)}`, {
+    fetch(`/api/balance`, {
       headers: { Authorization: window.initData },
     })
       .then(res => res.json())
@@ -30,8 +30,56 @@ document.addEventListener('DOMContentLoaded', () => {
       });
   }
 
-  async function loadTables() {
-    infoContainer.textContent = 'Загрузка…';
+  // ======= Столы: лента лобби по WebSocket =======
+  // Сервер шлёт снапшот столов уровня ({type: 'snapshot'}) и дальше
+  // только изменения: новый стол ({type: 'table'}) и число игроков
+  // ({type: 'players'}). Если сокет недоступен — опрос /api/tables;
+  // браузер сам перепроверяет ответ по ETag и получает 304 без тела.
+  const cards = new Map();   // id стола -> элемент счётчика игроков
+  let lobbyWs = null;
+  let pollTimer = null;
+  const POLL_INTERVAL = 5000;
+
+  function renderCard(t) {
+    const card = document.createElement('div');
+    card.className = 'table-card';
+    card.innerHTML = `
+      <h3>Стол ${t.id}</h3>
+      <p>SB/BB: ${t.sb}/${t.bb}</p>
+      <p>Депозит: [${t.min_deposit} – ${t.max_deposit}] | Игроки: <span class="players">${t.players}</span></p>
+      <button class="join-btn">Играть</button>
+    `;
+    card.querySelector('.join-btn').addEventListener('click', () => {
+      const uidParam = encodeURIComponent(userId);
+      const unameParam = encodeURIComponent(username);
+      // При шардировании стол живёт на своём шарде — открываем страницу сразу там
+      window.open(
+        `${t.url || ''}/game.html?table_id=${t.id}&user_id=${uidParam}&username=${unameParam}` +
+          `&min=${t.min_deposit}&max=${t.max_deposit}`,
+        '_blank'
+      );
+    });
+    cards.set(t.id, card.querySelector('.players'));
+    return card;
+  }
+
+  function renderTables(tables) {
+    cards.clear();
+    infoContainer.innerHTML = '';
+    if (!tables || !tables.length) {
+      infoContainer.textContent = 'Нет доступных столов';
+      return;
+    }
+    tables.forEach(t => infoContainer.appendChild(renderCard(t)));
+  }
+
+  function addTable(t) {
+    if (cards.has(t.id)) return;
+    if (!cards.size) infoContainer.innerHTML = '';
+    infoContainer.appendChild(renderCard(t));
+  }
+
+  async function pollTables() {
     try {
       const res = await fetch(
         `/api/tables?level=${encodeURIComponent(levelSelect.value)}`,
@@ -39,38 +87,53 @@ document.addEventListener('DOMContentLoaded', () => {
       );
       if (!res.ok) throw new Error('fetch tables');
       const { tables } = await res.json();
-      infoContainer.innerHTML = '';
-      if (!tables || !tables.length) {
-        infoContainer.textContent = 'Нет доступных столов';
-        return;
-      }
-      tables.forEach(t => {
-        const card = document.createElement('div');
-        card.className = 'table-card';
-        card.innerHTML = `
-          <h3>Стол ${t.id}</h3>
-          <p>SB/BB: ${t.sb}/${t.bb}</p>
-          <p>Депозит: [${t.min_deposit} – ${t.max_deposit}] | Игроки: ${t.players}</p>
-          <button class="join-btn">Играть</button>
-        `;
-        card.querySelector('.join-btn').addEventListener('click', () => {
-          const uidParam = encodeURIComponent(userId);
-          const unameParam = encodeURIComponent(username);
-          window.open(
-            `/game.html?table_id=${t.id}&user_id=${uidParam}&username=${unameParam}` +
-              `&min=${t.min_deposit}&max=${t.max_deposit}`,
-            '_blank'
-          );
-        });
-        infoContainer.appendChild(card);
-      });
+      renderTables(tables);
     } catch (err) {
       console.error(err);
-      alert('Ошибка загрузки столов');
       infoContainer.textContent = 'Ошибка загрузки столов!';
     }
+    pollTimer = setTimeout(pollTables, POLL_INTERVAL);
+  }
+
+  function subscribe() {
+    if (lobbyWs) {
+      lobbyWs.onclose = null;
+      lobbyWs.close();
+      lobbyWs = null;
+    }
+    clearTimeout(pollTimer);
+    infoContainer.textContent = 'Загрузка…';
+
+    const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const ws = new WebSocket(
+      `${protocol}://${window.location.host}` +
+        `/ws/lobby/${encodeURIComponent(levelSelect.value)}` +
+        `?initData=${encodeURIComponent(window.initData)}`
+    );
+    lobbyWs = ws;
+    let gotSnapshot = false;
+
+    ws.onmessage = event => {
+      const msg = JSON.parse(event.data);
+      if (msg.type === 'snapshot') {
+        gotSnapshot = true;
+        renderTables(msg.tables);
+      } else if (msg.type === 'table') {
+        addTable(msg.table);
+      } else if (msg.type === 'players') {
+        const el = cards.get(msg.id);
+        if (el) el.textContent = msg.players;
+      }
+    };
+    ws.onclose = () => {
+      if (lobbyWs !== ws) return;
+      lobbyWs = null;
+      // Лента не открылась — опрашиваем; оборвалась — переподключаемся
+      if (gotSnapshot) setTimeout(subscribe, 1000);
+      else pollTables();
+    };
   }
 
-  levelSelect.addEventListener('change', loadTables);
-  loadTables();
+  levelSelect.addEventListener('change', subscribe);
+  subscribe();
 });
@@ -1,5 +1,3 @@
-import { getGameState } from './api.js';
-
 document.addEventListener('DOMContentLoaded', () => {
   window.initData = window.Telegram?.WebApp?.initData || '';
   if (window.Telegram?.WebApp?.ready) {
@@ -8,40 +6,93 @@ document.addEventListener('DOMContentLoaded', () => {
 });
 
 /**
- * Создаёт и настраивает WebSocket для игры
+ * Создаёт и настраивает WebSocket для игры.
+ * Сервер шлёт полный снапшот ({type: 'snapshot', seq, state}) и затем
+ * патчи ({type: 'patch', seq, set}) только с изменившимися полями.
+ * Патчи накладываются на локальную копию; при разрыве в seq
+ * запрашиваем снапшот заново ({type: 'resync'}).
+ *
+ * При обрыве соединения сервер держит место grace секунд. Клиент
+ * переподключается с токеном сессии ({type: 'session', token, grace})
+ * и последним seq — сервер досылает пропущенные патчи или снапшот.
  * @param {string} tableId
  * @param {string} userId
- * @param {string} username
- * @param {function(MessageEvent):void} onMessage
- * @returns {WebSocket}
+ * @param {number} seat
+ * @param {function(Object):void} onState — получает полное состояние стола
+ * @returns {{readyState: number, send: function(string):void, close: function():void}}
  */
-export function createWebSocket(tableId, userId, seat, onMessage) {
+export function createWebSocket(tableId, userId, seat, onState) {
   const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
-  const url =
+  const baseUrl =
     `${protocol}://${window.location.host}` +
     `/ws/game/${tableId}/${encodeURIComponent(userId)}/${seat}` +
     `?initData=${encodeURIComponent(window.initData)}`;
 
-  const ws = new WebSocket(url);
-
-  ws.onopen = () => console.log('WebSocket connected to', url);
-  ws.onmessage = event => onMessage(event);
-  ws.onclose = e => console.log('WebSocket closed', e);
-  ws.onerror = e => console.error('WebSocket error', e);
+  let ws = null;
+  let state = null;
+  let seq = -1;
+  let awaitingSnapshot = false;
+  let token = null;
+  let grace = 0;
+  let droppedAt = 0;
+  let attempts = 0;
+  let closedByUser = false;
 
-  return ws;
-}
-
-// Fallback-поллинг через HTTP: обновление состояния каждые 2 секунды
-export function startPolling(tableId, userId, onState) {
-  async function poll() {
-    try {
-      const state = await getGameState(tableId);
-      onState({ data: JSON.stringify(state) });
-    } catch (e) {
-      console.error('Poll error', e);
-    }
-    setTimeout(poll, 2000);
+  function open() {
+    const url = token
+      ? `${baseUrl}&resume=${encodeURIComponent(token)}&since=${seq}`
+      : baseUrl;
+    ws = new WebSocket(url);
+    ws.onopen = () => {
+      attempts = 0;
+      droppedAt = 0;
+      console.log('WebSocket connected to', baseUrl, token ? '(resume)' : '');
+    };
+    ws.onmessage = event => {
+      const msg = JSON.parse(event.data);
+      if (msg.type === 'session') {
+        token = msg.token;
+        grace = msg.grace;
+        return;
+      }
+      if (msg.type === 'snapshot') {
+        state = msg.state;
+        seq = msg.seq;
+        awaitingSnapshot = false;
+      } else if (msg.type === 'patch') {
+        if (awaitingSnapshot) return;
+        if (!state || msg.seq !== seq + 1) {
+          console.warn('WS seq gap', seq, '->', msg.seq, '— requesting snapshot');
+          awaitingSnapshot = true;
+          ws.send(JSON.stringify({ type: 'resync' }));
+          return;
+        }
+        Object.assign(state, msg.set);
+        seq = msg.seq;
+      } else {
+        return;
+      }
+      onState({ ...state });
+    };
+    ws.onclose = e => {
+      console.log('WebSocket closed', e);
+      // 4xxx — отказ сервера (подпись, чужое место): переподключение не поможет
+      if (closedByUser || !token || e.code >= 4000) return;
+      if (!droppedAt) droppedAt = Date.now();
+      if (Date.now() - droppedAt > grace * 1000) {
+        console.warn('WebSocket: reconnect window expired');
+        return;
+      }
+      const delay = Math.min(250 * 2 ** attempts++, 4000);
+      setTimeout(open, delay);
+    };
+    ws.onerror = e => console.error('WebSocket error', e);
   }
-  poll();
+
+  open();
+  return {
+    get readyState() { return ws.readyState; },
+    send: data => ws.send(data),
+    close: () => { closedByUser = true; ws.close(); },
+  };
 }